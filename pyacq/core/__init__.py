@@ -9,4 +9,4 @@ from .node import Node, WidgetNode
 from .nodelist import register_node_type
 from .manager import Manager, create_manager
 from .stream import OutputStream, InputStream, SharedArray, RingBuffer
-from .tools import ThreadPollInput, ThreadPollOutput, StreamConverter, ChannelSplitter, ChunkResizer
+from .tools import ThreadPollInput, MultiPoller, ThreadPollOutput, StreamConverter, ChannelSplitter, ChunkResizer
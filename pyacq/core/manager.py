@@ -181,6 +181,18 @@ class Manager(object):
         for ng in self.nodegroups.values():
             ng.stop_all_nodes()
 
+    def stream_stats(self):
+        """Collect the stream statistics of all nodes.
+        
+        Return a dict ``{nodegroup_name: {node_name: stats}}`` where *stats*
+        is the result of :func:`Node.stream_stats`. Streams must be configured
+        with ``latency=True`` for their latency to be measured; in a graph of
+        nodes, the input with the largest latency shows which node (or link)
+        delays the data.
+        """
+        return {name: ng.stream_stats() for name, ng in self.nodegroups.items()
+                if ng not in self._closed_nodegroups}
+
     def close_all_nodegroups(self):
         for ng in self.nodegroups.values():
             if ng in self._closed_nodegroups:
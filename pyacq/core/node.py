@@ -60,6 +60,10 @@ class Node(object):
     _input_specs = {}
     _output_specs = {}
     
+    # attributes that remote proxies may cache (see the cache_attrs proxy
+    # option); _cache_version changes whenever their value may have changed.
+    _cacheable_attrs = ('input', 'inputs', 'output', 'outputs')
+    
     def __init__(self, name='', parent=None):
         self.name = name
         
@@ -68,6 +72,7 @@ class Node(object):
         self._configured = False
         self._initialized = False
         self._closed = False
+        self._cache_version = 0
         
         self.inputs = {name:InputStream(spec=spec, node=self, name=name) for name, spec in self._input_specs.items()}
         self.outputs = {name:OutputStream(spec=spec, node=self, name=name) for name, spec in self._output_specs.items()}
@@ -122,6 +127,34 @@ class Node(object):
         with self.lock:
             return self._closed
     
+    def invalidate_cache(self):
+        """Signal that the cacheable attributes of the Node may have changed.
+        
+        Proxies with the *cache_attrs* option read these attributes again
+        the next time they are requested. This is done by the Node itself
+        when it is configured, initialized, started, stopped or closed, and
+        when one of its streams is configured or connected.
+        
+        This method is thread-safe.
+        """
+        with self.lock:
+            self._cache_version += 1
+    
+    def stream_stats(self):
+        """Return the statistics of all connected inputs and configured
+        outputs of this Node.
+        
+        Returns
+        -------
+        stats: dict
+            ``{'inputs': {name: stats}, 'outputs': {name: stats}}`` with the
+            results of :func:`InputStream.stats` and :func:`OutputStream.stats`.
+        """
+        return {
+            'inputs': {name: inp.stats() for name, inp in self.inputs.items() if inp.connected},
+            'outputs': {name: out.stats() for name, out in self.outputs.items() if out.configured},
+        }
+    
     def configure(self, **kargs):
         """Configure the Node.
         
@@ -134,6 +167,7 @@ class Node(object):
         self._configure(**kargs)
         with self.lock:
             self._configured = True
+            self._cache_version += 1
     
     def initialize(self):
         """Initialize the Node.
@@ -148,6 +182,7 @@ class Node(object):
         self._initialize()
         with self.lock:
             self._initialized = True
+            self._cache_version += 1
 
     def start(self):
         """Start the Node.
@@ -167,6 +202,7 @@ class Node(object):
         self._start()
         with self.lock:
             self._running = True
+            self._cache_version += 1
 
     def stop(self):
         """Stop the Node (see `start()`).
@@ -177,6 +213,7 @@ class Node(object):
         self._stop()
         with self.lock:
             self._running = False
+            self._cache_version += 1
     
     def close(self):
         """Close the Node.
@@ -198,6 +235,7 @@ class Node(object):
             self._configured = False
             self._initialized = False
             self._closed = True
+            self._cache_version += 1
     
     def _configure(self, **kargs):
         """This method is called during `Node.configure()` and must be
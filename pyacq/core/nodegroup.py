@@ -71,6 +71,12 @@ class NodeGroup(object):
             if node.running():
                 node.stop()
 
+    def stream_stats(self):
+        """Return :func:`Node.stream_stats` for all Nodes in this group,
+        in a dict keyed by node name.
+        """
+        return {node.name: node.stream_stats() for node in self.nodes}
+
     def any_node_running(self):
         """Return True if any of the Nodes in this group are running.
         """
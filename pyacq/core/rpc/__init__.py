@@ -2,7 +2,7 @@
 # Copyright (c) 2016, French National Center for Scientific Research (CNRS)
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
-from .client import RPCClient, RemoteCallException, Future
-from .server import RPCServer, QtRPCServer
+from .client import RPCClient, RPCBatch, RemoteCallException, Future
+from .server import RPCServer, QtRPCServer, rpc_threadsafe
 from .proxy import ObjectProxy
 from .processspawner import ProcessSpawner
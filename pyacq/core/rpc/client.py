@@ -16,12 +16,17 @@ from pyqtgraph.Qt import QtGui
 
 from .serializer import all_serializers
 from .proxy import ObjectProxy
-from .server import RPCServer, QtRPCServer
+from .server import RPCServer, QtRPCServer, request_header, response_header, RESPONSE_ERROR, RESPONSE_DISCONNECT
+from .server import actions, return_types
 from . import log
 
 
 logger = logging.getLogger(__name__)
 
+# codes of actions and return types in request headers
+_action_ids = {action: i for i, action in enumerate(actions)}
+_return_type_ids = {rtype: i for i, rtype in enumerate(return_types)}
+
 
 class RPCClient(object):
     """Connection to an :class:`RPCServer`.
@@ -112,9 +117,16 @@ class RPCClient(object):
         # proxies generated by this client will be assigned these default options
         self.default_proxy_options = {}
         
+        # values read by proxies with the cache_attrs option:
+        # {(obj_id, attributes): value}
+        self._value_cache = {}
+        
         self.connect_established = False
         self.establishing_connect = False
         self._disconnected = False
+        
+        # RPCBatch that queues requests (see batch())
+        self._batch = None
 
         # For unserializing results returned from servers. This cannot be
         # used to send proxies of local objects unless there is also a server
@@ -202,6 +214,8 @@ class RPCClient(object):
                                                          | args: a tuple of positional arguments
                                                          | kwargs: a dict of keyword arguments
         get_obj  Return the object referenced by a proxy | obj: a proxy to the object to return
+                                                         | attributes, cache_version: see
+                                                         | :func:`get_cached`
         get_item Return a named object                   | name: string name of the object to return
         set_item Set a named object                      | name: string name to set
                                                          | value: object to assign to name
@@ -209,31 +223,50 @@ class RPCClient(object):
                                                          | ref_id: proxy reference ID
         import   Import and return a proxy to a module   | module: name of module to import
         ping     Return 'pong'                           | 
+        batch    Execute several requests in order and   | requests: list of (action, opts,
+                 return a list of [rval, error] pairs    | return_type)
         ======== ======================================= ==========================================
         
+        While a batch is open (see :func:`batch`), requests are queued and
+        a :class:`Future` is returned whatever the value of *sync*.
         """
         # This is nice, but very expensive!
         #if self.disconnected():
         if self._disconnected:
             raise RuntimeError("Cannot send request; server has already disconnected.")
         
+        if self._batch is not None and action not in ('batch', 'close'):
+            return self._batch._add(action, opts, return_type, sync)
+        
         if sync == 'off':
             req_id = -1
         else:
             req_id = self.next_request_id
             self.next_request_id += 1
-        logger.info("RPC request '%s' to %s [req_id=%s]", action, 
-                    self.address.decode(), req_id)
-        logger.debug("    => sync=%s return=%s opts=%s", sync, return_type, opts)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("RPC request '%s' to %s [req_id=%s]", action, 
+                        self.address.decode(), req_id)
+            logger.debug("    => sync=%s return=%s opts=%s", sync, return_type, opts)
         
+        # large arrays are sent without copy in extra frames
+        buffers = []
         if opts is None:
             opts_str = b''
         else:
-            opts_str = self.serializer.dumps(opts)
-        ser_type = self.serializer.type.encode()
+            opts_str = self.serializer.dumps(opts, buffers)
+        try:
+            header = request_header.pack(req_id, _action_ids[action], _return_type_ids[return_type],
+                                         self.serializer.type_id)
+        except KeyError:
+            raise ValueError("Invalid RPC action '%s' or return type '%s'" % (action, return_type))
         
-        msg = [str(req_id).encode(), action.encode(), return_type.encode(), ser_type, opts_str]
-        self._socket.send_multipart(msg)
+        if len(buffers) == 0:
+            self._socket.send_multipart([header, opts_str])
+        else:
+            # the caller may modify its arrays once this returns, even with
+            # sync='async' or 'off': wait until zmq is done with them
+            tracker = self._socket.send_multipart([header, opts_str] + buffers, copy=False, track=True)
+            tracker.wait()
         
         if sync == 'off':
             return
@@ -282,6 +315,53 @@ class RPCClient(object):
         """
         return self.send('get_obj', opts={'obj': obj}, **kwds)
 
+    def get_cached(self, obj):
+        """Return the value of a remote object, using the values cached by
+        proxies that have the *cache_attrs* option (see
+        :func:`ObjectProxy._set_proxy_options`).
+        
+        Only attributes that have a version stamp on the remote object (see
+        :func:`Node.invalidate_cache`) are cached: the cached stamp is sent
+        to the server, which sends the value again only if the stamp changed.
+        Other values are read from the server each time.
+        
+        Parameters
+        ----------
+        obj : :class:`ObjectProxy`
+            A proxy to an attribute of an object owned by the connected
+            RPCServer.
+        """
+        key = (obj._obj_id, obj._attributes)
+        cached = self._value_cache.get(key)
+        root = ObjectProxy(obj._rpc_addr, obj._obj_id, obj._ref_id, obj._type_str, ())
+        opts = {'obj': root, 'attributes': obj._attributes,
+                'cache_version': None if cached is None else cached[0]}
+        changed, version, value = self.send('get_obj', opts=opts, return_type='value')
+        if not changed:
+            return cached[1]
+        if version is None:
+            # the attribute can change without notice
+            self._value_cache.pop(key, None)
+        else:
+            self._value_cache[key] = (version, value)
+        return value
+
+    def clear_cache(self, obj_id=None):
+        """Forget the values cached by proxies that have the *cache_attrs*
+        option (see :func:`ObjectProxy._set_proxy_options`).
+        
+        Parameters
+        ----------
+        obj_id : int | None
+            If given, only forget the values read from the remote object with
+            this id. By default the whole cache is cleared.
+        """
+        if obj_id is None:
+            self._value_cache.clear()
+        else:
+            for key in [k for k in self._value_cache if k[0] == obj_id]:
+                del self._value_cache[key]
+
     def transfer(self, obj, **kwds):
         """Send an object to the remote process and return a proxy to it.
         
@@ -358,6 +438,38 @@ class RPCClient(object):
         # the transaction is complete.
         return self.send('set_item', opts={'name': name, 'obj': obj}, sync='sync')
 
+    def batch(self, sync='sync', timeout=10.0):
+        """Return a context manager that sends all requests made to this
+        client in a single message.
+        
+        Inside the ``with`` block, requests (method calls on proxies,
+        :func:`call_obj`, :func:`get_obj`, :func:`__setitem__`, etc.) are not
+        sent; they immediately return a :class:`Future`. When the block
+        exits, the requests are sent together, executed in order by the
+        server and all results come back in a single response. The Futures
+        of a batch may be used as arguments (or as the object to call) of
+        later requests of the same batch, where they are replaced by the
+        result of the request::
+        
+            with client.batch():
+                node = ng.create_node('MyNode')
+                fut = client.call_obj(some_proxy.configure, kwargs={'node': node})
+            node = node.result()
+        
+        If a request raises an exception, the next requests of the batch are
+        not executed and their Futures raise RemoteCallException. Deferred
+        attributes of proxies are looked up when the batch is received, so
+        a missing attribute fails the whole batch.
+        
+        Parameters
+        ----------
+        sync : 'sync' | 'async'
+            If 'sync', exiting the block waits for the results of the batch.
+        timeout : float
+            Maximum time to wait for the results in 'sync' mode.
+        """
+        return RPCBatch(self, sync=sync, timeout=timeout)
+
     def ensure_connection(self, timeout=1.0):
         """Make sure RPC server is connected and available.
         """
@@ -452,11 +564,23 @@ class RPCClient(object):
             # NOTE: docs say timeout can only be set before bind, but this
             # seems to work for now.
             self._socket.setsockopt(zmq.RCVTIMEO, timeout)
-            msg = self._socket.recv()
-            msg = self.serializer.loads(msg)
+            header = self._socket.recv()
         except zmq.error.Again:
             raise TimeoutError("Timeout waiting for Future result.")
-        
+        # the other frames of the message are already received
+        data = self._socket.recv()
+        buffers = []
+        while self._socket.getsockopt(zmq.RCVMORE):
+            buffers.append(self._socket.recv(copy=False))
+        
+        req_id, kind = response_header.unpack(header)
+        if kind == RESPONSE_DISCONNECT:
+            msg = {'action': 'disconnect'}
+        else:
+            body = self.serializer.loads(data, buffers)
+            msg = {'action': 'return', 'req_id': req_id,
+                   'rval': None if kind == RESPONSE_ERROR else body,
+                   'error': body if kind == RESPONSE_ERROR else None}
         self.process_msg(msg)
 
     def _read_and_process_all(self):
@@ -473,9 +597,10 @@ class RPCClient(object):
         This takes care of assigning return values or exceptions to existing
         Future instances.
         """
-        logger.debug("RPC recv result from %s [req_id=%s]", self.address.decode(), 
-                     msg.get('req_id', None))
-        logger.debug("    => %s" % msg)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("RPC recv result from %s [req_id=%s]", self.address.decode(), 
+                         msg.get('req_id', None))
+            logger.debug("    => %s", msg)
         if msg['action'] == 'return':
             req_id = msg['req_id']
             fut = self.futures.pop(req_id, None)
@@ -565,6 +690,77 @@ class RPCClient(object):
         
 
 
+class RPCBatch(object):
+    """Queue of requests sent in a single message (see :func:`RPCClient.batch`).
+    """
+    def __init__(self, client, sync='sync', timeout=10.0):
+        assert sync in ('sync', 'async'), "sync must be 'sync' or 'async'"
+        self.client = client
+        self.sync = sync
+        self.timeout = timeout
+        self.requests = []
+        self.futures = []
+        self.future = None
+    
+    def __enter__(self):
+        if self.client._batch is not None:
+            raise RuntimeError("A batch is already open for this client.")
+        self.client._batch = self
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        self.client._batch = None
+        if exc_type is not None:
+            # do not execute anything
+            for fut in self.futures:
+                if fut is not None:
+                    fut.set_exception(RuntimeError("Batch was not sent."))
+            return
+        self.send()
+    
+    def _add(self, action, opts, return_type, sync):
+        index = len(self.requests)
+        self.requests.append((action, opts, return_type))
+        fut = Future(self.client, index)
+        # allows the future to be used as an argument of the next requests
+        fut._batch_index = index
+        # keeps the batch alive until its results are received
+        fut._batch = self
+        self.futures.append(fut)
+        return None if sync == 'off' else fut
+    
+    def send(self):
+        """Send all queued requests.
+        
+        Return the Future of the batch, whose result is the list of
+        [rval, error] pairs.
+        """
+        if len(self.requests) == 0:
+            return None
+        try:
+            self.future = self.client.send('batch', opts={'requests': self.requests}, sync='async')
+        finally:
+            for fut in self.futures:
+                fut._batch_index = None
+        self.future.add_done_callback(self._batch_returned)
+        if self.sync == 'sync':
+            self.future.result(timeout=self.timeout)
+        return self.future
+    
+    def _batch_returned(self, future):
+        try:
+            replies = future.result()
+        except Exception as exc:
+            for fut in self.futures:
+                fut.set_exception(exc)
+            return
+        for fut, (rval, error) in zip(self.futures, replies):
+            if error is not None:
+                fut.set_exception(RemoteCallException(*error))
+            else:
+                fut.set_result(rval)
+
+
 class RemoteCallException(Exception):
     def __init__(self, type_str, tb_str):
         self.type_str = type_str
@@ -594,6 +790,8 @@ class Future(concurrent.futures.Future):
         concurrent.futures.Future.__init__(self)
         self.client = client
         self.call_id = call_id
+        # index of the request in a batch that is not sent yet (see RPCBatch)
+        self._batch_index = None
     
     def cancel(self):
         return False
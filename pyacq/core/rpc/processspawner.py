@@ -48,6 +48,9 @@ class ProcessSpawner(object):
         process.
     executable : str | None
         Optional python executable to invoke. The default value is `sys.executable`.
+    max_workers : int | None
+        If given, the RPCServer of the new process executes thread-safe calls
+        in a pool of *max_workers* threads (see :class:`RPCServer`).
         
     Examples
     --------
@@ -66,7 +69,7 @@ class ProcessSpawner(object):
         proc.wait()
     """
     def __init__(self, name=None, address="tcp://127.0.0.1:*", qt=False, log_addr=None, 
-                 log_level=None, executable=None):
+                 log_level=None, executable=None, max_workers=None):
         #logger.warn("Spawning process: %s %s %s", name, log_addr, log_level)
         assert qt in (True, False)
         assert isinstance(address, (str, bytes))
@@ -92,6 +95,8 @@ class ProcessSpawner(object):
         # Spawn new process
         class_name = 'QtRPCServer' if qt else 'RPCServer'
         args = {'address': address}
+        if max_workers is not None:
+            args['max_workers'] = max_workers
         bootstrap_conf = dict(
             class_name=class_name, 
             args=args,
@@ -3,6 +3,7 @@
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
 import os
+import copy
 import weakref
 
 
@@ -110,6 +111,7 @@ class ObjectProxy(object):
             'defer_getattr': True,   ## True, False
             'no_proxy_types': [type(None), str, int, float, tuple, list, dict, ObjectProxy],
             'auto_delete': False,
+            'cache_attrs': False,
         }
         
         self._set_proxy_options(**kwds)
@@ -193,6 +195,16 @@ class ObjectProxy(object):
         auto_delete : bool
             If True, then the proxy will automatically call
             `self._delete()` when it is collected by Python.
+        cache_attrs : bool
+            If True, values returned by :func:`_get_value()` are cached by the
+            client (see :func:`RPCClient.get_cached()`), so that reading the
+            same attribute again (for example
+            ``node.output.params._get_value()``) does not transfer it again.
+            Only attributes that the remote object declares as cacheable,
+            such as the inputs and outputs of a :class:`Node`, are cached.
+            They have a version stamp that the server checks on each read,
+            so changes made by any client or by the remote process itself
+            are seen. Other attributes are read again each time.
         """
         for k in kwds:
             if k not in self._proxy_options:
@@ -223,10 +235,15 @@ class ObjectProxy(object):
         
         If the object is not serializable, then raise an exception.
         """
-        if self._client() is None:
+        client = self._client()
+        if client is None:
             return self._server().unwrap_proxy(self)
-        else:
-            return self._client().get_obj(self, return_type='value')
+        if not self._proxy_options['cache_attrs'] or client._batch is not None:
+            # in a batch, get_obj returns a Future that must not be cached
+            return client.get_obj(self, return_type='value')
+        value = client.get_cached(self)
+        # the caller may modify the value it receives
+        return copy.deepcopy(value)
         
     def __repr__(self):
         orep = '.'.join((self._type_str,) + self._attributes)
@@ -249,6 +266,8 @@ class ObjectProxy(object):
         that its reference count will be reduced. Any copies of this proxy will
         no longer be usable.
         """
+        if self._proxy_options['cache_attrs']:
+            self._client().clear_cache(self._obj_id)
         self._client().delete(self, sync=sync, **kwds)
         
     def __del__(self):
@@ -6,6 +6,8 @@ import numpy as np
 import datetime
 import base64
 import json
+import functools
+import concurrent.futures
 try:
     import msgpack
     HAVE_MSGPACK = True
@@ -24,6 +26,52 @@ all_serializers = {}  # type_str: class
 encode_key = '___type_name___'
 
 
+class _ArrayInterface:
+    # exposes a memory region through the numpy array interface
+    def __init__(self, interface, base):
+        self.__array_interface__ = interface
+        self.base = base
+
+
+def _array_buffer(arr):
+    """Return a uint8 array that spans the memory of *arr* without copy, or
+    None if the array is not contiguous.
+    
+    C-contiguous arrays are returned as-is. Fortran-contiguous arrays return
+    their memory region. Other arrays would send the memory between their
+    items, which may hold unrelated data.
+    """
+    if arr.flags['C_CONTIGUOUS']:
+        return arr
+    if not arr.flags['F_CONTIGUOUS'] or arr.dtype.hasobject:
+        return None
+    interface = {
+        'data': (arr.__array_interface__['data'][0], not arr.flags['WRITEABLE']),
+        'shape': (arr.nbytes,),
+        'typestr': '|u1',
+        'version': 3,
+    }
+    return np.asarray(_ArrayInterface(interface, arr))
+
+
+class BatchRef:
+    """Reference to the result of a previous request of the same batch (see
+    :func:`RPCClient.batch`); replaced by the result when the server executes
+    the request.
+    """
+    def __init__(self, index):
+        self.index = index
+
+
+def _decode_dtype(dt):
+    if dt.startswith('['):
+        #small hack to have a list
+        d = {}
+        exec('dtype='+dt, None, d)
+        dt = d['dtype']
+    return dt
+
+
 class Serializer:
     """Base serializer class on which msgpack and json serializers 
     (and potentially others) are built.
@@ -37,7 +85,20 @@ class Serializer:
     
     Note that tuples are converted to lists in transit. See:
     https://github.com/msgpack/msgpack-python/issues/98
+    
+    When a list of *buffers* is given to :func:`dumps`, ndarrays of at least
+    *frame_threshold* bytes are not copied into the message: their memory is
+    appended to *buffers* so that it can be sent as separate zmq frames
+    without copy, and the message only references it. Fortran-contiguous
+    arrays are sent with their strides; other non-contiguous arrays are
+    copied. The same list of buffers (or of zmq frames) must be given to
+    :func:`loads`, which returns arrays that use this memory without copy.
+    Arrays must not be modified until they are sent: RPCClient and RPCServer
+    wait until zmq has sent the buffers before they return.
     """
+    #: minimum size (in bytes) of arrays that are sent as separate frames
+    frame_threshold = 16384
+    
     def __init__(self, server=None, client=None):
         self._server = server
         self.client = client
@@ -50,26 +111,61 @@ class Serializer:
             self._server = RPCServer.get_server()
         return self._server
     
-    def dumps(self, obj):
+    def dumps(self, obj, buffers=None):
         """Convert obj to serialized string.
+        
+        If *buffers* is a list, large arrays are appended to it instead of
+        being serialized in the string.
         """
         raise NotImplementedError()
 
-    def loads(self, msg):
+    def loads(self, msg, buffers=None):
         """Convert from serialized string to python object.
         
         Proxies that reference objects owned by the server are converted back
         into the local object. All other proxies are left as-is.
+        
+        *buffers* are the buffers or zmq frames of arrays that were sent out
+        of the message (see :func:`dumps`).
         """
         raise NotImplementedError()
 
-    def encode(self, obj):
+    def _encode_frame(self, obj, buffers):
+        # Return the description of an array sent in its own frame, or None
+        # if the array must be serialized in the message.
+        if buffers is None or obj.nbytes < self.frame_threshold:
+            return None
+        buf = _array_buffer(obj)
+        if buf is None:
+            if obj.dtype.hasobject:
+                return None
+            obj = buf = np.ascontiguousarray(obj)
+        buffers.append(buf)
+        return {encode_key: 'ndarray',
+                'frame': len(buffers) - 1,
+                'dtype': str(obj.dtype),
+                'shape': obj.shape,
+                'strides': None if buf is obj else obj.strides}
+
+    def _decode_frame(self, dct, buffers):
+        buf = buffers[dct['frame']]
+        if not isinstance(buf, (bytes, bytearray, memoryview, np.ndarray)):
+            # zmq.Frame
+            buf = buf.buffer
+        strides = dct.get('strides')
+        return np.ndarray(shape=dct['shape'], dtype=_decode_dtype(dct['dtype']), buffer=buf,
+                          strides=None if strides is None else tuple(strides))
+
+    def encode(self, obj, buffers=None):
         """Convert various types to serializable objects.
         
         Provides support for ndarray, datetime, date, and None. Other types
         are converted to proxies.
         """
         if isinstance(obj, np.ndarray):
+            frame = self._encode_frame(obj, buffers)
+            if frame is not None:
+                return frame
             if not obj.flags['C_CONTIGUOUS']:
                 obj = np.ascontiguousarray(obj)
             assert(obj.flags['C_CONTIGUOUS'])
@@ -85,6 +181,9 @@ class Serializer:
                     'data': obj.strftime('%Y-%m-%d')}
         elif obj is None:
             return {encode_key: 'none'}
+        elif isinstance(obj, concurrent.futures.Future) and getattr(obj, '_batch_index', None) is not None:
+            # result of a request queued in the same batch
+            return {encode_key: 'batch_ref', 'index': obj._batch_index}
         elif isinstance(obj, (np.float32, np.float64)):
             #convert for numpy.float32, numpy.float64, ...
             return float(obj)
@@ -101,7 +200,7 @@ class Serializer:
             ser.update(obj._save())
             return ser
 
-    def decode(self, dct):
+    def decode(self, dct, buffers=None):
         """Convert from serializable objects back to original types.
         """
         if isinstance(dct, dict):
@@ -109,19 +208,18 @@ class Serializer:
             if type_name is None:
                 return dct
             if type_name == 'ndarray':
-                dt = dct['dtype']
-                if dt.startswith('['):
-                    #small hack to have a list
-                    d = {}
-                    exec('dtype='+dt, None, d)
-                    dt = d['dtype']
-                return np.fromstring(dct['data'], dtype=dt).reshape(dct['shape'])
+                if 'frame' in dct:
+                    return self._decode_frame(dct, buffers)
+                dt = _decode_dtype(dct['dtype'])
+                return np.frombuffer(dct['data'], dtype=dt).reshape(dct['shape']).copy()
             elif type_name == 'datetime':
                 return datetime.datetime.strptime(dct['data'], '%Y-%m-%dT%H:%M:%S.%f')
             elif type_name == 'date':
                 return datetime.datetime.strptime(dct['data'], '%Y-%m-%d').date()
             elif type_name == 'none':
                 return None
+            elif type_name == 'batch_ref':
+                return BatchRef(dct['index'])
             elif type_name == 'proxy':
                 if 'attributes' in dct:
                     dct['attributes'] = tuple(dct['attributes'])
@@ -149,17 +247,18 @@ class MsgpackSerializer(Serializer):
     
     # used to tell server how to unserialize messages
     type = 'msgpack'
+    type_id = 0
     
     def __init__(self, server=None, client=None):
         assert HAVE_MSGPACK
         Serializer.__init__(self, server, client)
     
-    def dumps(self, obj):
+    def dumps(self, obj, buffers=None):
         """Convert obj to msgpack string.
         """
-        return msgpack.dumps(obj, use_bin_type=True, default=self.encode)
+        return msgpack.dumps(obj, use_bin_type=True, default=functools.partial(self.encode, buffers=buffers))
 
-    def loads(self, msg):
+    def loads(self, msg, buffers=None):
         """Convert from msgpack string to python object.
         
         Proxies that reference objects owned by the server are converted back
@@ -170,35 +269,43 @@ class MsgpackSerializer(Serializer):
         #return msgpack.loads(msg, encoding='utf8', use_list=False, object_hook=self.decode)
 
         #Return lists/tuples as lists because json can't be configured otherwise
-        return msgpack.loads(msg, encoding='utf8', object_hook=self.decode)
+        return msgpack.loads(msg, encoding='utf8', object_hook=functools.partial(self.decode, buffers=buffers))
 
 
 class JsonSerializer(Serializer):
     
     # used to tell server how to unserialize messages
     type = 'json'
+    type_id = 1
     
     def __init__(self, server=None, client=None):
         Serializer.__init__(self, server, client)
         
         # We require a custom class to overrode json encode behavior.
         class EnhancedJSONEncoder(json.JSONEncoder):
+            def __init__(self2, buffers=None, **kwds):
+                json.JSONEncoder.__init__(self2, **kwds)
+                self2.buffers = buffers
+            
             def default(self2, obj):
-                obj2 = self.encode(obj)
+                obj2 = self.encode(obj, self2.buffers)
                 if obj is obj2:
                     return json.JSONEncoder.default(self, obj)
                 else:
                     return obj2
         self.EnhancedJSONEncoder = EnhancedJSONEncoder
     
-    def dumps(self, obj):
-        return json.dumps(obj, cls=self.EnhancedJSONEncoder).encode()
+    def dumps(self, obj, buffers=None):
+        return json.dumps(obj, cls=self.EnhancedJSONEncoder, buffers=buffers).encode()
     
-    def loads(self, msg):
-        return json.loads(msg.decode(), object_hook=self.decode)
+    def loads(self, msg, buffers=None):
+        return json.loads(bytes(msg).decode(), object_hook=functools.partial(self.decode, buffers=buffers))
 
-    def encode(self, obj):
+    def encode(self, obj, buffers=None):
         if isinstance(obj, np.ndarray):
+            frame = self._encode_frame(obj, buffers)
+            if frame is not None:
+                return frame
             # JSON doesn't support bytes, so we use base64 encoding instead:
             if not obj.flags['C_CONTIGUOUS']:
                 obj = np.ascontiguousarray(obj)
@@ -213,18 +320,18 @@ class JsonSerializer(Serializer):
         elif obj is None:
             # JSON does support None/null:
             return None
-        return Serializer.encode(self, obj)
+        return Serializer.encode(self, obj, buffers)
 
-    def decode(self, dct):
+    def decode(self, dct, buffers=None):
         if isinstance(dct, dict):
             type_name = dct.get(encode_key, None)
-            if type_name == 'ndarray':
+            if type_name == 'ndarray' and 'frame' not in dct:
                 data = base64.b64decode(dct['data'])
-                return np.frombuffer(data, dct['dtype']).reshape(dct['shape'])
+                return np.frombuffer(data, _decode_dtype(dct['dtype'])).reshape(dct['shape'])
             elif type_name == 'bytes':
                 return base64.b64decode(dct['data'])
             
-            return Serializer.decode(self, dct)
+            return Serializer.decode(self, dct, buffers)
         return dct
 
 
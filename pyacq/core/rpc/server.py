@@ -9,13 +9,17 @@ import traceback
 import socket
 import threading
 import builtins
+import struct
+import collections
+import queue
+import concurrent.futures
 import zmq
 import logging
 import numpy as np
 import atexit
 from pyqtgraph.Qt import QtCore, QtGui
 
-from .serializer import all_serializers
+from .serializer import all_serializers, BatchRef
 from .proxy import ObjectProxy
 from .timer import Timer
 from . import log
@@ -24,6 +28,33 @@ from . import log
 logger = logging.getLogger(__name__)
 
 
+# Requests are sent by RPCClient as multipart messages:
+#     [header, serialized opts, out-of-band buffers...]
+# and responses as:
+#     [header, serialized rval or error, out-of-band buffers...]
+# Headers are packed binary structures: (req_id, action, return_type,
+# serializer type_id) for requests and (req_id, response kind) for responses.
+# Actions and return types are sent as their index in these tuples.
+actions = ('call_obj', 'get_obj', 'get_item', 'set_item', 'delete', 'import', 'ping', 'close', 'batch')
+return_types = ('auto', 'proxy', 'value')
+request_header = struct.Struct('!qBBB')
+response_header = struct.Struct('!qB')
+RESPONSE_RETURN, RESPONSE_ERROR, RESPONSE_DISCONNECT = range(3)
+
+
+def rpc_threadsafe(obj):
+    """Decorator that marks a function, a method or a class as safe to call
+    from any thread.
+    
+    RPCServers created with *max_workers* execute the calls to these
+    functions (or to any method of these classes) in a thread pool, so that
+    slow calls do not block the other requests. An object can also be marked
+    by setting its ``_rpc_threadsafe`` attribute to True.
+    """
+    obj._rpc_threadsafe = True
+    return obj
+
+
 class RPCServer(object):
     """Remote procedure call server for invoking requests on proxied objects.
     
@@ -54,6 +85,20 @@ class RPCServer(object):
         
         **Note:** binding RPCServer to a public IP address is a potential
         security hazard.
+    max_workers : int | None
+        If given, calls to functions and objects marked with
+        :func:`rpc_threadsafe` are executed by a pool of *max_workers*
+        threads, and their results are sent as soon as they complete. Requests
+        to the same object are still executed in the order they were
+        received: other requests that reference an object with pending
+        thread-safe calls (calls that are not thread-safe, attribute reads,
+        get_item, delete and batches) are queued until these calls are done,
+        then executed by the server thread. The server thread does not wait
+        for them: requests to other objects are processed in the meantime.
+        Objects are the ones published by the server, from which proxies are
+        derived: calls to two methods of an object, or two functions of a
+        module, are executed one after the other. This requires
+        `run_forever()` (or :class:`QtRPCServer`).
 
     Notes
     -----
@@ -142,7 +187,7 @@ class RPCServer(object):
         srv = RPCServer.get_server()
         return RPCClient.get_client(srv.address)
 
-    def __init__(self, address="tcp://127.0.0.1:*"):
+    def __init__(self, address="tcp://127.0.0.1:*", max_workers=None):
         self._socket = zmq.Context.instance().socket(zmq.ROUTER)
         
         # socket will continue attempting to deliver messages up to 5 sec after
@@ -159,7 +204,7 @@ class RPCServer(object):
         # have one of each ready.
         self._serializers = {}
         for ser in all_serializers.values():
-            self._serializers[ser.type] = ser(server=self)
+            self._serializers[ser.type_id] = ser(server=self)
         
         # keep track of all clients we have seen so that we can inform them 
         # when the server exits.
@@ -189,6 +234,47 @@ class RPCServer(object):
         self._proxy_refs = {}  # obj_id: [object, set(refs)]
         self._proxy_id_map = {}  # id(obj): obj_id
         
+        # functions that execute each action (see process_action)
+        self._action_handlers = {
+            'call_obj': self._action_call_obj,
+            'get_obj': self._action_get_obj,
+            'delete': self._action_delete,
+            'get_item': self._action_get_item,
+            'set_item': self._action_set_item,
+            'import': self._action_import,
+            'ping': self._action_ping,
+            'batch': self._action_batch,
+            'close': self._action_close,
+        }
+        
+        # Thread pool for thread-safe calls (see max_workers)
+        self._executor = None
+        # While the server thread decodes a request: {id(object): root} for
+        # the local objects referenced by the proxies of the request, the ids
+        # of the roots that are busy with other requests (or None if they
+        # are not checked) and the roots held by the request being decoded
+        self._unwrap_roots = None
+        self._unwrap_busy = None
+        self._unwrap_held = ()
+        if max_workers:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                                   thread_name_prefix='rpc_worker')
+            # results of calls executed by the pool, waiting to be sent:
+            # (caller, req_id, return_type, result, exc)
+            self._completed = queue.Queue()
+            # An object is busy while it has an entry here, with the deque of
+            # the tasks waiting for it: {id(object): deque of _SerialTask}
+            self._serial = {}
+            self._serial_lock = threading.Lock()
+            # queued requests that can now be executed by the server thread
+            self._ready = queue.Queue()
+            # workers wake up the server thread through this socket
+            self._done_addr = 'inproc://rpc_done_%x' % id(self)
+            self._done_socket = zmq.Context.instance().socket(zmq.PULL)
+            self._done_socket.linger = 0
+            self._done_socket.bind(self._done_addr)
+            self._worker_sockets = threading.local()
+        
         # Make sure we inform clients of closure
         atexit.register(self._atexit)
 
@@ -220,12 +306,23 @@ class RPCServer(object):
         """
         try:
             oid = proxy._obj_id
-            obj = self._proxy_refs[oid][0]
+            obj = root = self._proxy_refs[oid][0]
         except KeyError:
             raise KeyError("Invalid proxy object ID %r. The object may have "
                            "been released already." % proxy.obj_id)
+        roots = self._unwrap_roots
+        busy = self._unwrap_busy
+        if busy is not None and id(root) not in self._unwrap_held and id(root) in self._serial:
+            # attributes must not be read before the pending calls to the
+            # object are done (see max_workers): the request is queued and
+            # decoded again when it is executed
+            busy.add(id(root))
+            roots[id(root)] = root
+            return root
         for attr in proxy._attributes:
             obj = getattr(obj, attr)
+        if roots is not None:
+            roots[id(obj)] = root
         #logging.debug("server %s unwrap proxy %d: %s", self.address, oid, obj)
         return obj
 
@@ -239,13 +336,22 @@ class RPCServer(object):
         
     @staticmethod
     def _read_one(socket):
-        name, req_id, action, return_type, ser_type, opts = socket.recv_multipart()
+        # Small frames are received by copy (this is faster); arrays sent
+        # out of the serialized options are received without copy.
+        name = socket.recv()
+        header = socket.recv()
+        opts = socket.recv()
+        buffers = []
+        while socket.getsockopt(zmq.RCVMORE):
+            buffers.append(socket.recv(copy=False))
+        req_id, action, return_type, ser_type = request_header.unpack(header)
         msg = {
-            'req_id': int(req_id), 
-            'action': action.decode(), 
-            'return_type': return_type.decode(),
-            'ser_type': ser_type.decode(),
+            'req_id': req_id,
+            'action': actions[action],
+            'return_type': return_types[return_type],
+            'ser_type': ser_type,
             'opts': opts,
+            'buffers': buffers,
         }
         return name, msg
         
@@ -259,17 +365,21 @@ class RPCServer(object):
         name, msg = self._read_one(self._socket)
         self._process_one(name, msg)
         
-    def _process_one(self, caller, msg):
+    def _process_one(self, caller, msg, task=None):
         """
         Invoke the requested action.
         
         This method sends back to the client either the return value or an
         error message.
+        
+        *task* is given when a request that was queued behind the pending
+        calls to its objects is executed (see max_workers).
         """
         ser_type = msg['ser_type']
         action = msg['action']
         req_id = msg['req_id']
         return_type = msg.get('return_type', 'auto')
+        debug = logger.isEnabledFor(logging.DEBUG)
         
         # remember this caller so we can deliver a disconnect message later
         self._clients[caller] = ser_type
@@ -279,22 +389,51 @@ class RPCServer(object):
             try:
                 serializer = self._serializers[ser_type]
             except KeyError:
-                raise ValueError("Unsupported serializer '%s'" % ser_type)
-            opts = msg.pop('opts', None)
+                raise ValueError("Unsupported serializer %r" % ser_type)
+            opts = msg.get('opts', None)
+            buffers = msg.get('buffers', None)
             
-            logging.debug("RPC recv '%s' from %s [req_id=%s]", action, caller.decode(), req_id)
-            logging.debug("    => %s", msg)
+            if debug:
+                logger.debug("RPC recv '%s' from %s [req_id=%s]", action, caller.decode(), req_id)
+            roots = {}
+            busy = set()
             if opts == b'':
                 opts = None
+            elif self._executor is None:
+                opts = serializer.loads(opts, buffers)
             else:
-                opts = serializer.loads(opts)
-            logging.debug("    => opts: %s", opts)
+                # Attributes of busy objects are not read, except for
+                # call_obj, which is ordered by _schedule.
+                self._unwrap_roots = roots
+                self._unwrap_busy = busy if action != 'call_obj' else None
+                self._unwrap_held = () if task is None else task.keys
+                try:
+                    opts = serializer.loads(opts, buffers)
+                finally:
+                    self._unwrap_roots = None
+                    self._unwrap_busy = None
+                    self._unwrap_held = ()
+            if debug:
+                logger.debug("    => return_type=%s opts: %s", return_type, opts)
             
+            if self._executor is not None and task is None:
+                if self._schedule(caller, msg, opts, roots, busy):
+                    # the result is sent when the request is executed
+                    return
             result = self.process_action(action, opts, return_type, caller)
             exc = None
         except:
+            result = None
             exc = sys.exc_info()
 
+        self._send_response(caller, req_id, return_type, result, exc)
+        if task is not None:
+            self._release(task)
+            
+        if action == 'close':
+            self._final_close()
+    
+    def _send_response(self, caller, req_id, return_type, result, exc):
         # Send result or error back to client
         if req_id >= 0:
             if exc is None:
@@ -318,101 +457,287 @@ class RPCServer(object):
             # An exception occurred, but client did not request a response.
             # Instead we will dump the exception here.
             sys.excepthook(*exc)
-            
-        if action == 'close':
-            self._final_close()
     
-    def _send_error(self, caller, req_id, exc):
+    def _schedule(self, caller, msg, opts, roots, busy):
+        # Queue a request behind the pending calls to its objects, or run a
+        # thread-safe call in the pool, and return True. Return False if the
+        # request can be executed now by the server thread.
+        # Requests are ordered per root object: the object published by the
+        # server from which the proxies of the request were derived. A queued
+        # request holds all its objects, so later requests that reference
+        # any of them are executed after it.
+        action = msg['action']
+        keys = set(id(root) for root in roots.values())
+        threadsafe = False
+        if action == 'call_obj':
+            obj = opts['obj']
+            owner = getattr(obj, '__self__', None)
+            keys.add(id(roots.get(id(obj), obj)))
+            if not (isinstance(obj, ObjectProxy) or isinstance(owner, ObjectProxy)):
+                threadsafe = (getattr(obj, '_rpc_threadsafe', False) is True or
+                              (owner is not None and getattr(owner, '_rpc_threadsafe', False) is True))
+        elif action == 'delete':
+            proxy_ref = self._proxy_refs.get(opts['obj_id'])
+            if proxy_ref is not None:
+                keys.add(id(proxy_ref[0]))
+        elif action in ('get_item', 'set_item') and opts['name'] in self._namespace:
+            keys.add(id(self._namespace[opts['name']]))
+        
+        with self._serial_lock:
+            if not threadsafe and len(busy) == 0 and not any(key in self._serial for key in keys):
+                return False
+            if threadsafe:
+                task = _SerialTask(keys, True, (caller, msg['req_id'], msg['return_type'], opts))
+            else:
+                # the request is decoded again when it is executed
+                task = _SerialTask(keys, False, (caller, msg))
+            for key in keys:
+                if key in self._serial:
+                    self._serial[key].append(task)
+                    task.waiting += 1
+                else:
+                    self._serial[key] = collections.deque()
+        if task.waiting == 0:
+            self._dispatch(task)
+        return True
+    
+    def _dispatch(self, task):
+        # Start a task that holds all its objects.
+        if task.threadsafe:
+            self._executor.submit(self._execute_call, task)
+        else:
+            self._ready.put(task)
+            self._wake_server()
+    
+    def _release(self, task):
+        # Hand over the objects of a finished task to the next tasks that
+        # wait for them.
+        ready = []
+        with self._serial_lock:
+            for key in task.keys:
+                tasks = self._serial[key]
+                if len(tasks) == 0:
+                    del self._serial[key]
+                    continue
+                next_task = tasks.popleft()
+                next_task.waiting -= 1
+                if next_task.waiting == 0:
+                    ready.append(next_task)
+        for next_task in ready:
+            self._dispatch(next_task)
+    
+    def _execute_call(self, task):
+        # Called in a worker thread of the pool.
+        caller, req_id, return_type, opts = task.args
+        try:
+            result = self._action_call_obj(opts, caller)
+            exc = None
+        except:
+            result = None
+            exc = sys.exc_info()
+        self._completed.put((caller, req_id, return_type, result, exc))
+        self._release(task)
+        self._wake_server()
+    
+    def _wake_server(self):
+        # Wake up the server thread to send the completed results and
+        # execute the queued requests that are ready.
+        sock = getattr(self._worker_sockets, 'socket', None)
+        if sock is None:
+            sock = zmq.Context.instance().socket(zmq.PUSH)
+            sock.linger = 0
+            sock.connect(self._done_addr)
+            self._worker_sockets.socket = sock
+        try:
+            sock.send(b'', zmq.NOBLOCK)
+        except zmq.Again:
+            # the server thread has pending notifications already
+            pass
+    
+    def _send_completed(self):
+        # Send the results of the calls completed by the thread pool, then
+        # execute the queued requests whose objects are no longer busy.
+        while True:
+            try:
+                completed = self._completed.get_nowait()
+            except queue.Empty:
+                break
+            if not self.running():
+                continue
+            self._send_response(*completed)
+        while self.running():
+            try:
+                task = self._ready.get_nowait()
+            except queue.Empty:
+                return
+            self._process_one(*task.args, task=task)
+    
+    def _format_error(self, caller, req_id, exc):
         exc_str = ["Error while processing request %s [%d]: " % (caller.decode(), req_id)]
         exc_str += traceback.format_stack()
         exc_str += [" < exception caught here >\n"]
         exc_str += traceback.format_exception(*exc)
-        self._send_result(caller, req_id, error=(exc[0].__name__, exc_str))
+        return (exc[0].__name__, exc_str)
+    
+    def _send_error(self, caller, req_id, exc):
+        self._send_result(caller, req_id, error=self._format_error(caller, req_id, exc))
     
     def _send_result(self, caller, req_id, rval=None, error=None):
-        result = {'action': 'return', 'req_id': req_id,
-                  'rval': rval, 'error': error}
-        logging.debug("RPC send result to %s [rpc_id=%s]", caller.decode(), result['req_id'])
-        logging.debug("    => %s", result)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("RPC send result to %s [req_id=%s]", caller.decode(), req_id)
+            logger.debug("    => rval=%s error=%s", rval, error)
         
         # Select the correct serializer for this client
         serializer = self._serializers[self._clients[caller]]
         
-        # Serialize and return the result
-        data = serializer.dumps(result)
-        self._socket.send_multipart([caller, data])
+        # Serialize and return the result; large arrays are sent without
+        # copy in extra frames
+        buffers = []
+        if error is None:
+            header = response_header.pack(req_id, RESPONSE_RETURN)
+            data = serializer.dumps(rval, buffers)
+        else:
+            header = response_header.pack(req_id, RESPONSE_ERROR)
+            data = serializer.dumps(error)
+        if len(buffers) == 0:
+            self._socket.send_multipart([caller, header, data])
+        else:
+            # the arrays may be modified after the call returns (node
+            # buffers, shared memory): wait until zmq is done with them
+            tracker = self._socket.send_multipart([caller, header, data] + buffers, copy=False, track=True)
+            tracker.wait()
 
     def process_action(self, action, opts, return_type, caller):
         """Invoke a single action and return the result.
         """
-        if action == 'call_obj':
-            obj = opts['obj']
-            fnargs = opts.get('args', ())
-            fnkwds = opts.get('kwargs', {})
-            
-            if len(fnkwds) == 0:  ## need to do this because some functions do not allow keyword arguments.
-                try:
-                    result = obj(*fnargs)
-                except:
-                    logger.warn("Failed to call object %s: %d, %s", obj, len(fnargs), fnargs[1:])
-                    raise
-            else:
-                result = obj(*fnargs, **fnkwds)
-            #logging.debug("    => call_obj result: %r", result)
-        elif action == 'get_obj':
-            result = opts['obj']
-        elif action == 'delete':
-            proxy_ref = self._proxy_refs[opts['obj_id']]
-            proxy_ref[1].remove(opts['ref_id'])
-            if len(proxy_ref[1]) == 0:
-                del self._proxy_refs[opts['obj_id']]
-                del self._proxy_id_map[id(proxy_ref[0])]
-            result = None
-        elif action =='get_item':
-            result = self[opts['name']]
-        elif action =='set_item':
-            self[opts['name']] = opts['obj']
-            result = None
-        elif action == 'import':
-            name = opts['module']
-            fromlist = opts.get('fromlist', [])
-            mod = builtins.__import__(name, fromlist=fromlist)
-            
-            if len(fromlist) == 0:
-                parts = name.lstrip('.').split('.')
-                result = mod
-                for part in parts[1:]:
-                    result = getattr(result, part)
-            else:
-                result = map(mod.__getattr__, fromlist)
-        elif action == 'ping':
-            result = 'pong'
-        elif action == 'close':
-            self._closed = True
-            # Send a disconnect message to all known clients
-            data = {}
-            for client, ser_type in self._clients.items():
-                if client == caller:
-                    # We will send an actual return value to confirm closure
-                    # to the caller.
-                    continue
-                
-                # Select or generate the disconnect message that was serialized
-                # correctly for this client.
-                if ser_type not in data:
-                    ser = self._serializers[ser_type]
-                    data[ser_type] = ser.dumps({'action': 'disconnect'})
-                data_str = data[ser_type]
-                
-                # Send disconnect message.
-                logger.debug("RPC server sending disconnect message to %r", client)
-                self._socket.send_multipart([client, data_str])
-            RPCServer.unregister_server(self)
-            result = True
-        else:
+        try:
+            handler = self._action_handlers[action]
+        except KeyError:
             raise ValueError("Invalid RPC action '%s'" % action)
+        return handler(opts, caller)
+
+    def _action_call_obj(self, opts, caller):
+        obj = opts['obj']
+        fnargs = opts.get('args') or ()
+        fnkwds = opts.get('kwargs') or {}
         
-        return result
+        if len(fnkwds) == 0:  ## need to do this because some functions do not allow keyword arguments.
+            try:
+                return obj(*fnargs)
+            except:
+                logger.warn("Failed to call object %s: %d, %s", obj, len(fnargs), fnargs[1:])
+                raise
+        else:
+            return obj(*fnargs, **fnkwds)
+
+    def _action_get_obj(self, opts, caller):
+        if 'cache_version' not in opts:
+            return opts['obj']
+        # Read of a value cached by the client (see the cache_attrs proxy
+        # option): the value is sent again only if the version stamp of the
+        # object has changed. Objects declare the attributes that may be
+        # cached with _cacheable_attrs and increment _cache_version when
+        # these change.
+        root = opts['obj']
+        attributes = opts['attributes']
+        version = None
+        if len(attributes) > 0 and attributes[0] in getattr(root, '_cacheable_attrs', ()):
+            # read the stamp first: the value is at least as recent
+            version = root._cache_version
+            if version == opts['cache_version']:
+                return (False, version, None)
+        obj = root
+        for attr in attributes:
+            obj = getattr(obj, attr)
+        return (True, version, obj)
+
+    def _action_delete(self, opts, caller):
+        proxy_ref = self._proxy_refs[opts['obj_id']]
+        proxy_ref[1].remove(opts['ref_id'])
+        if len(proxy_ref[1]) == 0:
+            del self._proxy_refs[opts['obj_id']]
+            del self._proxy_id_map[id(proxy_ref[0])]
+
+    def _action_get_item(self, opts, caller):
+        return self[opts['name']]
+
+    def _action_set_item(self, opts, caller):
+        self[opts['name']] = opts['obj']
+
+    def _action_import(self, opts, caller):
+        name = opts['module']
+        fromlist = opts.get('fromlist', [])
+        mod = builtins.__import__(name, fromlist=fromlist)
+        
+        if len(fromlist) == 0:
+            parts = name.lstrip('.').split('.')
+            result = mod
+            for part in parts[1:]:
+                result = getattr(result, part)
+            return result
+        else:
+            return map(mod.__getattr__, fromlist)
+
+    def _action_ping(self, opts, caller):
+        return 'pong'
+
+    def _action_batch(self, opts, caller):
+        return self._process_batch(opts['requests'], caller)
+
+    def _action_close(self, opts, caller):
+        self._closed = True
+        # Send a disconnect message to all known clients
+        data = response_header.pack(-1, RESPONSE_DISCONNECT)
+        for client in self._clients:
+            if client == caller:
+                # We will send an actual return value to confirm closure
+                # to the caller.
+                continue
+            
+            # Send disconnect message.
+            logger.debug("RPC server sending disconnect message to %r", client)
+            self._socket.send_multipart([client, data, b''])
+        RPCServer.unregister_server(self)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        return True
+
+    def _process_batch(self, requests, caller):
+        # Execute the requests of a batch in order and return a list of
+        # [rval, error] pairs. Requests after a failed one are not executed.
+        results = []
+        replies = []
+        error = None
+        for i, (action, opts, return_type) in enumerate(requests):
+            if error is not None:
+                replies.append([None, ('RuntimeError', ["Request %d of batch was not executed "
+                                                        "because request %d failed.\n" % (i, error)])])
+                continue
+            try:
+                opts = self._resolve_batch_refs(opts, results)
+                result = self.process_action(action, opts, return_type, caller)
+                results.append(result)
+                if return_type == 'auto':
+                    result = self.auto_proxy(result, self.no_proxy_types)
+                elif return_type == 'proxy':
+                    result = self.get_proxy(result)
+                replies.append([result, None])
+            except Exception:
+                error = i
+                replies.append([None, self._format_error(caller, i, sys.exc_info())])
+        return replies
+    
+    def _resolve_batch_refs(self, obj, results):
+        # replace references to previous results of a batch
+        if isinstance(obj, BatchRef):
+            if obj.index >= len(results):
+                raise ValueError("Batch request refers to the result of a later request (%d)" % obj.index)
+            return results[obj.index]
+        elif isinstance(obj, dict):
+            return {k: self._resolve_batch_refs(v, results) for k, v in obj.items()}
+        elif isinstance(obj, (list, tuple)):
+            return type(obj)(self._resolve_batch_refs(v, results) for v in obj)
+        return obj
 
     def _atexit(self):
         # Process is exiting; do any last-minute cleanup if necessary.
@@ -449,9 +774,25 @@ class RPCServer(object):
 
         logging.info("RPC start server: %s@%s", name, self.address.decode())
         RPCServer.register_server(self)
+        if self._executor is None:
+            while self.running():
+                name, msg = self._read_one(self._socket)
+                self._process_one(name, msg)
+            return
+        
+        poller = zmq.Poller()
+        poller.register(self._socket, zmq.POLLIN)
+        poller.register(self._done_socket, zmq.POLLIN)
         while self.running():
-            name, msg = self._read_one(self._socket)
-            self._process_one(name, msg)
+            socks = dict(poller.poll())
+            if self._done_socket in socks:
+                while self._done_socket.poll(timeout=0):
+                    self._done_socket.recv()
+                self._send_completed()
+            if self._socket in socks:
+                name, msg = self._read_one(self._socket)
+                self._process_one(name, msg)
+        self._done_socket.close()
             
     def run_lazy(self):
         """Register this server as being active for the current thread, but do
@@ -492,6 +833,23 @@ class RPCServer(object):
         return Timer(callback, interval, **kwds)
 
 
+class _SerialTask(object):
+    # A request that waits for the pending calls to its objects (see
+    # RPCServer max_workers).
+    __slots__ = ['keys', 'threadsafe', 'args', 'waiting']
+    
+    def __init__(self, keys, threadsafe, args):
+        # ids of the root objects of the request
+        self.keys = keys
+        # True for calls executed by the pool, with args (caller, req_id,
+        # return_type, opts); False for requests executed by the server
+        # thread, with args (caller, msg)
+        self.threadsafe = threadsafe
+        self.args = args
+        # number of objects still held by earlier requests
+        self.waiting = 0
+
+
 class QtRPCServer(RPCServer):
     """RPCServer that lives in a Qt GUI thread.
 
@@ -536,8 +894,8 @@ class QtRPCServer(RPCServer):
         # returns immediately).
         server.run_forever()
     """
-    def __init__(self, address="tcp://127.0.0.1:*", quit_on_close=True):
-        RPCServer.__init__(self, address)
+    def __init__(self, address="tcp://127.0.0.1:*", quit_on_close=True, max_workers=None):
+        RPCServer.__init__(self, address, max_workers=max_workers)
         self.quit_on_close = quit_on_close
         self.poll_thread = QtPollThread(self)
         
@@ -575,6 +933,7 @@ class QtPollThread(QtCore.QThread):
     thread by a secondary socket.
     """
     new_request = QtCore.Signal(object, object)  # client, msg
+    calls_completed = QtCore.Signal()
     
     def __init__(self, server):
         # Note: QThread behaves like threading.Thread(daemon=True); a running
@@ -599,11 +958,15 @@ class QtPollThread(QtCore.QThread):
         server._socket.connect(return_addr)
 
         self.new_request.connect(server._process_one)
+        self.calls_completed.connect(server._send_completed)
         
     def run(self):
         poller = zmq.Poller()
         poller.register(self.rpc_socket, zmq.POLLIN)
         poller.register(self.return_socket, zmq.POLLIN)
+        done_socket = self.server._done_socket if self.server._executor is not None else None
+        if done_socket is not None:
+            poller.register(done_socket, zmq.POLLIN)
         
         while True:
             # Note: poller needs to continue running until server has sent 
@@ -612,11 +975,17 @@ class QtPollThread(QtCore.QThread):
             socks = dict(poller.poll(timeout=100))
             
             if self.return_socket in socks:
-                name, data = self.return_socket.recv_multipart()
-                #logger.debug("poller return %s %s", name, data)
-                if name == 'STOP':
+                frames = self.return_socket.recv_multipart(copy=False)
+                #logger.debug("poller return %s", frames)
+                if frames[0].bytes == b'STOP':
                     break
-                self.rpc_socket.send_multipart([name, data])
+                self.rpc_socket.send_multipart(frames, copy=False)
+                
+            if done_socket is not None and done_socket in socks:
+                # results of the thread pool are sent from the Qt thread
+                while done_socket.poll(timeout=0):
+                    done_socket.recv()
+                self.calls_completed.emit()
                 
             if self.rpc_socket in socks:
                 name, msg = RPCServer._read_one(self.rpc_socket)
@@ -3,7 +3,7 @@
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
 import threading, atexit, time, logging
-from pyacq.core.rpc import RPCClient, RemoteCallException, RPCServer, QtRPCServer, ObjectProxy, ProcessSpawner
+from pyacq.core.rpc import RPCClient, RemoteCallException, RPCServer, QtRPCServer, ObjectProxy, ProcessSpawner, rpc_threadsafe
 from pyacq.core.rpc.log import RPCLogHandler, set_process_name, set_thread_name, start_log_server
 import zmq.utils.monitor
 import numpy as np
@@ -391,8 +391,213 @@ def test_disconnect():
 
 
 
+def test_batch():
+    proc = ProcessSpawner()
+    client = proc.client
+    rnp = client._import('numpy')
+    ros = client._import('os')
+    
+    with client.batch() as batch:
+        pid = ros.getpid()
+        a = rnp.arange(10)
+        # results of the batch can be used by the next requests
+        total = client.call_obj(rnp.sum, args=(a,), return_type='value')
+        client['batch_array'] = a
+        b = client.get_obj(rnp.pi)
+        assert not pid.done()
+    # one message for all requests
+    assert len(batch.requests) == 5
+    assert pid.result() == proc.proc.pid
+    assert np.array_equal(a.result(), np.arange(10))
+    assert total.result() == 45
+    assert b.result() == np.pi
+    assert np.array_equal(client['batch_array'], np.arange(10))
+    
+    # the batch stops at the first error
+    with client.batch(sync='async'):
+        ok = rnp.zeros(3)
+        err = rnp.zeros('not a shape')
+        skipped = rnp.ones(3)
+    assert np.array_equal(ok.result(), np.zeros(3))
+    for fut in (err, skipped):
+        try:
+            fut.result()
+            assert False, "Expected RemoteCallException"
+        except RemoteCallException:
+            pass
+    
+    # requests are sent normally after the batch
+    assert ros.getpid() == proc.proc.pid
+    
+    # unknown actions are refused by the client and by the server
+    try:
+        client.send('not_an_action')
+        assert False, "Expected ValueError"
+    except ValueError:
+        pass
+    try:
+        client['self'].process_action('not_an_action', None, 'auto', None)
+        assert False, "Expected RemoteCallException"
+    except RemoteCallException:
+        pass
+    
+    proc.stop()
+
+
+def test_executor():
+    @rpc_threadsafe
+    class Worker(object):
+        def __init__(self):
+            self.calls = []
+        
+        def work(self, name, t):
+            time.sleep(t)
+            self.calls.append(name)
+            return name
+    
+    class Counter(object):
+        def __init__(self):
+            self.calls = []
+        
+        def count(self, name):
+            self.calls.append(name)
+            return name
+    
+    server = RPCServer(max_workers=4)
+    server['worker'] = Worker()
+    server['worker2'] = Worker()
+    server['counter'] = Counter()
+    serve_thread = threading.Thread(target=server.run_forever, daemon=True)
+    serve_thread.start()
+    client = RPCClient(server.address)
+    worker = client['worker']
+    worker2 = client['worker2']
+    
+    # slow thread-safe calls do not block the other requests
+    start = time.perf_counter()
+    slow = worker.work('slow', 1.0, _sync='async')
+    assert client.ping() == 'pong'
+    assert worker2.work('fast', 0) == 'fast'
+    assert not slow.done()
+    assert slow.result() == 'slow'
+    
+    # calls to the same object are executed in order
+    futs = [worker.work(i, 0.05 * (i % 2), _sync='async') for i in range(6)]
+    assert [fut.result() for fut in futs] == list(range(6))
+    assert worker.calls._get_value() == ['slow'] + list(range(6))
+    
+    # calls that are not thread-safe are still executed by the server thread
+    assert client['counter'].count(1) == 1
+    
+    # attribute reads, get_item and batches wait for the pending calls
+    worker.work('a', 0.3, _sync='async')
+    assert worker.calls._get_value()[-1] == 'a'
+    worker.work('b', 0.3, _sync='async')
+    assert client['worker'].calls._get_value()[-1] == 'b'
+    worker.work('c', 0.3, _sync='async')
+    with client.batch():
+        calls = client.get_obj(worker.calls, return_type='value')
+    assert calls.result()[-1] == 'c'
+    
+    # requests queued behind a busy object do not block the other requests
+    worker.work('d', 1.0, _sync='async')
+    calls = client.get_obj(worker.calls, return_type='value', sync='async')
+    item = client.send('get_item', opts={'name': 'worker'}, sync='async')
+    start = time.perf_counter()
+    assert client.ping() == 'pong'
+    assert worker2.work('e', 0) == 'e'
+    assert client['counter'].count(2) == 2
+    assert time.perf_counter() - start < 0.5
+    assert not calls.done()
+    assert calls.result()[-1] == 'd'
+    assert item.result().calls._get_value()[-1] == 'd'
+    
+    # errors are returned to the caller
+    try:
+        worker.work('error', 'not a number')
+        assert False, "Expected RemoteCallException"
+    except RemoteCallException:
+        pass
+    
+    client.close_server()
+    serve_thread.join()
+    client.close()
+
+
+def test_cache_attrs():
+    class Configurable(object):
+        def __init__(self):
+            self.reads = 0
+            self._params = {'a': 1}
+        
+        @property
+        def params(self):
+            self.reads += 1
+            return self._params
+        
+        def configure(self, **kargs):
+            self._params = dict(self._params, **kargs)
+    
+    class Stamped(Configurable):
+        _cacheable_attrs = ('params',)
+        _cache_version = 0
+        
+        def configure(self, **kargs):
+            Configurable.configure(self, **kargs)
+            self._cache_version += 1
+    
+    server = RPCServer()
+    server['obj'] = Configurable()
+    server['stamped'] = Stamped()
+    serve_thread = threading.Thread(target=server.run_forever, daemon=True)
+    serve_thread.start()
+    client = RPCClient(server.address)
+    
+    # values of stamped attributes are sent again only when they change,
+    # whoever changes them
+    stamped = client['stamped']
+    stamped._set_proxy_options(cache_attrs=True)
+    params = stamped.params._get_value()
+    params['a'] = 10
+    assert stamped.params._get_value() == {'a': 1}
+    assert client['stamped'].reads._get_value() == 1
+    client['stamped'].configure(a=2)
+    assert stamped.params._get_value() == {'a': 2}
+    server['stamped'].configure(a=3)
+    assert stamped.params._get_value() == {'a': 3}
+    assert stamped.params._get_value() == {'a': 3}
+    assert client['stamped'].reads._get_value() == 3
+    
+    # attributes without a stamp are read again each time
+    assert stamped.reads._get_value() == 3
+    server['stamped'].reads = 10
+    assert stamped.reads._get_value() == 10
+    cached = client['obj']
+    cached._set_proxy_options(cache_attrs=True)
+    assert cached.params._get_value() == {'a': 1}
+    client['obj'].configure(a=4)
+    assert cached.params._get_value() == {'a': 4}
+    assert cached.reads._get_value() == 2
+    assert list(client._value_cache) == [(stamped._obj_id, ('params',))]
+    
+    # values read in a batch are not cached
+    client.clear_cache()
+    with client.batch():
+        fut = stamped.params._get_value()
+    assert fut.result() == {'a': 3}
+    assert len(client._value_cache) == 0
+    assert stamped.params._get_value() == {'a': 3}
+    
+    client.close_server()
+    serve_thread.join()
+    client.close()
+
+
 if __name__ == '__main__':
     test_rpc()
     test_qt_rpc()
     test_disconnect()
+    test_batch()
+    test_executor()
+    test_cache_attrs()
     
@@ -46,6 +46,61 @@ def check_serializer(serializer):
             assert v1 == v2
 
 
+
+def test_array_frames():
+    arrays = {
+        'contiguous': np.random.rand(200, 100),
+        'fortran': np.asfortranarray(np.random.rand(200, 100)),
+        'strided': np.random.rand(200, 100)[:, ::2],
+        'transposed': np.random.rand(200, 100)[:100].T,
+        'sparse': np.random.rand(200, 100)[:, :5],
+        'small': np.arange(10),
+        'struct': np.zeros(5000, dtype=[('a', 'int32'), ('b', 'float64')]),
+    }
+    serializers = [JsonSerializer()]
+    if HAVE_MSGPACK:
+        serializers.append(MsgpackSerializer())
+    for serializer in serializers:
+        buffers = []
+        msg = serializer.dumps(arrays, buffers)
+        # large arrays are not copied into the message
+        assert len(buffers) == 5
+        assert len(msg) < 20000
+        # only the memory of the items is sent
+        for buf in buffers:
+            assert buf.nbytes in (200 * 100 * 8, 100 * 100 * 8, 200 * 50 * 8, 5000 * 12)
+        arrays2 = serializer.loads(msg, buffers)
+        for k, v in arrays.items():
+            assert v.dtype == arrays2[k].dtype
+            assert np.array_equal(v, arrays2[k])
+            # non-contiguous arrays are copied
+            assert np.shares_memory(v, arrays2[k]) == (k in ('contiguous', 'fortran', 'transposed', 'struct'))
+        assert arrays2['fortran'].flags['F_CONTIGUOUS']
+        
+        # without buffers, everything is in the message
+        arrays2 = serializer.loads(serializer.dumps(arrays))
+        for k, v in arrays.items():
+            assert np.array_equal(v, arrays2[k])
+
+
+def test_array_frames_rpc():
+    rnp = proc.client._import('numpy')
+    data = np.random.rand(1000, 100)
+    assert rnp.array_equal(data.T, data.T)
+    # the remote process receives and returns arrays in extra frames
+    data2 = rnp.asfortranarray(data)
+    assert np.array_equal(data, data2)
+    assert data2.flags['F_CONTIGUOUS'] and data2.flags['WRITEABLE']
+    
+    # arrays can be modified as soon as an async request is sent
+    data = np.zeros((1000, 100))
+    fut = rnp.array(data, _sync='async')
+    data[:] = 1
+    assert np.all(fut.result() == 0)
+
+
 if __name__ == '__main__':
     test_msgpack()
     test_json()
+    test_array_frames()
+    test_array_frames_rpc()
@@ -3,11 +3,14 @@
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
 from .stream import InputStream, OutputStream
-from .ringbuffer import RingBuffer
-from .sharedarray import SharedArray
+from .ringbuffer import RingBuffer, RingBufferView
+from .recordbuffer import RecordRingBuffer
+from .clock import StreamClock
+from .sharedarray import SharedArray, shm_backends
 from .streamhelpers import all_transfermodes, register_transfermode
-from .compression import compression_methods
+from .compression import compression_methods, register_compression
 
 # import transfer modes so they register their helper classes
 from . import plaindatastream
 from . import sharedmemstream
+from . import multicaststream
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+
+import collections
+import numpy as np
+
+
+class StreamClock:
+    """Online linear model that maps the sample indexes of a stream to time.
+
+    Streams configured with ``timestamps=True`` send a timestamp with each
+    chunk: the time, in the clock of the sender, at which sample *index* (the
+    index of the last sample of the chunk + 1) was reached. Each
+    (index, timestamp) pair updates a weighted least-squares fit of
+    ``time = a + index / rate``. Older observations are forgotten with a
+    half-life of *halflife* chunks, so the model follows slow drifts between
+    the sampling clock of a device and the clock of the host.
+
+    By default timestamps are ``time.perf_counter()`` values of the sending
+    host. To map them to the clock of another host, set *offset* to the
+    difference between the two clocks (sender - receiver), as measured by
+    :func:`RPCClient.measure_clock_diff` with a client connected to the
+    process of the sender.
+
+    Parameters
+    ----------
+    sample_rate : float or None
+        Nominal sample rate, used until two chunks have been received.
+    halflife : float
+        Number of chunks after which the weight of an observation is halved.
+    history : int
+        Number of raw (index, timestamp) pairs kept in *history*.
+    """
+    def __init__(self, sample_rate=None, halflife=1000., history=1000):
+        self.nominal_rate = sample_rate
+        self.forget = 0.5 ** (1. / halflife)
+        self.offset = 0.
+        self.history = collections.deque(maxlen=history)
+        # Exponentially weighted means and co-moments of indexes and times,
+        # relative to the first observation for precision.
+        self._ref = None
+        self._weight = 0.
+        self._mx = 0.
+        self._my = 0.
+        self._cxx = 0.
+        self._cxy = 0.
+        self._res2 = 0.
+
+    def update(self, index, timestamp):
+        """Add the observation that sample *index* was reached at *timestamp*.
+        """
+        self.history.append((index, timestamp))
+        if self._ref is None:
+            self._ref = (index, timestamp)
+        x = float(index - self._ref[0])
+        y = timestamp - self._ref[1]
+        if self._weight > 0:
+            # residual of the new observation before it is used for the fit
+            res = y - (self._my + self._slope() * (x - self._mx))
+            self._res2 = self.forget * self._res2 + (1 - self.forget) * res ** 2
+
+        self._weight = self.forget * self._weight + 1.
+        dx = x - self._mx
+        self._mx += dx / self._weight
+        dy = y - self._my
+        self._my += dy / self._weight
+        self._cxx = self.forget * self._cxx + dx * (x - self._mx)
+        self._cxy = self.forget * self._cxy + dx * (y - self._my)
+
+    def _slope(self):
+        if self._cxx > 0:
+            return self._cxy / self._cxx
+        if self.nominal_rate:
+            return 1. / self.nominal_rate
+        return 0.
+
+    @property
+    def ready(self):
+        """True when at least one timestamp was received."""
+        return self._ref is not None
+
+    @property
+    def rate(self):
+        """Sample rate measured with the clock of the timestamps."""
+        slope = self._slope()
+        return 1. / slope if slope != 0 else None
+
+    @property
+    def jitter(self):
+        """Standard deviation of timestamps around the model, in seconds."""
+        return np.sqrt(self._res2)
+
+    def time(self, index):
+        """Return the time at which sample *index* was (or will be) reached.
+
+        *index* may be an array. The result is in the clock of the receiver
+        (see *offset*).
+        """
+        if self._ref is None:
+            raise RuntimeError("No timestamp was received yet")
+        x = np.asarray(index, dtype='float64') - self._ref[0]
+        return self._ref[1] + self._my + self._slope() * (x - self._mx) - self.offset
+
+    def index(self, time):
+        """Return the (fractional) sample index reached at *time*.
+
+        *time* may be an array, in the clock of the receiver.
+        """
+        if self._ref is None:
+            raise RuntimeError("No timestamp was received yet")
+        y = np.asarray(time, dtype='float64') + self.offset - self._ref[1]
+        return self._ref[0] + self._mx + (y - self._my) / self._slope()
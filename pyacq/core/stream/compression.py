@@ -1,43 +1,267 @@
+import struct
+import time
+import zlib
+import numpy as np
+
+
 compression_methods = ['']
 
+# name: (compress_func, decompress_func)
+# compress_func(data, itemsize, **opts) must return a bytes-like object that
+# decompress_func(data) can restore without any other information.
+_codecs = {}
+
+
+def register_compression(name, compress_func, decompress_func):
+    """Register a compression method that can be used by plaindata streams.
+
+    *compress_func(data, itemsize, ...)* receives a contiguous buffer, the
+    size of its items and the stream's ``compression_opts`` as keyword
+    arguments. It must return a bytes-like object that *decompress_func(data)*
+    can restore without any other information, or raise ValueError if it
+    cannot compress this data (for example because of its item size).
+    """
+    _codecs[name] = (compress_func, decompress_func)
+    if name not in compression_methods:
+        compression_methods.append(name)
+
+
+_blosc_methods = ['blosc-blosclz', 'blosc-lz4', 'blosc-lz4hc', 'blosc-zlib', 'blosc-zstd']
+_blosc2_methods = ['blosc2-blosclz', 'blosc2-lz4', 'blosc2-lz4hc', 'blosc2-zlib', 'blosc2-zstd']
+_optional_methods = {'zstd': 'zstandard', 'lz4': 'lz4'}
+_optional_methods.update({m: 'blosc' for m in _blosc_methods})
+_optional_methods.update({m: 'blosc2' for m in _blosc2_methods})
+
 
-_blosc_methods = ['blosc-blosclz', 'blosc-lz4']
 try:
     import blosc
     HAVE_BLOSC = True
-    compression_methods.extend(_blosc_methods)
 except ImportError:
     HAVE_BLOSC = False
 
+try:
+    import blosc2
+    HAVE_BLOSC2 = True
+except ImportError:
+    HAVE_BLOSC2 = False
+
+try:
+    import zstandard
+    HAVE_ZSTD = True
+except ImportError:
+    HAVE_ZSTD = False
+
+try:
+    import lz4.frame
+    HAVE_LZ4 = True
+except ImportError:
+    HAVE_LZ4 = False
+
+
+if HAVE_BLOSC:
+    _blosc_shuffles = {'none': blosc.NOSHUFFLE, 'byte': blosc.SHUFFLE, 'bit': blosc.BITSHUFFLE}
+
+    # the number of threads of blosc is a setting of the whole process: it
+    # is set once, by the first stream that asks for it
+    _blosc_nthreads = None
+
+    def _set_blosc_nthreads(nthreads):
+        global _blosc_nthreads
+        if nthreads == _blosc_nthreads:
+            return
+        if _blosc_nthreads is not None:
+            raise ValueError("blosc already uses %d threads in this process; use blosc2 "
+                             "to set nthreads per stream" % _blosc_nthreads)
+        blosc.set_nthreads(nthreads)
+        _blosc_nthreads = nthreads
+
+    def _make_blosc_compress(cname):
+        def compress(data, itemsize, clevel=9, shuffle='byte', nthreads=None):
+            if nthreads is not None:
+                _set_blosc_nthreads(nthreads)
+            return blosc.compress(data, min(itemsize, blosc.MAX_TYPESIZE), clevel=clevel,
+                                  shuffle=_blosc_shuffles[shuffle], cname=cname)
+        return compress
+
+    for method in _blosc_methods:
+        cname = method[6:]
+        if cname in blosc.compressor_list():
+            register_compression(method, _make_blosc_compress(cname), blosc.decompress)
+
+
+if HAVE_BLOSC2:
+    _blosc2_shuffles = {'none': blosc2.Filter.NOFILTER, 'byte': blosc2.Filter.SHUFFLE,
+                        'bit': blosc2.Filter.BITSHUFFLE}
+
+    def _make_blosc2_compress(codec):
+        def compress(data, itemsize, clevel=5, shuffle='bit', nthreads=None):
+            # compress2 takes the number of threads for this call only
+            cparams = {} if nthreads is None else {'nthreads': nthreads}
+            return blosc2.compress2(data, typesize=min(itemsize, 255), clevel=clevel,
+                                    filters=[_blosc2_shuffles[shuffle]], filters_meta=[0],
+                                    codec=codec, **cparams)
+        return compress
+
+    for method in _blosc2_methods:
+        register_compression(method, _make_blosc2_compress(getattr(blosc2.Codec, method[7:].upper())),
+                             blosc2.decompress2)
+
+
+if HAVE_ZSTD:
+    _zstd_compressors = {}
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+
+    def _zstd_compress(data, itemsize, level=3, nthreads=0):
+        # compressor objects are reusable and expensive to create
+        key = (level, nthreads)
+        if key not in _zstd_compressors:
+            _zstd_compressors[key] = zstandard.ZstdCompressor(level=level, threads=nthreads)
+        return _zstd_compressors[key].compress(data)
+
+    register_compression('zstd', _zstd_compress, _zstd_decompressor.decompress)
+
 
-def compress(data, method, *args, **kwds):
+if HAVE_LZ4:
+    def _lz4_compress(data, itemsize, level=0):
+        return lz4.frame.compress(data, compression_level=level)
+
+    register_compression('lz4', _lz4_compress, lz4.frame.decompress)
+
+
+def _zlib_compress(data, itemsize, level=1):
+    return zlib.compress(data, level)
+
+register_compression('zlib', _zlib_compress, zlib.decompress)
+
+
+# delta-zlib is meant for integer signals such as int16 electrophysiology:
+# items are replaced by their difference with the item *lag* positions earlier
+# (use lag=nb_channel for C-contiguous (time, channel) chunks), then bytes
+# are shuffled so that the (mostly zero) high bytes are grouped together.
+# Arithmetic wraps around, so this is lossless for any dtype.
+_delta_header = struct.Struct('!BI')
+
+def _delta_compress(data, itemsize, level=1, lag=1):
+    if itemsize not in (1, 2, 4, 8):
+        raise ValueError("delta-zlib compression requires items of 1, 2, 4 or 8 bytes")
+    arr = np.frombuffer(data, dtype='u%d' % itemsize)
+    if arr.size % lag != 0:
+        lag = 1
+    delta = arr.copy()
+    delta[lag:] -= arr[:-lag]
+    shuffled = delta.view('u1').reshape(-1, itemsize).T.copy()
+    return _delta_header.pack(itemsize, lag) + zlib.compress(shuffled, level)
+
+def _delta_decompress(data):
+    itemsize, lag = _delta_header.unpack_from(data)
+    shuffled = np.frombuffer(zlib.decompress(memoryview(data)[_delta_header.size:]), dtype='u1')
+    delta = shuffled.reshape(itemsize, -1).T.copy().view('u%d' % itemsize).reshape(-1, lag)
+    return np.cumsum(delta, axis=0, dtype=delta.dtype).reshape(-1).data
+
+register_compression('delta-zlib', _delta_compress, _delta_decompress)
+
+
+compression_methods.append('auto')
+
+
+class AutoCompressor:
+    """Compressor that picks the compression method of a stream by itself.
+
+    Every *interval* chunks, the chunk is compressed with all *candidates*
+    (by default all available methods) and the method with the lowest cost is
+    kept for the next chunks. The cost of a method is the time spent compressing
+    plus the time needed to send the result at *bandwidth* (bytes/s), so that
+    fast links favor fast codecs and slow links favor strong ones.
+
+    The name of the method is sent with each chunk (at the end of its header,
+    see :func:`auto_trailer`), so receivers only need ``compression='auto'``.
+    If no candidate can compress the data, chunks are sent uncompressed.
+
+    Parameters
+    ----------
+    candidates : list or None
+        Names of the compression methods to try.
+    bandwidth : float
+        Expected bandwidth of the link in bytes/s. Default is 1 Gb/s.
+    interval : int
+        Number of chunks between two evaluations.
+    
+    Candidate methods are used with their default options.
+    """
+    def __init__(self, candidates=None, bandwidth=125e6, interval=1000):
+        if candidates is None:
+            candidates = [m for m in compression_methods if m != 'auto']
+        for method in candidates:
+            _check_method(method)
+        self.candidates = candidates
+        self.bandwidth = bandwidth
+        self.interval = interval
+        self.method = None
+        self.count = 0
+
+    def compress(self, data, itemsize):
+        """Return the name of the method used and the compressed data.
+        """
+        if self.count % self.interval == 0:
+            self._choose(data, itemsize)
+        self.count += 1
+        return self.method, compress(data, self.method, itemsize)
+
+    def _choose(self, data, itemsize):
+        best = None
+        for method in self.candidates:
+            start = time.perf_counter()
+            try:
+                size = memoryview(compress(data, method, itemsize)).nbytes
+            except ValueError:
+                # some methods only support some dtypes
+                continue
+            cost = time.perf_counter() - start + size / self.bandwidth
+            if best is None or cost < best[0]:
+                best = (cost, method)
+        # fall back to no compression if no candidate is usable
+        self.method = '' if best is None else best[1]
+
+
+def auto_trailer(method):
+    """Return the bytes that identify *method* at the end of the header of
+    chunks compressed with 'auto' (see :func:`split_auto_trailer`).
+    """
+    name = method.encode()
+    return name + bytes([len(name)])
+
+
+def split_auto_trailer(header):
+    """Split the header of a chunk compressed with 'auto' into the header
+    itself and the name of the method that was used.
+    """
+    n = header[-1]
+    return header[:-n-1], bytes(header[-n-1:-1]).decode()
+
+
+def compress(data, method, itemsize=1, **opts):
     if method == '':
         return data
     _check_method(method)
-    
-    if method.startswith('blosc-'):
-        kwds['cname'] = method[6:]
-        data = blosc.compress(data, *args, **kwds)
-    else:
-        raise ValueError("Unknown compression method '%s'" % method)
-    
-    return data
+
+    if method == 'auto':
+        raise ValueError("'auto' compression requires an AutoCompressor")
+    return _codecs[method][0](data, itemsize, **opts)
 
 
 def decompress(data, method, *args, **kwds):
     if method == '':
         return data
     _check_method(method)
-    
-    if method.startswith('blosc-'):
-        return blosc.decompress(data)
-    else:
-        raise ValueError("Unknown compression method '%s'" % method)
+
+    if method == 'auto':
+        raise ValueError("'auto' compressed data must be decompressed with the method of its header")
+    return _codecs[method][1](data)
 
 
 def _check_method(method):
     if method not in compression_methods:
-        if method in _blosc_methods:
-            raise ValueError("Cannot use %s compression; blosc package is not importable." % method)
+        if method in _optional_methods:
+            raise ValueError("Cannot use %s compression; %s package is not importable." % (method, _optional_methods[method]))
         else:
             raise ValueError('Unknown compression method "%s"' % method)
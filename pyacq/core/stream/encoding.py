@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+
+"""
+Encoding stages applied to plaindata chunks before sending them (see
+``DataSender.funcs``) and their inverse applied after receiving them (see
+``DataReceiver.funcs``).
+
+Lossless predictive encoding of integer signals
+-----------------------------------------------
+
+Samples of a continuous signal are close to what can be predicted from the
+previous samples, so sending the prediction error instead of the samples
+gives small values that compress much better (see the 'delta-zlib', 'blosc-*'
+or 'zstd' compression methods).
+
+The predictor of order *p* is the polynomial extrapolation of the *p*
+previous samples along the time axis (order 1 is the first difference,
+order 2 the linear prediction ``2*x[n-1] - x[n-2]``, ...). Integer arithmetic
+wraps around, so the encoding is exact for any integer dtype.
+
+Encoders and decoders are stateful: each chunk is predicted from the last
+samples of the previous chunk. To let receivers connect at any time and to
+recover from lost chunks, every chunk that contains a sample whose index is
+a multiple of *keyframe_interval* is a keyframe, encoded without history.
+Both sides decide this from the chunk indexes only. The sender also encodes
+a chunk without history when it does not follow the previous chunk (the
+sender skipped some indexes); such a chunk is marked in its message (see
+the *resync* attribute of the encoder and decoder), so that receivers do not
+mistake the gap for lost chunks.
+
+Quantization of float signals
+-----------------------------
+
+Float samples are sent as integers ``q = round((x - offset) / scale)`` and
+restored as ``offset + scale * q``. 'int24' is sent as packed 3-byte
+little-endian integers (numpy dtype 'V3').
+"""
+
+import numpy as np
+
+
+def _check_dtype(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.kind not in 'iu':
+        raise ValueError("Predictive encoding requires an integer dtype, not %s" % dtype)
+    return dtype
+
+
+def _is_keyframe(start, stop, keyframe_interval):
+    # True if [start, stop) contains a multiple of keyframe_interval
+    return start % keyframe_interval == 0 or start // keyframe_interval != (stop - 1) // keyframe_interval
+
+
+class PredictiveEncoder:
+    """Pre-processing function that replaces each sample of a chunk by its
+    prediction error.
+
+    Instances are appended to ``DataSender.funcs`` and called with
+    ``(index, data)`` for each chunk; see :class:`PredictiveDecoder` for the
+    inverse.
+
+    Parameters
+    ----------
+    order : int
+        Order of the predictor (1 = first difference).
+    keyframe_interval : int
+        Chunks that contain a multiple of this sample index are encoded
+        without history.
+
+    After each call, *resync* is True if the chunk was encoded without
+    history although it is not a keyframe (it is the first chunk, or it does
+    not follow the previous one). The sender must then mark the chunk for the
+    decoder.
+    """
+    def __init__(self, order=1, keyframe_interval=65536):
+        if order < 1:
+            raise ValueError("Prediction order must be >= 1")
+        self.order = order
+        self.keyframe_interval = keyframe_interval
+        self._history = None
+        self._last_index = None
+        self.resync = False
+
+    def __call__(self, index, data):
+        _check_dtype(data.dtype)
+        start = index - data.shape[0]
+        keyframe = _is_keyframe(start, index, self.keyframe_interval)
+        self.resync = not keyframe and (self._history is None or self._last_index != start)
+        if keyframe or self.resync:
+            history = np.zeros((self.order,) + data.shape[1:], dtype=data.dtype)
+        else:
+            history = self._history
+
+        full = np.concatenate([history, data], axis=0)
+        self._history = full[-self.order:]
+        self._last_index = index
+        return index, np.diff(full, n=self.order, axis=0)
+
+
+class PredictiveDecoder:
+    """Post-processing function that restores the chunks encoded by a
+    :class:`PredictiveEncoder` with the same parameters.
+
+    Instances are appended to ``DataReceiver.funcs``. Chunks that cannot be
+    decoded, because the previous chunk was not received, are dropped (the
+    function returns None for the data) until the next keyframe. The number
+    of dropped chunks is counted in the *dropped* attribute.
+
+    The receiver sets *resync* to True before calling the decoder with a
+    chunk that the encoder marked (see :class:`PredictiveEncoder`).
+    """
+    def __init__(self, order=1, keyframe_interval=65536):
+        if order < 1:
+            raise ValueError("Prediction order must be >= 1")
+        self.order = order
+        self.keyframe_interval = keyframe_interval
+        self._history = None
+        self._last_index = None
+        self.dropped = 0
+        self.resync = False
+
+    def __call__(self, index, data):
+        _check_dtype(data.dtype)
+        start = index - data.shape[0]
+        if self.resync or _is_keyframe(start, index, self.keyframe_interval):
+            history = np.zeros((self.order,) + data.shape[1:], dtype=data.dtype)
+        elif self._history is not None and self._last_index == start:
+            history = self._history
+        else:
+            # out of sync: wait for the next keyframe
+            self._history = None
+            self.dropped += 1
+            return index, None
+
+        # Undo the differences one order at a time, starting from the highest.
+        # Each level is seeded with the last value of the same difference
+        # order computed on the history.
+        out = data
+        for k in range(self.order - 1, -1, -1):
+            seed = np.diff(history, n=k, axis=0)[-1]
+            out = np.cumsum(out, axis=0, dtype=data.dtype)
+            out += seed
+
+        self._history = np.concatenate([history, out], axis=0)[-self.order:]
+        self._last_index = index
+        return index, out
+
+
+def get_wire_dtype(name):
+    """Return the numpy dtype used on the wire for a stream quantized to *name*.
+    """
+    if name == 'int24':
+        return np.dtype('V3')
+    dtype = np.dtype(name)
+    if dtype.kind not in 'iu':
+        raise ValueError("Quantized streams require an integer wire dtype, not %s" % dtype)
+    return dtype
+
+
+def _int_limits(name):
+    if name == 'int24':
+        return -2**23, 2**23 - 1
+    info = np.iinfo(np.dtype(name))
+    return info.min, info.max
+
+
+class Quantizer:
+    """Pre-processing function that converts float chunks to integers.
+
+    Values outside of the range of *wire_dtype* are clipped.
+
+    Parameters
+    ----------
+    scale : float or array
+        Quantization step (may be given per channel).
+    offset : float or array or None
+        Value sent as 0.
+    wire_dtype : str
+        Integer dtype sent on the wire, or 'int24'.
+    """
+    def __init__(self, scale, offset, wire_dtype):
+        if scale is None:
+            raise ValueError("Quantized streams require a scale")
+        self.scale = np.asarray(scale)
+        self.offset = np.asarray(0. if offset is None else offset)
+        self.wire_dtype = wire_dtype
+        self._dtype = get_wire_dtype(wire_dtype)
+        self._limits = _int_limits(wire_dtype)
+
+    def __call__(self, index, data):
+        q = (data - self.offset) / self.scale
+        np.rint(q, out=q)
+        np.clip(q, *self._limits, out=q)
+        if self.wire_dtype == 'int24':
+            b = q.astype('<i4').view('u1').reshape(q.shape + (4,))
+            return index, np.ascontiguousarray(b[..., :3]).view('V3').reshape(q.shape)
+        return index, q.astype(self._dtype)
+
+
+class Dequantizer:
+    """Post-processing function that restores the chunks converted by a
+    :class:`Quantizer` with the same parameters.
+
+    If *dtype* is None, the integer values are returned as they were sent
+    ('int24' is returned as int32).
+    """
+    def __init__(self, scale, offset, wire_dtype, dtype=None):
+        self.scale = np.asarray(scale)
+        self.offset = np.asarray(0. if offset is None else offset)
+        self.wire_dtype = wire_dtype
+        self.dtype = dtype
+
+    def __call__(self, index, data):
+        if self.wire_dtype == 'int24':
+            b = np.empty(data.shape + (4,), dtype='u1')
+            b[..., :3] = data.view('u1').reshape(data.shape + (3,))
+            # sign extension
+            b[..., 3] = np.where(b[..., 2] & 0x80, 0xff, 0)
+            data = b.view('<i4').reshape(data.shape)
+        if self.dtype is None:
+            return index, data
+        out = data.astype(self.dtype)
+        out *= self.scale
+        out += self.offset
+        return index, out
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+
+import collections
+import threading
+import weakref
+import zmq
+
+from .streamhelpers import DataReceiver
+
+
+class LocalReceiver(DataReceiver):
+    """Receiver used by an InputStream connected to an OutputStream of the
+    same process (see *inprocess* in :func:`OutputStream.configure`).
+
+    The OutputStream appends ``(index, data, timestamp, send_time)`` tuples to
+    the queue of the receiver, so chunks are passed by reference without serialization. The
+    socket of the InputStream only carries empty notifications that wake up
+    pollers (``zmq.Poller``, :class:`ThreadPollInput`, asyncio); the queue is
+    what tells if chunks are available.
+
+    Like with zmq.PUB/SUB, new chunks are dropped when *maxlen* chunks are
+    waiting (see :func:`InputStream.drop_stats`), or the sender waits for
+    room in the queue if the stream is lossless.
+    """
+    def __init__(self, socket, params, output, maxlen=1000):
+        DataReceiver.__init__(self, socket, params)
+        self.output = weakref.ref(output)
+        self.maxlen = maxlen
+        self.queue = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def push(self, chunks, timestamps, sent, block=False):
+        """Append chunks to the queue; called by the OutputStream from the
+        sending thread.
+
+        *sent* is the list of the times at which the chunks were given to the
+        OutputStream (see *latency* in :func:`OutputStream.configure`).
+        Return True if the sender had to wait for the receiver.
+        """
+        blocked = False
+        if not self._latency:
+            sent = [None] * len(chunks)
+        with self._cond:
+            for (index, data), timestamp, sent_time in zip(chunks, timestamps, sent):
+                while len(self.queue) >= self.maxlen and block and not self._closed:
+                    blocked = True
+                    self._cond.wait()
+                if len(self.queue) < self.maxlen:
+                    self.queue.append((index, data, timestamp, sent_time))
+        return blocked
+
+    def poll(self, timeout=None):
+        if len(self.queue) > 0:
+            return True
+        # discard notifications of chunks that were already received, then
+        # check again for chunks pushed in the meantime
+        self._drain()
+        if len(self.queue) > 0:
+            return True
+        if timeout != 0:
+            self.socket.poll(timeout=timeout)
+        return len(self.queue) > 0
+
+    def _drain(self):
+        while self.socket.poll(timeout=0):
+            self.socket.recv()
+
+    def recv(self, return_data=True):
+        while len(self.queue) == 0:
+            self.poll()
+        with self._cond:
+            index, data, timestamp, sent = self.queue.popleft()
+            self._cond.notify()
+        self._stamped(index, len(data), timestamp, sent)
+        if len(self.queue) == 0:
+            self._drain()
+        if return_data:
+            # receivers must not modify the chunks of the sender
+            data = data.view()
+            data.flags.writeable = False
+        else:
+            data = None
+        return index, data
+
+    def queue_depth(self):
+        return len(self.queue)
+    
+    def recv_many(self, **kargs):
+        chunks = [self.recv(**kargs)]
+        while len(self.queue) > 0:
+            chunks.append(self.recv(**kargs))
+        return chunks
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        output = self.output()
+        if output is not None:
+            output._remove_local_receiver(self)
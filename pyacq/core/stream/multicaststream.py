@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+
+import socket as pysocket
+import struct
+import select
+import random
+import sys
+import time
+import logging
+
+from .streamhelpers import DataSender, register_transfermode
+from .plaindatastream import PlainDataSender, PlainDataReceiver
+
+
+logger = logging.getLogger(__name__)
+
+# Each chunk is serialized like with 'plaindata' (see PlainDataSender) into a
+# message: stat length (uint16), stat, data. Messages are split into
+# datagrams that start with: stream id, message sequence number, fragment
+# number and number of fragments. Streams that share a group and a port are
+# told apart by their random id.
+_packet_struct = struct.Struct('!IQHH')
+_stat_len_struct = struct.Struct('!H')
+
+
+class MulticastSender(PlainDataSender):
+    """Stream sender that broadcasts data to all InputStreams with UDP
+    multicast, so that the data is sent only once on the network whatever
+    the number of receivers.
+
+    Note: this class is usually not instantiated directly; use
+    ``OutputStream.configure(transfermode='multicast')``.
+
+    Chunks are serialized like with 'plaindata' (compression, prediction and
+    quantization are supported) and split into datagrams of at most
+    *udp_packet_size* bytes. UDP does not retransmit lost datagrams: a chunk
+    with a missing datagram is lost and is reported as a gap by
+    :func:`InputStream.drop_stats`.
+
+    Extra parameters accepted when configuring the output stream:
+
+    * multicast_group (str) the multicast address (default '239.255.0.1').
+    * multicast_port (int or None) the UDP port. By default a free port of
+      this host is used.
+    * multicast_ttl (int) the number of routers that datagrams may cross.
+      The default (1) keeps them on the local network.
+    * multicast_interface (str) the address of the network interface that
+      sends (and receives) the datagrams; '127.0.0.1' for local tests. By
+      default the system chooses.
+    * udp_packet_size (int) the maximum size of datagrams. The default (1472)
+      fits the 1500 bytes MTU of Ethernet; larger datagrams are fragmented
+      by IP and are more likely to be lost.
+
+    Datagrams carry a random stream id (``params['multicast_stream_id']``),
+    so that receivers ignore the datagrams of other streams sent to the same
+    group and port.
+    """
+    def __init__(self, socket, params):
+        PlainDataSender.__init__(self, socket, params)
+        if not self.params.get('multicast_stream_id'):
+            self.params['multicast_stream_id'] = random.SystemRandom().randrange(1, 2**32)
+        self._stream_id = self.params['multicast_stream_id']
+        self.udp_socket = pysocket.socket(pysocket.AF_INET, pysocket.SOCK_DGRAM, pysocket.IPPROTO_UDP)
+        self.udp_socket.setsockopt(pysocket.IPPROTO_IP, pysocket.IP_MULTICAST_TTL, self.params['multicast_ttl'])
+        if self.params['multicast_interface'] is not None:
+            self.udp_socket.setsockopt(pysocket.IPPROTO_IP, pysocket.IP_MULTICAST_IF,
+                                       pysocket.inet_aton(self.params['multicast_interface']))
+        if not self.params['multicast_port']:
+            # the port must be known before receivers connect
+            tmp = pysocket.socket(pysocket.AF_INET, pysocket.SOCK_DGRAM)
+            tmp.bind(('', 0))
+            self.params['multicast_port'] = tmp.getsockname()[1]
+            tmp.close()
+        self._addr = (self.params['multicast_group'], self.params['multicast_port'])
+        self._max_payload = self.params['udp_packet_size'] - _packet_struct.size
+        self._seq = 0
+
+    def send(self, index, data, timestamp=None, sent=None):
+        stat, buf = self._pack(index, data, timestamp, sent)
+        self._send_message(stat, buf)
+
+    def send_many(self, chunks, timestamps=None, sent=None):
+        DataSender.send_many(self, chunks, timestamps, sent)
+
+    def _send_message(self, stat, buf):
+        message = memoryview(b''.join([_stat_len_struct.pack(len(stat)), stat, buf]))
+        n = max(1, -(-len(message) // self._max_payload))
+        if n > 0xffff:
+            raise ValueError("Chunk is too large for multicast (%d bytes)" % len(message))
+        for i in range(n):
+            header = _packet_struct.pack(self._stream_id, self._seq, i, n)
+            self.udp_socket.sendto(header + message[i*self._max_payload:(i+1)*self._max_payload], self._addr)
+        self._seq += 1
+
+    def close(self):
+        self.udp_socket.close()
+
+
+class MulticastReceiver(PlainDataReceiver):
+    """Receiver for streams with ``transfermode='multicast'``.
+
+    Datagrams are read without blocking and reassembled into chunks; pollers
+    wait on the UDP socket (see *pollable*). The number of messages that were
+    lost (or could not be reassembled) is counted in *nb_lost_messages*.
+    Datagrams of other streams and malformed datagrams are dropped and
+    counted in *nb_invalid_packets*.
+    """
+    def __init__(self, socket, params):
+        PlainDataReceiver.__init__(self, socket, params)
+        group, port = self.params['multicast_group'], self.params['multicast_port']
+        interface = self.params['multicast_interface'] or '0.0.0.0'
+
+        self.udp_socket = pysocket.socket(pysocket.AF_INET, pysocket.SOCK_DGRAM, pysocket.IPPROTO_UDP)
+        # several receivers of the same host listen on the same port
+        self.udp_socket.setsockopt(pysocket.SOL_SOCKET, pysocket.SO_REUSEADDR, 1)
+        if hasattr(pysocket, 'SO_REUSEPORT'):
+            self.udp_socket.setsockopt(pysocket.SOL_SOCKET, pysocket.SO_REUSEPORT, 1)
+        self.udp_socket.setsockopt(pysocket.SOL_SOCKET, pysocket.SO_RCVBUF, 4 * 2**20)
+        # binding to the group only receives the datagrams sent to this
+        # group (Windows only accepts a local address)
+        self.udp_socket.bind(('' if sys.platform.startswith('win') else group, port))
+        self._mreq = struct.pack('4s4s', pysocket.inet_aton(group), pysocket.inet_aton(interface))
+        self.udp_socket.setsockopt(pysocket.IPPROTO_IP, pysocket.IP_ADD_MEMBERSHIP, self._mreq)
+        self.udp_socket.setblocking(False)
+        self.pollable = self.udp_socket
+
+        self._stream_id = self.params['multicast_stream_id']
+        # message being reassembled
+        self._seq = None
+        self._fragments = None
+        self._missing = 0
+        # sequence number of the next message
+        self._next_seq = None
+        self.nb_lost_messages = 0
+        self.nb_invalid_packets = 0
+
+    def poll(self, timeout=None):
+        if len(self._queue) > 0:
+            return True
+        deadline = None if timeout is None else time.perf_counter() + timeout / 1000.
+        while True:
+            self._read_packets()
+            if len(self._queue) > 0:
+                return True
+            wait = None if deadline is None else deadline - time.perf_counter()
+            if wait is not None and wait <= 0:
+                return False
+            select.select([self.udp_socket], [], [], wait)
+
+    def recv(self, return_data=True):
+        while len(self._queue) == 0:
+            self.poll()
+        index, data = self._queue.popleft()
+        return index, (data if return_data else None)
+
+    def recv_many(self, return_data=True):
+        chunks = [self.recv(return_data=return_data)]
+        self._read_packets()
+        while len(self._queue) > 0:
+            chunks.append(self.recv(return_data=return_data))
+        return chunks
+
+    def _read_packets(self):
+        while True:
+            try:
+                packet = self.udp_socket.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            if len(packet) < _packet_struct.size:
+                self.nb_invalid_packets += 1
+                continue
+            stream_id, seq, frag, nfrag = _packet_struct.unpack_from(packet)
+            if stream_id != self._stream_id or frag >= nfrag or \
+                    (seq == self._seq and nfrag != len(self._fragments)):
+                self.nb_invalid_packets += 1
+                continue
+            if seq != self._seq:
+                if self._next_seq is not None and seq < self._next_seq:
+                    # late datagram of a message that was already dropped
+                    continue
+                # start a new message; an incomplete one is lost
+                self._seq = seq
+                self._fragments = [None] * nfrag
+                self._missing = nfrag
+            if self._fragments[frag] is None:
+                self._fragments[frag] = packet[_packet_struct.size:]
+                self._missing -= 1
+            if self._missing == 0:
+                self._complete_message()
+
+    def _complete_message(self):
+        seq = self._seq
+        if self._next_seq is not None and seq > self._next_seq:
+            self.nb_lost_messages += seq - self._next_seq
+            logger.debug("multicast stream: %d messages lost before %d", seq - self._next_seq, seq)
+        self._next_seq = seq + 1
+
+        message = b''.join(self._fragments)
+        self._seq, self._fragments = None, None
+        start = _stat_len_struct.size
+        if len(message) < start or _stat_len_struct.unpack_from(message)[0] > len(message) - start:
+            self.nb_invalid_packets += 1
+            return
+        stat_len = _stat_len_struct.unpack_from(message)[0]
+        stat = message[start:start + stat_len]
+        data = memoryview(message)[start + stat_len:]
+        chunk = self._unpack(stat, data, True)
+        if chunk is not None:
+            self._queue.append(chunk)
+
+    def close(self):
+        try:
+            self.udp_socket.setsockopt(pysocket.IPPROTO_IP, pysocket.IP_DROP_MEMBERSHIP, self._mreq)
+        except OSError:
+            pass
+        self.udp_socket.close()
+
+
+register_transfermode('multicast', MulticastSender, MulticastReceiver)
@@ -3,11 +3,34 @@
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
 import struct
+import time
+import collections
 import numpy as np
 
 from .streamhelpers import DataSender, DataReceiver, register_transfermode
 from .arraytools import is_contiguous, decompose_array, make_dtype
-from .compression import compress, decompress
+from .compression import compress, decompress, AutoCompressor, _check_method, auto_trailer, split_auto_trailer
+from .encoding import PredictiveEncoder, PredictiveDecoder, Quantizer, Dequantizer, get_wire_dtype
+
+
+# Each chunk is sent with a header made of uint64 fields:
+#   ndim, index, offset, shape[0..ndim], strides[0..ndim] (int64)
+# Chunks that are C-contiguous and have the frame shape declared in the stream
+# params use a short header instead, marked with ndim=0 (a real chunk always
+# has at least a time axis):
+#   0, index, shape[0]
+# With prediction_order > 0, one more byte is 1 for chunks that the
+# PredictiveEncoder marked with resync, 0 otherwise.
+_ndim_struct = struct.Struct('!Q')
+_fast_struct = struct.Struct('!QQQ')
+_header_structs = {}
+
+def _header_struct(ndim):
+    st = _header_structs.get(ndim)
+    if st is None:
+        st = struct.Struct('!' + 'Q' * (3+ndim) + 'q' * ndim)
+        _header_structs[ndim] = st
+    return st
 
 
 class PlainDataSender(DataSender):
@@ -19,60 +42,220 @@ class PlainDataSender(DataSender):
     To avoid unnecessary copies (and thus optimize transmission speed), data is
     sent exactly as it appears in memory including array strides.
     
-    This class supports compression.
+    This class supports compression (see ``compression`` and
+    ``compression_opts`` in :func:`OutputStream.configure`) and lossless
+    predictive encoding of integer signals (see ``prediction_order``) and
+    quantization of float signals (see ``wire_dtype``).
+    
+    Chunks given to :func:`OutputStream.send_many` are packed together in a
+    single multipart message.
     """
-    def send(self, index, data):
+    def __init__(self, socket, params):
+        DataSender.__init__(self, socket, params)
+        self._frame_shape = tuple(self.params['shape'][1:])
+        
+        comp = self.params['compression']
+        _check_method(comp)
+        opts = self.params['compression_opts'] or {}
+        if comp == 'auto':
+            self._compressor = AutoCompressor(**opts)
+        else:
+            self._compressor = None
+        self._compression_opts = opts
+        
+        if self.params['wire_dtype'] is not None:
+            if self.params['wire_dtype'] == 'int24' and self.params['prediction_order'] > 0:
+                raise ValueError("Predictive encoding is not supported with wire_dtype='int24'")
+            self.funcs.append(Quantizer(self.params['scale'], self.params['offset'],
+                                        self.params['wire_dtype']))
+        if self.params['prediction_order'] > 0:
+            self._encoder = PredictiveEncoder(self.params['prediction_order'],
+                                              self.params['keyframe_interval'])
+            self.funcs.append(self._encoder)
+        else:
+            self._encoder = None
+    
+    def send(self, index, data, timestamp=None, sent=None):
+        stat, buf = self._pack(index, data, timestamp, sent)
+        copy = self.params.get('copy', False)
+        self._send_multipart([stat, buf], copy=copy)
+    
+    def send_many(self, chunks, timestamps=None, sent=None):
+        # All chunks travel in a single multipart message: (stat, buf) pairs.
+        if timestamps is None:
+            timestamps = [None] * len(chunks)
+        if sent is None:
+            sent = [None] * len(chunks)
+        frames = []
+        for (index, data), timestamp, sent_time in zip(chunks, timestamps, sent):
+            frames.extend(self._pack(index, data, timestamp, sent_time))
+        copy = self.params.get('copy', False)
+        self._send_multipart(frames, copy=copy)
+    
+    def _pack(self, index, data, timestamp=None, sent=None):
         # optional pre-processing before send
         if isinstance(data, np.ndarray):
             for f in self.funcs:
                 index, data = f(index, data)
+        if self._encoder is not None:
+            resync = b'\x01' if self._encoder.resync else b'\x00'
+        else:
+            resync = b''
                 
-        # serialize
-        dtype = data.dtype
         shape = data.shape
+        if data.flags['C_CONTIGUOUS'] and shape[1:] == self._frame_shape:
+            # fast path: no need to describe the memory layout
+            stat = _fast_struct.pack(0, index, shape[0])
+            buf, trailer = self._compress(data)
+            return self._stamp(stat + resync + trailer, timestamp, sent), buf
+        
+        # serialize
         buf, offset, strides = decompose_array(data)
         
         # compress
-        comp = self.params['compression']
-        buf = compress(buf, comp, data.itemsize)
+        buf, trailer = self._compress(buf)
         
-        # Pack and send
-        stat = struct.pack('!' + 'Q' * (3+len(shape)) + 'q' * len(strides), len(shape), index, offset, *(shape + strides))
-        copy = self.params.get('copy', False)
-        self.socket.send_multipart([stat, buf], copy=copy)
+        # Pack
+        stat = _header_struct(len(shape)).pack(len(shape), index, offset, *(shape + strides))
+        return self._stamp(stat + resync + trailer, timestamp, sent), buf
+    
+    def _compress(self, buf):
+        # Return the compressed buffer and the bytes to append to the header
+        # (the method chosen by the AutoCompressor).
+        if self._compressor is not None:
+            method, out = self._compressor.compress(buf, buf.itemsize)
+            trailer = auto_trailer(method)
+        else:
+            out = compress(buf, self.params['compression'], buf.itemsize, **self._compression_opts)
+            trailer = b''
+        self.nbytes_raw += buf.nbytes
+        self.nbytes_sent += memoryview(out).nbytes
+        return out, trailer
 
 
 class PlainDataReceiver(DataReceiver):
     """Helper class to receive data serialized over socket.
     
     See PlainDataSender.
+    
+    Messages are received without copy: returned arrays are read-only views
+    on the zmq frames. When the InputStream has its own RingBuffer, this
+    means the data is copied only once, directly into the buffer.
     """
     def __init__(self, socket, params):
         DataReceiver.__init__(self, socket, params)
+        self._dtype = make_dtype(self.params['dtype'])
+        wire_dtype = self.params['wire_dtype']
+        if wire_dtype is not None:
+            # quantized stream
+            dtype = self._dtype if self.params['dequantize'] else None
+            self._dtype = get_wire_dtype(wire_dtype)
+        self._frame_shape = tuple(self.params['shape'][1:])
+        # chunks already received in a multi-chunk message but not yet returned
+        self._queue = collections.deque()
+        
+        if self.params['prediction_order'] > 0:
+            self._decoder = PredictiveDecoder(self.params['prediction_order'],
+                                              self.params['keyframe_interval'])
+            self.funcs.append(self._decoder)
+        else:
+            self._decoder = None
+        if wire_dtype is not None:
+            self.funcs.append(Dequantizer(self.params['scale'], self.params['offset'],
+                                          wire_dtype, dtype))
     
-    def recv(self, return_data=True):
-        # receive and unpack structure
-        stat, data = self.socket.recv_multipart()
-        ndim = struct.unpack('!Q', stat[:8])[0]
-        stat = struct.unpack('!' + 'Q' * (ndim + 2) + 'q' * ndim, stat[8:])
-        index = stat[0]
+    def poll(self, timeout=None):
+        if len(self._queue) > 0:
+            return True
+        if not self.funcs:
+            return DataReceiver.poll(self, timeout=timeout)
         
+        # Post-processing may drop all chunks of a message (see
+        # PredictiveDecoder), so messages are decoded here: True is returned
+        # only when recv() will not block.
+        deadline = None if timeout is None else time.perf_counter() + timeout / 1000.
+        while True:
+            wait = None if deadline is None else max(0, int((deadline - time.perf_counter()) * 1000))
+            if not DataReceiver.poll(self, timeout=wait):
+                return False
+            self._queue.extend(self._recv_message(True))
+            if len(self._queue) > 0:
+                return True
+            if wait == 0:
+                return False
+    
+    def queue_depth(self):
+        return len(self._queue)
+    
+    def recv(self, return_data=True):
+        while len(self._queue) == 0:
+            self._queue.extend(self._recv_message(return_data))
+        index, data = self._queue.popleft()
+        # chunks decoded by poll() always have their data
+        return index, (data if return_data else None)
+    
+    def recv_many(self, return_data=True):
+        chunks = list(self._queue)
+        self._queue.clear()
+        while len(chunks) == 0:
+            chunks.extend(self._recv_message(return_data))
+        while self.socket.poll(timeout=0):
+            chunks.extend(self._recv_message(return_data))
         if not return_data:
-            return index, None
+            chunks = [(index, None) for index, data in chunks]
+        return chunks
+    
+    def _recv_message(self, return_data):
+        # a message contains one or more (stat, data) pairs; see send_many()
+        frames = self.socket.recv_multipart(copy=False)
+        chunks = [self._unpack(frames[i].bytes, frames[i+1].buffer, return_data) for i in range(0, len(frames), 2)]
+        if self.funcs:
+            # post-processing may drop chunks that cannot be decoded
+            chunks = [chunk for chunk in chunks if chunk is not None]
+        return chunks
+    
+    def _unpack(self, stat, data, return_data):
+        # unpack structure (stat is bytes, data a buffer)
+        stat, timestamp, sent = self._unstamp(stat)
+        comp = self.params['compression']
+        if comp == 'auto':
+            stat, comp = split_auto_trailer(stat)
+        if self._decoder is not None:
+            self._decoder.resync = stat[-1] == 1
+            stat = stat[:-1]
+        ndim = _ndim_struct.unpack_from(stat)[0]
+        if ndim == 0:
+            index, length = _fast_struct.unpack(stat)[1:]
+        else:
+            stat = _header_struct(ndim).unpack(stat)
+            index, length = stat[1], stat[3]
+        self._stamped(index, length, timestamp, sent)
         
-        offset = stat[1]
-        shape = stat[2:2+ndim]
-        strides = stat[-ndim:]
+        if not return_data and not self.funcs:
+            return index, None
         
         # uncompress
-        comp = self.params['compression']
-        data = decompress(data, comp)
+        if comp != '':
+            data = decompress(data, comp)
+            self.nbytes_copied += memoryview(data).nbytes
         
         # convert to array
-        dtype = make_dtype(self.params['dtype']) # this avoid some bugs but is not efficient because this is call every sends...
-        #~ dtype = self.params['dtype']
-        data = np.ndarray(buffer=data, shape=shape,
-                          strides=strides, offset=offset, dtype=dtype)        
+        if ndim == 0:
+            data = np.ndarray(buffer=data, shape=(length,) + self._frame_shape, dtype=self._dtype)
+        else:
+            offset = stat[2]
+            shape = stat[3:3+ndim]
+            strides = stat[-ndim:]
+            data = np.ndarray(buffer=data, shape=shape,
+                              strides=strides, offset=offset, dtype=self._dtype)
+        
+        # optional post-processing after receive
+        for f in self.funcs:
+            index, data = f(index, data)
+            if data is None:
+                return None
+        if not return_data:
+            data = None
         return index, data
 
 
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+
+import numpy as np
+
+from .sharedarray import SharedMem
+from .arraytools import make_dtype
+
+
+# Size of the length prefix of each record. Records are padded to a multiple
+# of this size so that payloads stay 8-byte aligned.
+_prefix = 8
+
+
+def _padded(length):
+    return _prefix + (length + _prefix - 1) // _prefix * _prefix
+
+
+class RecordRingBuffer:
+    """Ring buffer of variable-size records, such as events.
+
+    Records are numbered by an absolute index like the samples of a
+    :class:`RingBuffer`, and any range of recent records can be read back.
+    The buffer is made of two rings:
+
+    * a byte ring where each record is written as a length prefix followed by
+      its payload. A record never wraps around the end of the ring; it is
+      written at the beginning instead.
+    * an index ring that holds the position of each record in the byte ring.
+
+    Records are either rows of arrays with a fixed *dtype* and frame shape
+    (``shape[1:]``), or arbitrary bytes objects when *dtype* is object.
+    Reading consecutive array records that are adjacent in the byte ring
+    returns a strided view on the buffer without copy.
+
+    Parameters
+    ----------
+    shape : tuple
+        ``(nb_record,) + frame_shape``; the number of records that are kept.
+    dtype : dtype
+        The dtype of records, or object for variable-size bytes records.
+    nbytes : int or None
+        Size of the byte ring. By default, *nb_record* fixed-size records fit
+        in the ring (this must be given for variable-size records).
+    shmem : None, True or str
+        If None, the buffer is allocated in local memory. If True, a new
+        :class:`SharedMem` is created with the *shm_backend* and
+        *shm_hugepage* options. If a string, it is the shm_id of an existing
+        buffer to open.
+    """
+    def __init__(self, shape, dtype, nbytes=None, shmem=None, shm_backend=None, shm_hugepage=False):
+        self.shape = tuple(shape)
+        self.dtype = make_dtype(dtype)
+        self.variable = self.dtype.kind == 'O'
+        nrec = self.shape[0]
+        if self.variable:
+            self.record_size = None
+            if nbytes is None:
+                raise ValueError("nbytes must be given for variable-size records")
+        else:
+            self.record_size = int(np.prod(self.shape[1:], dtype='int64')) * self.dtype.itemsize
+            if nbytes is None:
+                nbytes = nrec * _padded(self.record_size)
+        self.nbytes = nbytes
+        self.double = False
+        self.axisorder = np.arange(len(self.shape))
+
+        # header: read_index, write_index, read_pos, write_pos
+        size = 32 + nrec * 8 + nbytes
+        if shmem is None:
+            mem = np.zeros(size, dtype='u1')
+            self._shmem = None
+            self.shm_id = None
+        else:
+            if shmem is True:
+                self._shmem = SharedMem(nbytes=size, backend=shm_backend, hugepage=shm_hugepage)
+            else:
+                self._shmem = SharedMem(nbytes=size, shm_id=shmem)
+            mem = self._shmem.to_numpy(offset=0, dtype='u1', shape=(size,))
+            self.shm_id = self._shmem.shm_id
+        self._header = mem[:32].view('int64')
+        self._offsets = mem[32:32 + nrec * 8].view('int64')
+        self._data = mem[32 + nrec * 8:]
+
+        if shmem in (None, True):
+            self._header[:] = 0
+            self._offsets[:] = -1
+
+        # The header works like the indexes of RingBuffer (a seqlock): the
+        # writer first advances write_index and write_pos to mark records and
+        # bytes that are about to be overwritten, writes, then advances
+        # read_index and read_pos. Readers check the write side again after
+        # copying (see get_data(validate=True)).
+
+    def index(self):
+        """Return the index of the last written record + 1."""
+        return int(self._header[0])
+
+    def first_index(self):
+        """Return the index of the oldest record that may still be read."""
+        return int(self._header[0]) - self.shape[0]
+
+    def new_chunk(self, data, index=None):
+        """Append records to the buffer.
+
+        *data* is an array whose rows are the records or, for variable-size
+        records, a sequence of bytes-like objects. *index* is the index of the
+        last record + 1; indexes that are skipped are left empty.
+        """
+        n = len(data)
+        if index is None:
+            index = self.index() + n
+        start = index - n
+        if start < self.index():
+            raise ValueError("Record index %d is before the end of the buffer (%d)" % (start, self.index()))
+        if n > self.shape[0]:
+            raise ValueError("Chunk of %d records is too large for buffer of size %d" % (n, self.shape[0]))
+
+        if self.variable:
+            lengths = np.array([memoryview(rec).nbytes for rec in data], dtype='int64')
+        else:
+            data = np.ascontiguousarray(data, dtype=self.dtype)
+            if data.shape[1:] != self.shape[1:]:
+                raise ValueError("Records have shape %s (buffer requires %s)" % (data.shape[1:], self.shape[1:]))
+            lengths = np.full(n, self.record_size, dtype='int64')
+
+        positions = self._place(lengths)
+
+        nrec = self.shape[0]
+        self._header[1] = index
+        self._header[3] = positions[-1] + _padded(lengths[-1]) if n > 0 else self._header[2]
+
+        # skipped records
+        for i in range(self.index(), start):
+            self._offsets[i % nrec] = -1
+
+        if self.variable:
+            for rec, length, pos in zip(data, lengths, positions):
+                p = pos % self.nbytes
+                self._data[p:p + _prefix].view('int64')[0] = length
+                self._data[p + _prefix:p + _prefix + length] = np.frombuffer(rec, dtype='u1')
+        else:
+            # write runs of adjacent records at once
+            step = _padded(self.record_size)
+            rec_dtype = np.dtype({'names': ['length', 'payload'], 'formats': ['<i8', 'V%d' % self.record_size],
+                                  'offsets': [0, _prefix], 'itemsize': step})
+            payloads = data.reshape(n, -1).view('V%d' % self.record_size).reshape(n)
+            for i, j in self._runs(positions, step):
+                p = positions[i] % self.nbytes
+                region = self._data[p:p + (j - i) * step].view(rec_dtype)
+                region['length'] = self.record_size
+                region['payload'] = payloads[i:j]
+
+        self._offsets[np.arange(start, index) % nrec] = positions
+        self._header[2] = self._header[3]
+        self._header[0] = index
+
+    def _place(self, lengths):
+        # absolute positions of new records in the byte ring
+        pos = int(self._header[2])
+        if not self.variable and self.nbytes % _padded(self.record_size) == 0:
+            # fixed-size records never need to skip the end of the ring
+            return pos + np.arange(len(lengths), dtype='int64') * _padded(self.record_size)
+        positions = np.empty(len(lengths), dtype='int64')
+        for i, length in enumerate(lengths):
+            size = _padded(length)
+            if size > self.nbytes:
+                raise ValueError("Record of %d bytes is too large for buffer of %d bytes" % (length, self.nbytes))
+            if pos % self.nbytes + size > self.nbytes:
+                # do not wrap: continue at the beginning of the ring
+                pos += self.nbytes - pos % self.nbytes
+            positions[i] = pos
+            pos += size
+        return positions
+
+    def _runs(self, positions, step):
+        # yield (i, j) for runs of records written one after the other
+        # without crossing the end of the ring
+        breaks = np.nonzero((np.diff(positions) != step) | (positions[1:] % self.nbytes == 0))[0] + 1
+        bounds = [0] + breaks.tolist() + [len(positions)]
+        for i, j in zip(bounds[:-1], bounds[1:]):
+            yield i, j
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            if item < 0:
+                item += self.index()
+            return self.get_data(item, item + 1)[0]
+        if not isinstance(item, slice) or item.step not in (None, 1):
+            raise TypeError("RecordRingBuffer only supports integer and contiguous slice indexing")
+        start = self.index() + item.start if item.start is not None and item.start < 0 else item.start
+        stop = self.index() + item.stop if item.stop is not None and item.stop < 0 else item.stop
+        return self.get_data(start if start is not None else self.first_index(),
+                             stop if stop is not None else self.index())
+
+    def get_data(self, start, stop, copy=False, validate=False):
+        """Return records with indexes between *start* and *stop*.
+
+        Array records are returned as an array (a view on the buffer when the
+        records are adjacent, unless *copy* is True). Variable-size records are
+        returned as an object array of bytes. Missing records (skipped when
+        writing) are filled with zeros, or None for variable-size records.
+
+        If *validate* is True, the data is copied and an IndexError is raised if
+        it was overwritten by the writer while it was read.
+        """
+        if start < self.first_index() or start < self._header[1] - self.shape[0]:
+            raise IndexError("Records (%d, %d) are out of range; oldest record is %d" %
+                             (start, stop, max(self.first_index(), self._header[1] - self.shape[0])))
+        if stop > self.index():
+            raise IndexError("Records (%d, %d) are out of range; last record is %d" % (start, stop, self.index()))
+
+        nrec = self.shape[0]
+        positions = self._offsets[np.arange(start, stop) % nrec]
+        # with variable-size records, the byte ring may be full before the index ring
+        self._check_overwritten(start, positions)
+        if self.variable:
+            out = np.empty(stop - start, dtype=object)
+            for i, pos in enumerate(positions):
+                if pos < 0:
+                    out[i] = None
+                else:
+                    p = pos % self.nbytes
+                    length = self._data[p:p + _prefix].view('int64')[0]
+                    out[i] = self._data[p + _prefix:p + _prefix + length].tobytes()
+        else:
+            out = self._get_records(positions, copy or validate)
+
+        if validate:
+            self._check_overwritten(start, positions)
+        return out
+
+    def _get_records(self, positions, copy):
+        step = _padded(self.record_size)
+        frame_shape = self.shape[1:]
+        frame_strides = np.empty((1,) + frame_shape, dtype=self.dtype).strides[1:]
+
+        def view(i, j):
+            return np.ndarray(buffer=self._data, dtype=self.dtype, shape=(j - i,) + frame_shape,
+                              offset=int(positions[i] % self.nbytes) + _prefix,
+                              strides=(step,) + frame_strides)
+
+        runs = list(self._runs(positions, step)) if len(positions) > 0 else []
+        if len(runs) == 1 and positions[0] >= 0 and not copy:
+            return view(0, len(positions))
+
+        out = np.zeros((len(positions),) + frame_shape, dtype=self.dtype)
+        for i, j in runs:
+            if positions[i] < 0:
+                # skipped record (each one is a run of its own)
+                continue
+            out[i:j] = view(i, j)
+        return out
+
+    def _check_overwritten(self, start, positions):
+        # records and bytes may have been overwritten by a writer in another
+        # process after we started reading them
+        valid = positions[positions >= 0]
+        if start < self._header[1] - self.shape[0] or \
+                (len(valid) > 0 and valid.min() < self._header[3] - self.nbytes):
+            raise IndexError("Records starting at %d were overwritten" % start)
@@ -16,8 +16,13 @@ class RingBuffer:
     received by the stream, up to a predefined length. Double ring buffers
     allow faster, copyless reads at the expense of doubled write time and memory
     footprint.
+    
+    When *shmem* is True, the buffer is allocated in a new :class:`SharedMem`
+    created with the *shm_backend* and *shm_hugepage* options. If *shmem* is
+    a string, then it is the shm_id of an existing buffer to open.
     """
-    def __init__(self, shape, dtype, double=True, shmem=None, fill=None, axisorder=None):
+    def __init__(self, shape, dtype, double=True, shmem=None, fill=None, axisorder=None,
+                 shm_backend=None, shm_hugepage=False):
         self.double = double
         self.shape = shape
         
@@ -48,7 +53,7 @@ class RingBuffer:
             size = np.product(shape) * make_dtype(dtype).itemsize + 16
             if shmem is True:
                 # create new shared memory buffer
-                self._shmem = SharedMem(nbytes=size)
+                self._shmem = SharedMem(nbytes=size, backend=shm_backend, hugepage=shm_hugepage)
             else:
                 self._shmem = SharedMem(nbytes=size, shm_id=shmem)
             buf = self._shmem.to_numpy(offset=16, dtype=dtype, shape=nativeshape)
@@ -75,6 +80,13 @@ class RingBuffer:
         #   2. new data is written over the old buffer data
         #   3. read_index is increased to indicate that the new data is now
         #      readable
+        #
+        # Together the two indexes work like a seqlock: write_index is the
+        # sequence counter that the writer bumps *before* touching the memory,
+        # and read_index catches up once the write is complete. A reader in
+        # another process never takes a lock; instead it checks write_index
+        # again after copying a segment and discards the copy if the writer
+        # has advanced over it in the meantime (see get_data(validate=True)).
 
         #
         #              write_index-bsize     break_index      read_index       write_index
@@ -103,11 +115,11 @@ class RingBuffer:
         return self._indexes[0]
 
     def _set_write_index(self, i):
-        # what kind of protection do we need here?
+        # Aligned int64 stores are atomic, so readers never see a torn index;
+        # ordering with the data writes is what matters (see __init__).
         self._indexes[1] = i
 
     def _set_read_index(self, i):
-        # what kind of protection do we need here?
         self._indexes[0] = i
 
     def new_chunk(self, data, index=None):
@@ -119,6 +131,9 @@ class RingBuffer:
         if data.dtype != self.dtype:
             raise TypeError("Data has incorrect dtype %s (buffer requires %s)" %
                             (data.dtype, self.dtype))
+        if tuple(data.shape[1:]) != tuple(self.shape[1:]):
+            raise ValueError("Data has incorrect shape %s (buffer requires (n,) + %s)" %
+                             (data.shape, tuple(self.shape[1:])))
         
         # by default, index advances by the size of the chunk
         if index is None:
@@ -128,29 +143,24 @@ class RingBuffer:
                                                     "only advanced by %d." % 
                                                     (dsize, index-self._write_index)) 
 
-        revert_inds = [self._read_index, self._write_index]
-        try:
-            # advance write index. This immediately prevents other processes from
-            # accessing memory that is about to be overwritten.
-            self._set_write_index(index)
+        # advance write index. This immediately prevents other processes from
+        # accessing memory that is about to be overwritten.
+        # The write index is never moved back: readers rely on it to detect
+        # overwritten segments. This is why the chunk is checked above.
+        self._set_write_index(index)
+        
+        # decide if any skipped data needs to be filled in
+        fill_start = max(self._read_index, self._write_index - bsize)
+        fill_stop = self._write_index - dsize
+        
+        if fill_stop > fill_start:
+            # data was skipped; fill in missing regions with 0 or nan.
+            self._write(fill_start, fill_stop, self._filler)
+            self._set_read_index(fill_stop)
             
-            # decide if any skipped data needs to be filled in
-            fill_start = max(self._read_index, self._write_index - bsize)
-            fill_stop = self._write_index - dsize
+        self._write(self._write_index - dsize, self._write_index, data)
             
-            if fill_stop > fill_start:
-                # data was skipped; fill in missing regions with 0 or nan.
-                self._write(fill_start, fill_stop, self._filler)
-                revert_inds[1] = fill_stop
-                
-            self._write(self._write_index - dsize, self._write_index, data)
-                
-            self._set_read_index(index)
-        except:
-            # If there is a failure writing data, revert read/write pointers
-            self._set_read_index(revert_inds[0])
-            self._set_write_index(revert_inds[1])
-            raise
+        self._set_read_index(index)
 
     def _write(self, start, stop, value):
         # get starting index
@@ -199,7 +209,7 @@ class RingBuffer:
         
         return data
 
-    def get_data(self, start, stop, copy=False, join=True):
+    def get_data(self, start, stop, copy=False, join=True, validate=False):
         """Return a segment of the ring buffer.
         
         Parameters
@@ -219,8 +229,17 @@ class RingBuffer:
             for the beginning and end of the requested segment. This can be
             used to avoid an unnecessary copy when the buffer has double=False
             and the caller does not require a contiguous array.
+        validate : bool
+            If True, check after reading that the writer did not overwrite
+            the segment while it was being read (this can happen when the
+            buffer is written by another process) and raise IndexError if it
+            did. Because a reference into the buffer may be overwritten at any
+            time after it is returned, this implies ``copy=True``.
         """
-        first, last = self.first_index(), self.index()
+        # a segment is readable only if it is also behind the write index, which
+        # advances before the writer starts overwriting old data.
+        first = max(self.first_index(), self._write_index - self.shape[0])
+        last = self.index()
         if start < first or stop > last:
             raise IndexError("Requested segment (%d, %d) is out of bounds for ring buffer. "
                              "Current bounds are (%d, %d)." % (start, stop, first, last))
@@ -251,10 +270,11 @@ class RingBuffer:
                 a = self.buffer[start%bsize:]
                 b = self.buffer[:stop%bsize]
                 if join is False:
-                    if copy is True:
-                        return (a.copy(), b.copy())
-                    else:
-                        return (a, b)
+                    if copy is True or validate:
+                        a, b = a.copy(), b.copy()
+                        if validate:
+                            self._check_overwritten(start, stop)
+                    return (a, b)
                 else:
                     data = np.empty(newshape, self.buffer.dtype).transpose(np.argsort(self.axisorder))
                     #data[:break_index-start] = a #not robust if break_index==start
@@ -263,8 +283,11 @@ class RingBuffer:
                     data[a.shape[0]:] = b
                     copied = True
         
-        if copy and not copied:
+        if (copy or validate) and not copied:
             data = data.copy()
+        
+        if validate:
+            self._check_overwritten(start, stop)
             
         if join:
             return data
@@ -272,6 +295,14 @@ class RingBuffer:
             empty = np.empty((0,) + data.shape[1:], dtype=data.dtype)
             return data, empty
 
+    def _check_overwritten(self, start, stop):
+        # Second half of the seqlock read: if the write index moved past the
+        # segment while we were copying it, the copy may be torn.
+        first = self._write_index - self.shape[0]
+        if start < first:
+            raise IndexError("Requested segment (%d, %d) was overwritten while reading. "
+                             "Current bounds are (%d, %d)." % (start, stop, first, self.index()))
+
     def _interpret_index(self, index):
         """Return normalized index, accounting for negative and None values.
         Also check that the index is readable.
@@ -326,3 +357,64 @@ class RingBuffer:
             return start, stop, step
         else:
             raise TypeError("Invalid index %s" % index)
+
+
+class RingBufferView:
+    """Read-only view on a subset of the channels (axis 1) of a
+    :class:`RingBuffer`.
+    
+    Reads return views on the underlying buffer, like :func:`RingBuffer.get_data`.
+    When *channels* is a contiguous range of channels (or a slice), selecting
+    them does not copy data; other channel lists are gathered with a copy.
+    Use ``axisorder=[1, 0]`` on the underlying buffer to store each channel
+    contiguously in memory.
+    """
+    def __init__(self, buffer, channels):
+        self.base = buffer
+        if not isinstance(channels, slice):
+            channels = np.asarray(channels, dtype='int64')
+            if len(channels) > 0 and np.all(np.diff(channels) == 1):
+                channels = slice(int(channels[0]), int(channels[-1]) + 1)
+        self.channels = channels
+        nb_channel = len(np.arange(buffer.shape[1])[channels])
+        self.shape = (buffer.shape[0], nb_channel) + tuple(buffer.shape[2:])
+        self.dtype = buffer.dtype
+        self.double = buffer.double
+        self.axisorder = buffer.axisorder
+    
+    def index(self):
+        return self.base.index()
+    
+    def first_index(self):
+        return self.base.first_index()
+    
+    @property
+    def _write_index(self):
+        return self.base._write_index
+    
+    @property
+    def _read_index(self):
+        return self.base._read_index
+    
+    def get_data(self, start, stop, copy=False, join=True, validate=False):
+        """Return a segment of the selected channels.
+        
+        See :func:`RingBuffer.get_data` for parameters.
+        """
+        data = self.base.get_data(start, stop, join=join)
+        if join:
+            data = self._select(data, copy or validate)
+        else:
+            data = tuple(self._select(d, copy or validate) for d in data)
+        if validate:
+            self.base._check_overwritten(start, stop)
+        return data
+    
+    def _select(self, data, copy):
+        out = data[:, self.channels]
+        if copy and isinstance(self.channels, slice):
+            out = out.copy()
+        return out
+    
+    __getitem__ = RingBuffer.__getitem__
+    _interpret_index = RingBuffer._interpret_index
@@ -3,11 +3,20 @@
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
 import numpy as np
-import sys, random, string, tempfile, mmap
+import sys, os, random, string, tempfile, mmap
 
 
-# TODO
-# On POSIX system it can optionally the shm_open way to avoid mmap.
+shm_backends = ['tmpfile']
+if not sys.platform.startswith('win'):
+    if os.path.isdir('/dev/shm'):
+        shm_backends.append('posix')
+    if hasattr(os, 'memfd_create'):
+        shm_backends.append('memfd')
+
+
+def _random_name():
+    return ''.join(random.SystemRandom().choice(string.ascii_uppercase + string.digits) for _ in range(24))
+
 
 class SharedMem:
     """Class to create a shared memory buffer.
@@ -25,12 +34,33 @@ class SharedMem:
         The id of an existing SharedMem to open. If None, then a new shared
         memory file is created.
         On linux this is the filename, on Windows this is the tagname.
-    
+    backend : str or None
+        The method used to allocate a new buffer (ignored when *shm_id* is given
+        and on Windows). Available backends are listed in ``shm_backends``:
+        
+        * 'tmpfile': (default) a zero-filled file created in the temporary
+          directory.
+        * 'posix': a file in ``/dev/shm`` sized with ``ftruncate``; the memory
+          is never backed by disk and pages are only allocated when written.
+          The file is unlinked when the buffer is closed.
+        * 'memfd': an anonymous file created with ``memfd_create`` (linux only).
+          Other processes open it through ``/proc/<pid>/fd/<fd>``, so it
+          disappears automatically with the owner process.
+    hugepage : bool
+        If True, advise the kernel to back the mapping with transparent huge
+        pages (when supported by the platform).
     """
-    def __init__(self, nbytes, shm_id=None):
+    def __init__(self, nbytes, shm_id=None, backend=None, hugepage=False):
         self.nbytes = nbytes
         self.mmap_size = (self.nbytes // mmap.PAGESIZE + 1) * mmap.PAGESIZE
         self.shm_id = shm_id
+        if backend is None:
+            backend = 'tmpfile'
+        if shm_id is None and backend not in shm_backends:
+            raise ValueError("Unsupported shared memory backend '%s' (available: %s)" % (backend, shm_backends))
+        self.backend = backend
+        self._fd = None
+        self._unlink = None
         
         if sys.platform.startswith('win'):
             if shm_id is None:
@@ -39,7 +69,18 @@ class SharedMem:
             else:
                 self.mmap = mmap.mmap(-1, self.nbytes, self.shm_id, access=mmap.ACCESS_READ)
         else:
-            if shm_id is None:
+            if shm_id is None and backend == 'posix':
+                self.shm_id = os.path.join('/dev/shm', u'pyacq_SharedMem_' + _random_name())
+                self._fd = os.open(self.shm_id, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+                self._unlink = self.shm_id
+                os.ftruncate(self._fd, self.nbytes)
+                self.mmap = mmap.mmap(self._fd, self.nbytes, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            elif shm_id is None and backend == 'memfd':
+                self._fd = os.memfd_create(u'pyacq_SharedMem_' + _random_name())
+                os.ftruncate(self._fd, self.nbytes)
+                self.shm_id = '/proc/%d/fd/%d' % (os.getpid(), self._fd)
+                self.mmap = mmap.mmap(self._fd, self.nbytes, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            elif shm_id is None:
                 self._tmpFile = tempfile.NamedTemporaryFile(prefix=u'pyacq_SharedMem_')
                 self._tmpFile.write(b'\x00' * self.nbytes)
                 self._tmpFile.flush()  # I do not anderstand but this is needed....
@@ -48,14 +89,40 @@ class SharedMem:
             else:
                 self._tmpFile = open(self.shm_id, 'rb')
                 self.mmap = mmap.mmap(self._tmpFile.fileno(), self.nbytes, mmap.MAP_SHARED, mmap.PROT_READ)
+            
+            if hugepage and hasattr(mmap, 'MADV_HUGEPAGE'):
+                try:
+                    self.mmap.madvise(mmap.MADV_HUGEPAGE)
+                except OSError:
+                    # transparent huge pages are disabled; this is only a hint
+                    pass
                 
     def close(self):
         """Close this buffer.
         """
+        self.unlink()
         self.mmap.close()
         if not sys.platform.startswith('win') and hasattr(self, '_tmpFile'):
             self._tmpFile.close()
     
+    def unlink(self):
+        """Release the name of a buffer created with the 'posix' or 'memfd'
+        backend.
+        
+        The memory stays mapped in processes that already opened the buffer
+        and is freed by the system when the last mapping is closed, but no
+        new process can open it afterward.
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._unlink is not None:
+            try:
+                os.unlink(self._unlink)
+            except FileNotFoundError:
+                pass
+            self._unlink = None
+    
     def to_dict(self):
         """Return a dict that can be serialized and sent to other processes to
         access this buffer.
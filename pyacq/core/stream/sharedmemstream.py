@@ -6,7 +6,8 @@ import struct
 import numpy as np
 
 from .streamhelpers import DataSender, DataReceiver, register_transfermode
-from .ringbuffer import RingBuffer
+from .ringbuffer import RingBuffer, RingBufferView
+from .recordbuffer import RecordRingBuffer
 from .arraytools import make_dtype
 
 class SharedMemSender(DataSender):
@@ -28,6 +29,11 @@ class SharedMemSender(DataSender):
       expect either row-major or column-major alignment. The default is
       row-major; the time axis comes first in the axis order.
     * fill (float) Value used to fill the buffer where no data is available.
+    * shm_backend (str) The method used to allocate shared memory: 'tmpfile'
+      (default), 'posix' (``/dev/shm`` + ``ftruncate``) or 'memfd'. See
+      :class:`SharedMem <stream.sharedarray.SharedMem>`.
+    * shm_hugepage (bool) if True, ask the kernel to back the buffer with
+      transparent huge pages.
     """
     def __init__(self, socket, params):
         DataSender.__init__(self, socket, params)
@@ -35,10 +41,17 @@ class SharedMemSender(DataSender):
         shape = (self.size,) + tuple(self.params['shape'][1:])
         self._buffer = RingBuffer(shape=shape, dtype=make_dtype(self.params['dtype']),
                                   shmem=True, axisorder=self.params['axisorder'],
-                                  double=self.params['double'], fill=self.params['fill'])
+                                  double=self.params['double'], fill=self.params['fill'],
+                                  shm_backend=self.params['shm_backend'],
+                                  shm_hugepage=self.params['shm_hugepage'])
         self.params['shm_id'] = self._buffer.shm_id
     
-    def send(self, index, data):
+    def close(self):
+        # numpy views on the buffer may still be alive, so only release the
+        # name here and let the mapping be freed with the last reference.
+        self._buffer._shmem.unlink()
+    
+    def send(self, index, data, timestamp=None, sent=None):
         assert data.dtype == self.params['dtype']
         shape = data.shape
         if self.params['shape'][0] != -1:
@@ -49,7 +62,7 @@ class SharedMemSender(DataSender):
         self._buffer.new_chunk(data, index)
         
         stat = struct.pack('!' + 'QQ', index, shape[0])
-        self.socket.send_multipart([stat])
+        self._send_multipart([self._stamp(stat, timestamp, sent)])
 
 
 class SharedMemReceiver(DataReceiver):
@@ -61,8 +74,10 @@ class SharedMemReceiver(DataReceiver):
         shape = (self.size,) + tuple(self.params['shape'][1:])
         self.buffer = RingBuffer(shape=shape, dtype=self.params['dtype'], double=self.params['double'],
                                  shmem=self.params['shm_id'], axisorder=self.params['axisorder'])
+        # length of the last received chunk
+        self.chunk_size = None
 
-    def recv(self, return_data=False):
+    def recv(self, return_data=False, validate=False):
         """Receive message indicating the index of the next data chunk.
         
         Parameters:
@@ -72,14 +87,143 @@ class SharedMemReceiver(DataReceiver):
             from the shared ring buffer). If False, then return None in place
             of data (the new data can still be accessed using __getitem__). The
             default is False.
+        validate : bool
+            If True, the chunk is copied from the shared buffer and
+            IndexError is raised if the sender overwrote it while it was
+            read (see :func:`RingBuffer.get_data`). This costs one copy of
+            each chunk. If False (default), the chunk is a view on the buffer
+            when possible, which the sender overwrites once the buffer wraps
+            around.
         """
-        stat = self.socket.recv_multipart()[0]
+        stat, timestamp, sent = self._unstamp(self.socket.recv_multipart()[0])
         index, size = struct.unpack('!QQ', stat)
+        self._stamped(index, size, timestamp, sent)
+        self.chunk_size = size
         if return_data:
-            data = self.buffer[index-size:index]
+            data = self.buffer.get_data(index-size, index, validate=validate)
         else:
             data = None
         return index, data
 
 
 register_transfermode('sharedmem', SharedMemSender, SharedMemReceiver)
+
+
+class SharedMemViewSender(DataSender):
+    """Stream sender that publishes some channels of an existing 'sharedmem'
+    stream without copying data. Only the data pointer is sent over the
+    socket; receivers read the selected channels directly from the shared
+    buffer of the source stream (see :class:`RingBufferView`).
+    
+    Note: this class is usually not instantiated directly; use
+    ``OutputStream.configure(transfermode='sharedmem_view')``. See
+    :class:`ChannelSplitter <pyacq.core.tools.ChannelSplitter>`.
+    
+    The chunks given to :func:`OutputStream.send` are only used for their
+    length; the data must already be in the source buffer.
+    
+    Extra parameters accepted when configuring the output stream:
+    
+    * shm_id, buffer_size, double, axisorder: the parameters of the source
+      'sharedmem' stream.
+    * source_shape (tuple) the shape of the source stream.
+    * channels (list) the channels of the source stream that are published.
+    """
+    def __init__(self, socket, params):
+        DataSender.__init__(self, socket, params)
+        for k in ('shm_id', 'source_shape', 'channels'):
+            if self.params.get(k) is None:
+                raise ValueError("'sharedmem_view' streams require the %s parameter" % k)
+    
+    def send(self, index, data, timestamp=None, sent=None):
+        stat = struct.pack('!' + 'QQ', index, len(data))
+        self._send_multipart([self._stamp(stat, timestamp, sent)])
+
+
+class SharedMemViewReceiver(SharedMemReceiver):
+    def __init__(self, socket, params):
+        DataReceiver.__init__(self, socket, params)
+        
+        self.size = self.params['buffer_size']
+        shape = (self.size,) + tuple(self.params['source_shape'][1:])
+        source = RingBuffer(shape=shape, dtype=self.params['dtype'], double=self.params['double'],
+                            shmem=self.params['shm_id'], axisorder=self.params['axisorder'])
+        self.buffer = RingBufferView(source, self.params['channels'])
+        self.chunk_size = None
+
+
+register_transfermode('sharedmem_view', SharedMemViewSender, SharedMemViewReceiver)
+
+
+class SharedEventSender(DataSender):
+    """Stream sender that stores events (or any records) in a shared
+    :class:`RecordRingBuffer`. Only the record index is sent over the socket.
+    
+    Note: this class is usually not instantiated directly; use
+    ``OutputStream.configure(transfermode='sharedmem_events')``.
+    
+    Each row of a chunk is one record (for example one event of a structured
+    dtype). With ``dtype='O'``, chunks are sequences of bytes objects of any
+    size. The *index* of a chunk is the number of records sent so far
+    (including the chunk), so that receivers can read any range of past
+    records with ``input_stream[start:stop]``.
+    
+    Extra parameters accepted when configuring the output stream:
+    
+    * buffer_size (int) the number of records kept in the buffer.
+    * record_buffer_bytes (int or None) the size of the byte ring that holds
+      the records. This is required when records have a variable size.
+    * shm_backend, shm_hugepage: see :class:`SharedMemSender`.
+    """
+    def __init__(self, socket, params):
+        DataSender.__init__(self, socket, params)
+        shape = (self.params['buffer_size'],) + tuple(self.params['shape'][1:])
+        self._buffer = RecordRingBuffer(shape=shape, dtype=self.params['dtype'],
+                                        nbytes=self.params['record_buffer_bytes'], shmem=True,
+                                        shm_backend=self.params['shm_backend'],
+                                        shm_hugepage=self.params['shm_hugepage'])
+        self.params['record_buffer_bytes'] = self._buffer.nbytes
+        self.params['shm_id'] = self._buffer.shm_id
+    
+    def close(self):
+        self._buffer._shmem.unlink()
+    
+    def send(self, index, data, timestamp=None, sent=None):
+        self._buffer.new_chunk(data, index)
+        stat = struct.pack('!QQ', index, len(data))
+        self._send_multipart([self._stamp(stat, timestamp, sent)])
+
+
+class SharedEventReceiver(DataReceiver):
+    def __init__(self, socket, params):
+        DataReceiver.__init__(self, socket, params)
+        shape = (self.params['buffer_size'],) + tuple(self.params['shape'][1:])
+        self.buffer = RecordRingBuffer(shape=shape, dtype=self.params['dtype'],
+                                       nbytes=self.params['record_buffer_bytes'],
+                                       shmem=self.params['shm_id'])
+
+    def recv(self, return_data=False, validate=False):
+        """Receive message indicating the index of the next records.
+        
+        Parameters:
+        -----------
+        return_data : bool
+            If True, return the new records. If False, then return None in
+            place of data (the records can still be accessed using
+            __getitem__). The default is False.
+        validate : bool
+            If True, the records are copied and IndexError is raised if the
+            sender overwrote them while they were read. If False (default),
+            they are a view on the shared buffer when possible.
+        """
+        stat, timestamp, sent = self._unstamp(self.socket.recv_multipart()[0])
+        index, size = struct.unpack('!QQ', stat)
+        self._stamped(index, size, timestamp, sent)
+        if return_data:
+            data = self.buffer.get_data(index-size, index, validate=validate)
+        else:
+            data = None
+        return index, data
+
+
+register_transfermode('sharedmem_events', SharedEventSender, SharedEventReceiver)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+
+import collections
+import threading
+import time
+import numpy as np
+
+
+class StreamStats:
+    """Counters and latency distribution of the chunks received by an
+    InputStream (see :func:`InputStream.stats`).
+
+    Latencies are only measured for streams configured with
+    ``latency=True``: the sender then attaches its ``time.perf_counter()`` to
+    each chunk when it is given to :func:`OutputStream.send`, and the latency
+    is the time until the chunk is received. Percentiles are computed on the last
+    *history* chunks.
+    """
+    def __init__(self, history=1000):
+        self._lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=history)
+        self.reset()
+
+    def reset(self):
+        """Reset all counters and forget latencies."""
+        with self._lock:
+            self.latencies.clear()
+            self.start_time = time.perf_counter()
+            self.nb_chunks = 0
+            self.nbytes = 0
+            self.queue_depth = 0
+            self.max_queue_depth = 0
+            self.max_latency = None
+
+    def add_latency(self, latency):
+        with self._lock:
+            self.latencies.append(latency)
+            if self.max_latency is None or latency > self.max_latency:
+                self.max_latency = latency
+
+    def add_chunk(self, nbytes, queue_depth):
+        with self._lock:
+            self.nb_chunks += 1
+            self.nbytes += nbytes
+            self.queue_depth = queue_depth
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+
+    def summary(self):
+        """Return a dict of plain Python values (it can be sent by RPC).
+
+        Latencies are in seconds; *latency* is None if no latency was
+        measured. The maximum is taken over all chunks since the last reset.
+        """
+        with self._lock:
+            duration = time.perf_counter() - self.start_time
+            summary = {
+                'chunks': self.nb_chunks,
+                'bytes': self.nbytes,
+                'bytes_per_s': self.nbytes / duration if duration > 0 else 0.,
+                'chunks_per_s': self.nb_chunks / duration if duration > 0 else 0.,
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'latency': None,
+            }
+            if len(self.latencies) > 0:
+                latencies = np.array(self.latencies)
+                p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+                summary['latency'] = {
+                    'mean': float(latencies.mean()),
+                    'p50': float(p50),
+                    'p90': float(p90),
+                    'p99': float(p99),
+                    'max': float(self.max_latency),
+                }
+        return summary
@@ -4,16 +4,25 @@
 
 import random
 import string
+import time
+import logging
+import asyncio
+import functools
 import zmq
+import zmq.asyncio
+from zmq.utils.monitor import recv_monitor_message
 import numpy as np
 import weakref
 
 from .ringbuffer import RingBuffer
 from .streamhelpers import all_transfermodes
+from .localstream import LocalReceiver
 from ..rpc import ObjectProxy
 from .arraytools import fix_struct_dtype, make_dtype
 
 
+logger = logging.getLogger(__name__)
+
 default_stream = dict(
     protocol='tcp',
     interface='127.0.0.1',
@@ -25,12 +34,36 @@ default_stream = dict(
     axisorder=None,
     buffer_size=0,
     compression='',
+    compression_opts=None,
+    prediction_order=0,
+    keyframe_interval=65536,
+    wire_dtype=None,
+    dequantize=True,
     scale=None,
     offset=None,
     units='',
     sample_rate=1.,
     double=False,#make sens only for transfermode='sharemem',
     fill=None,
+    shm_backend=None,#make sens only for transfermode='sharemem',
+    shm_hugepage=False,#make sens only for transfermode='sharemem',
+    record_buffer_bytes=None,#make sens only for transfermode='sharedmem_events',
+    source_shape=None,#make sens only for transfermode='sharedmem_view',
+    channels=None,#make sens only for transfermode='sharedmem_view',
+    batch_max_bytes=0,
+    batch_max_latency=0.,
+    sndhwm=None,
+    rcvhwm=None,
+    lossless=False,
+    inprocess='copy',
+    timestamps=False,
+    latency=False,
+    multicast_group='239.255.0.1',#make sens only for transfermode='multicast',
+    multicast_port=None,
+    multicast_ttl=1,
+    multicast_interface=None,
+    multicast_stream_id=None,#set by the sender for transfermode='multicast',
+    udp_packet_size=1472,
 )
 
 
@@ -59,6 +92,7 @@ class OutputStream(object):
         else:
             self.node = None
         self.name = name
+        self._async_lock = None
     
     def configure(self, **kargs):
         """
@@ -67,7 +101,8 @@ class OutputStream(object):
         Parameters
         ----------
         protocol : 'tcp', 'udp', 'inproc' or 'inpc' (linux only)
-            The type of protocol used for the zmq.PUB socket
+            The type of protocol used for the zmq.PUB socket. To send the same
+            data to many hosts over UDP, use ``transfermode='multicast'``.
         interface : str
             The bind adress for the zmq.PUB socket
         port : str
@@ -77,6 +112,13 @@ class OutputStream(object):
             
             * 'plaindata': data are sent over a plain socket in two parts: (frame index, data).
             * 'sharedmem': data are stored in shared memory in a ring buffer and the current frame index is sent over the socket.
+            * 'sharedmem_events': events or records of variable size (``dtype='O'``) are stored
+              in a shared record ring buffer and the current record index is sent over the socket.
+            * 'sharedmem_view': publishes some channels of another 'sharedmem' stream;
+              receivers read them from the shared buffer of that stream without copy.
+            * 'multicast': data are serialized like with 'plaindata' and sent once with
+              UDP multicast to all receivers (see
+              :class:`MulticastSender <stream.multicaststream.MulticastSender>`).
             * 'shared_cuda_buffer': (planned) data are stored in shared Cuda buffer and the current frame index is sent over the socket.
             * 'share_opencl_buffer': (planned) data are stored in shared OpenCL buffer and the current frame index is sent over the socket.
             
@@ -91,17 +133,117 @@ class OutputStream(object):
             
             * For ``streamtype=image``, the shape should be ``(-1, H, W)`` or ``(n_frames, H, W)``.
             * For ``streamtype=analogsignal`` the shape should be ``(n_samples, n_channels)`` or ``(-1, n_channels)``.
-        compression: '', 'blosclz', 'blosc-lz4'
-            The compression for the data stream. The default uses no compression.
+        compression: str
+            The compression for the data stream. The default ('') uses no
+            compression. Available methods depend on the installed packages and
+            are listed in `pyacq.core.stream.compression_methods`:
+            
+            * 'zlib' (always available) and 'delta-zlib', which first encodes
+              each item as its difference with the item *lag* positions before
+              (intended for integer signals, use ``lag=n_channels``).
+            * 'blosc-blosclz', 'blosc-lz4', 'blosc-lz4hc', 'blosc-zlib', 'blosc-zstd'
+            * 'blosc2-blosclz', 'blosc2-lz4', 'blosc2-lz4hc', 'blosc2-zlib', 'blosc2-zstd'
+            * 'zstd' and 'lz4' (lz4 frame format)
+            * 'auto': regularly tries all methods on a chunk and keeps the one
+              with the lowest cost (compression time + transmission time).
+            
+            Only used with ``transfermode='plaindata'``.
+        compression_opts: dict or None
+            Options for the compression method:
+            
+            * blosc and blosc2: clevel (int), shuffle ('none', 'byte' or 'bit')
+              and nthreads (int). blosc has a single number of threads for
+              the whole process, so all its streams must use the same
+              nthreads; blosc2 streams can each use their own.
+            * zstd: level (int) and nthreads (int).
+            * lz4: level (int).
+            * zlib: level (int). delta-zlib: level (int) and lag (int).
+            * auto: candidates (list of methods), bandwidth (expected link
+              bandwidth in bytes/s) and interval (number of chunks between two
+              evaluations). See :class:`AutoCompressor <stream.compression.AutoCompressor>`.
+        prediction_order: int
+            For integer streams with ``transfermode='plaindata'``, send the
+            error of a polynomial prediction of each sample from the previous
+            ones instead of the sample itself (1 = first difference, 2 = linear
+            prediction). This is lossless and makes the data much more
+            compressible. Default is 0 (disabled).
+        keyframe_interval: int
+            With *prediction_order* > 0, chunks that contain a multiple of
+            this sample index are encoded without reference to the previous
+            chunks. A receiver that connects late or misses chunks drops the
+            chunks it cannot decode until the next keyframe. A chunk sent
+            after a gap in the indexes is also encoded this way, and marked
+            so that receivers decode it.
         scale: float
             An optional scale factor + offset to apply to the data before it is sent over the stream.
             ``output = offset + scale * input``
+            The scale and offset can also be arrays with one value per channel.
+            They are applied when *wire_dtype* is set.
         offset:
             See *scale*.
+        wire_dtype: str or None
+            With ``transfermode='plaindata'``, quantize the data to this integer
+            dtype ('int8', 'int16', 'int24', 'int32', ...) before sending it:
+            ``input = round((output - offset) / scale)``. Values out of range
+            are clipped. This is lossy but divides the bandwidth by 2 for
+            float32 data sent as int16. Default is None (data is sent as is).
+        dequantize: bool
+            For quantized streams, whether InputStreams convert the received
+            data back to *dtype* (default) or return the integer values
+            ('int24' is returned as int32). This is usually set in the spec of
+            the InputStream; *scale* and *offset* are found in its params.
         units: str
             Units of the stream data. Mainly used for 'analogsignal'.
         sample_rate: float or None
             Sample rate of the stream in Hz.
+        batch_max_bytes: int
+            If > 0, chunks passed to :func:`send` are accumulated and sent
+            together with :func:`send_many` once this many bytes are pending.
+            This reduces the per-message overhead for devices that send
+            many small chunks.
+        batch_max_latency: float
+            If > 0, chunks passed to :func:`send` are accumulated and sent
+            together once the oldest pending chunk is older than this many
+            seconds. There is no timer: the age is only checked when a new
+            chunk is sent, so the last chunks of a source that slows down or
+            stops stay pending until the next :func:`send`, :func:`flush` or
+            :func:`close`. Sources that may pause should call :func:`flush`.
+        sndhwm: int or None
+            High water mark of the zmq.PUB socket: the maximum number of
+            messages queued for each subscriber (zmq default is 1000).
+        rcvhwm: int or None
+            High water mark of the zmq.SUB socket of InputStreams. This is
+            usually set in the spec of the InputStream.
+        lossless: bool
+            If False (default), messages are dropped for subscribers that
+            do not read fast enough; they can detect it with
+            :func:`InputStream.drop_stats`. If True, :func:`send` blocks
+            until all connected subscribers have room for the message (zmq
+            XPUB_NODROP), so a slow consumer such as a recorder slows down the
+            sender instead of losing data. See :func:`nb_blocked`.
+        inprocess: bool or 'copy'
+            With 'copy' (default), InputStreams of the same process that
+            connect to this OutputStream object receive a copy of each chunk
+            without going through the socket; the chunk is copied once for
+            all these InputStreams. If True, they receive the chunks by
+            reference: this avoids the copy, but the arrays given to
+            :func:`send` must then never be modified afterwards (senders
+            that reuse an output buffer, as many devices and filters do,
+            must not use it). If False, all chunks go through the socket. This only applies to 'plaindata'
+            streams without *compression*, *prediction_order* or *wire_dtype*.
+            Chunks are serialized for the socket only when another process is
+            connected (or the protocol is 'inproc').
+        timestamps: bool
+            If True, a timestamp is sent with each chunk (see *timestamp* in
+            :func:`send`) and InputStreams fit a model of the time of each
+            sample index, available as :attr:`InputStream.clock`
+            (a :class:`StreamClock <stream.clock.StreamClock>`).
+        latency: bool
+            If True, the time at which each chunk is given to :func:`send`
+            is sent with the chunk, and InputStreams measure the latency of
+            chunks, including the time spent in a batch (see
+            :func:`InputStream.stats`). Latencies are only meaningful
+            between processes of the same host.
         kwargs :
             All extra keyword arguments are passed to the DataSender constructor
             for the chosen transfermode (for example, see 
@@ -133,6 +275,10 @@ class OutputStream(object):
         context = zmq.Context.instance()
         self.socket = context.socket(zmq.PUB)
         self.socket.linger = 1000  # don't let socket deadlock when exiting
+        if self.params['sndhwm'] is not None:
+            self.socket.setsockopt(zmq.SNDHWM, self.params['sndhwm'])
+        if self.params['lossless']:
+            self.socket.setsockopt(zmq.XPUB_NODROP, 1)
         self.socket.bind(self.url)
         self.addr = self.socket.getsockopt(zmq.LAST_ENDPOINT).decode()
         self.port = self.addr.rpartition(':')[2]
@@ -143,12 +289,35 @@ class OutputStream(object):
             raise ValueError("Unsupported transfer mode '%s'" % transfermode)
         sender_class = all_transfermodes[transfermode][0]
         self.sender = sender_class(self.socket, self.params)
+        
+        self._batch = []
+        self._batch_timestamps = []
+        self._batch_sent = []
+        self._batch_bytes = 0
+        self._batch_start = None
+        self._batching = self.params['batch_max_bytes'] > 0 or self.params['batch_max_latency'] > 0
+        
+        # InputStreams of this process (see inprocess) are notified through
+        # an inproc socket; connections from other processes are tracked with
+        # a socket monitor so that chunks are serialized only when needed.
+        self._local_receivers = []
+        self._local_socket = None
+        self._monitor = None
+        if self._inprocess_capable():
+            self._local_url = u'inproc://pyacq_local_'+''.join(random.SystemRandom().choice(string.ascii_uppercase + string.digits) for _ in range(24))
+            self._local_socket = context.socket(zmq.PUB)
+            self._local_socket.linger = 0
+            self._local_socket.bind(self._local_url)
+            if self.params['protocol'] in ('tcp', 'ipc'):
+                self._monitor = self.socket.get_monitor_socket(zmq.EVENT_ACCEPTED | zmq.EVENT_DISCONNECTED)
+                self._nb_peers = 0
 
         self.configured = True
         if self.node and self.node():
+            self.node().invalidate_cache()
             self.node().after_output_configure(self.name)
 
-    def send(self, data, index=None, **kargs):
+    def send(self, data, index=None, timestamp=None, **kargs):
         """Send a data chunk and its frame index.
         
         Parameters
@@ -157,23 +326,221 @@ class OutputStream(object):
             The absolute sample index. This is the index of the last sample + 1.
         data: np.ndarray or bytes
             The chunk of data to send.
+        timestamp: float or None
+            For streams configured with ``timestamps=True``, the time at which
+            sample *index* was reached, in seconds. This may come from the
+            clock of the device; by default it is ``time.perf_counter()``.
+        kargs:
+            Extra arguments passed to the sender of the transfer mode.
+        
+        If batching is enabled (see *batch_max_bytes* and *batch_max_latency*
+        in :func:`configure`), the chunk may be held until enough data is
+        pending; it must not be modified before it is actually sent. Chunks
+        sent with extra *kargs* are never batched. The
+        latency limit is checked on send only: call :func:`flush` when no
+        more chunks are expected for a while.
         """
+        # the latency of chunks is measured from here
+        sent = time.perf_counter() if self.params['latency'] else None
         if index is None:
-            index = self.last_index + data.shape[0]
+            index = self.last_index + len(data)
         self.last_index = index
-        self.sender.send(index, data, **kargs)
+        if self.params['timestamps'] and timestamp is None:
+            timestamp = time.perf_counter()
+        if not self._batching or len(kargs) > 0:
+            if self._batching:
+                # extra arguments are passed to the send() of the sender,
+                # which batched chunks do not go through: send the pending
+                # chunks, then this one alone
+                self.flush()
+            if len(self._local_receivers) > 0:
+                self._send_local([(index, data)], [timestamp], [sent])
+            if self._has_peers():
+                if self.params['timestamps']:
+                    kargs['timestamp'] = timestamp
+                if sent is not None:
+                    kargs['sent'] = sent
+                self.sender.send(index, data, **kargs)
+            return
+        
+        if len(self._batch) == 0:
+            self._batch_start = time.perf_counter()
+        self._batch.append((index, data))
+        self._batch_timestamps.append(timestamp)
+        self._batch_sent.append(sent)
+        self._batch_bytes += _nbytes(data)
+        max_bytes, max_latency = self.params['batch_max_bytes'], self.params['batch_max_latency']
+        if (max_bytes > 0 and self._batch_bytes >= max_bytes) or \
+                (max_latency > 0 and time.perf_counter() - self._batch_start >= max_latency):
+            self.flush()
+    
+    async def asend(self, data, index=None, **kargs):
+        """Coroutine version of :func:`send`.
+        
+        Sends never block with the default PUB/SUB behavior (messages are
+        dropped for slow subscribers), so this only differs from :func:`send`
+        for streams configured with ``lossless=True``: the send is then done in
+        the default executor of the event loop so that waiting for slow
+        subscribers does not block the loop.
+        """
+        if not self.params['lossless']:
+            self.send(data, index=index, **kargs)
+            return
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        # zmq sockets must not be used by two threads at once
+        async with self._async_lock:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, functools.partial(self.send, data, index=index, **kargs))
+    
+    def send_many(self, chunks, timestamps=None):
+        """Send several data chunks at once.
+        
+        Depending on the transfer mode, this can be much faster than calling
+        :func:`send` for each chunk (for example, with 'plaindata' all chunks
+        are sent in a single message).
+        
+        Parameters
+        ----------
+        chunks: list
+            List of (index, data) tuples. As for :func:`send`, index may be
+            None to advance the index by the size of the chunk (``len(data)``).
+        timestamps: list or None
+            The timestamp of each chunk (see :func:`send`), or None for chunks
+            without a timestamp. By default, only the last chunk gets the
+            current time: the others were produced earlier, and their
+            timestamps would bias the clock of receivers.
+        """
+        self.flush()
+        now = time.perf_counter() if self.params['latency'] else None
+        indexed_chunks = []
+        for index, data in chunks:
+            if index is None:
+                index = self.last_index + len(data)
+            self.last_index = index
+            indexed_chunks.append((index, data))
+        if timestamps is None:
+            timestamps = [None] * len(indexed_chunks)
+            if self.params['timestamps'] and len(indexed_chunks) > 0:
+                timestamps[-1] = time.perf_counter()
+        if len(indexed_chunks) > 0:
+            self._send_many(indexed_chunks, timestamps, [now] * len(indexed_chunks))
+    
+    def nb_blocked(self):
+        """Return the number of sends that had to wait for a slow subscriber.
+        
+        This is only counted when the stream is configured with ``lossless=True``.
+        """
+        return self.sender.nb_blocked
+    
+    def compression_ratio(self):
+        """Return the ratio between the size of the data sent so far and its
+        size on the wire.
+        
+        This is 1.0 when the stream is not compressed or nothing was sent yet.
+        """
+        if self.sender.nbytes_sent == 0:
+            return 1.
+        return self.sender.nbytes_raw / self.sender.nbytes_sent
+    
+    def stats(self):
+        """Return a dict of statistics about the data sent on this stream.
+        
+        See :func:`InputStream.stats` for the receiving side.
+        """
+        return {
+            'index': self.last_index,
+            'bytes_raw': self.sender.nbytes_raw,
+            'bytes_sent': self.sender.nbytes_sent,
+            'blocked': self.sender.nb_blocked,
+            'local_receivers': len(self._local_receivers),
+        }
+    
+    def flush(self):
+        """Send all chunks that are pending in the batch.
+        """
+        if len(self._batch) == 0:
+            return
+        batch, timestamps, sent = self._batch, self._batch_timestamps, self._batch_sent
+        self._batch = []
+        self._batch_timestamps = []
+        self._batch_sent = []
+        self._batch_bytes = 0
+        self._batch_start = None
+        self._send_many(batch, timestamps, sent)
+    
+    def _send_many(self, chunks, timestamps, sent):
+        if len(self._local_receivers) > 0:
+            self._send_local(chunks, timestamps, sent)
+        if self._has_peers():
+            kargs = {}
+            if self.params['timestamps']:
+                kargs['timestamps'] = timestamps
+            if self.params['latency']:
+                kargs['sent'] = sent
+            self.sender.send_many(chunks, **kargs)
+    
+    def _inprocess_capable(self):
+        p = self.params
+        return (bool(p['inprocess']) and p['transfermode'] == 'plaindata' and p['compression'] == ''
+                and p['prediction_order'] == 0 and p['wire_dtype'] is None)
+    
+    def _send_local(self, chunks, timestamps, sent):
+        if self.params['inprocess'] == 'copy':
+            chunks = [(index, np.array(data)) for index, data in chunks]
+        for receiver in self._local_receivers:
+            if receiver.push(chunks, timestamps, sent, block=self.params['lossless']):
+                self.sender.nb_blocked += 1
+        self._local_socket.send(b'')
+    
+    def _has_peers(self):
+        # Return False only if we know that no socket is connected to this
+        # stream (inproc connections are not reported by the monitor).
+        if self._monitor is None:
+            return True
+        while self._monitor.poll(timeout=0):
+            event = recv_monitor_message(self._monitor)['event']
+            if event == zmq.EVENT_ACCEPTED:
+                self._nb_peers += 1
+            elif event == zmq.EVENT_DISCONNECTED:
+                self._nb_peers -= 1
+        return self._nb_peers > 0
+    
+    def _add_local_receiver(self, receiver):
+        # lists are replaced rather than modified: send() may iterate over
+        # them in another thread
+        self._local_receivers = self._local_receivers + [receiver]
+    
+    def _remove_local_receiver(self, receiver):
+        self._local_receivers = [r for r in self._local_receivers if r is not receiver]
 
     def close(self):
         """Close the output.
         
         This closes the socket and releases shared memory, if necessary.
         """
+        self.flush()
         self.sender.close()
+        if self._monitor is not None:
+            self.socket.disable_monitor()
+            self._monitor.close()
+            self._monitor = None
+        if self._local_socket is not None:
+            self._local_socket.close()
+            self._local_socket = None
+        self._local_receivers = []
         self.socket.close()
         del self.socket
         del self.sender
 
 
+def _nbytes(data):
+    # size of a chunk given to send(): ndarray or bytes-like object
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    return memoryview(data).nbytes
+
+
 def _shape_equal(shape1, shape2):
     """
     Check if shape of stream are compatible.
@@ -210,12 +577,24 @@ class InputStream(object):
     2. Poll for incoming data packets with :func:`InputStream.poll()`.
     3. Receive the next packet with :func:`InputStream.recv()`.
     
+    In asyncio code, use ``await input.arecv()`` or iterate over chunks with
+    ``async for index, data in input:``. A single event loop can then wait on
+    many InputStreams without one polling thread per stream.
+    
     Optionally, use :func:`InputStream.set_buffer()` to attach a
     :class:`RingBuffer` for easier data handling.
+    
+    If the stream was configured with ``timestamps=True``, :attr:`clock` is a
+    :class:`StreamClock <stream.clock.StreamClock>` updated with each
+    received chunk, which gives the time of any sample index
+    (``input.clock.time(index)``) and the measured sample rate. When the
+    OutputStream runs on another host, set ``input.clock.offset`` to the
+    result of :func:`RPCClient.measure_clock_diff` for the client of that host.
     """
     def __init__(self, spec=None, node=None, name=None):
         self.spec = {} if spec is None else spec
         self.configured = False
+        self.connected = False
         if node is not None:
             self.node = weakref.ref(node)
         else:
@@ -266,21 +645,47 @@ class InputStream(object):
             else:
                 self.params[k] = v
         
+        # OutputStreams of the same process hand over their chunks directly
+        local = (isinstance(output, OutputStream) and output._local_socket is not None
+                 and self.spec.get('inprocess', True))
+        
         context = zmq.Context.instance()
         self.socket = context.socket(zmq.SUB)
         self.socket.linger = 1000  # don't let socket deadlock when exiting
+        if self.params['rcvhwm'] is not None:
+            self.socket.setsockopt(zmq.RCVHWM, self.params['rcvhwm'])
         self.socket.setsockopt(zmq.SUBSCRIBE, b'')
         #~ self.socket.setsockopt(zmq.DELAY_ATTACH_ON_CONNECT,1)
-        self.socket.connect(self.url)
+        self.socket.connect(output._local_url if local else self.url)
         
         transfermode = self.params['transfermode']
         if transfermode not in all_transfermodes:
             raise ValueError("Unsupported transfer mode '%s'" % transfermode)
-        receiver_class = all_transfermodes[transfermode][1]
-        self.receiver = receiver_class(self.socket, self.params)
+        if local:
+            # zmq default high water mark
+            maxlen = self.params['rcvhwm'] or 1000
+            self.receiver = LocalReceiver(self.socket, self.params, output, maxlen=maxlen)
+            output._add_local_receiver(self.receiver)
+        else:
+            receiver_class = all_transfermodes[transfermode][1]
+            self.receiver = receiver_class(self.socket, self.params)
+        # index <-> time model of streams with timestamps (None otherwise)
+        self.clock = self.receiver.clock
+        
+        # gaps are counted by the receiver (see drop_stats), only the first
+        # one is logged
+        self._gap_logged = False
+        
+        # byte counts of chunks received without data (see stats)
+        self._last_index = None
+        self._frame_nbytes = int(np.prod(self.params['shape'][1:], dtype='int64')) * make_dtype(self.params['dtype']).itemsize
+        
+        # zmq.asyncio socket sharing self.socket, created by arecv()
+        self._asocket = None
         
         self.connected = True
         if self.node and self.node():
+            self.node().invalidate_cache()
             self.node().after_input_connect(self.name)        
     
     def poll(self, timeout=None):
@@ -288,7 +693,7 @@ class InputStream(object):
         
         Return True if a new packet is available.
         """
-        return self.socket.poll(timeout=timeout)
+        return self.receiver.poll(timeout=timeout)
     
     def recv(self, **kargs):
         """
@@ -306,9 +711,148 @@ class InputStream(object):
             to return the received data chunk.
         """
         index, data = self.receiver.recv(**kargs)
+        self._check_gap()
+        self._count(index, data)
         if self._own_buffer and data is not None and self.buffer is not None:
             self.buffer.new_chunk(data, index=index)
+            self.receiver.nbytes_copied += data.nbytes
         return index, data
+    
+    async def arecv(self, **kargs):
+        """Coroutine version of :func:`recv`.
+        
+        Wait for the next chunk without blocking the event loop and return
+        ``(index, data)``. Arguments are passed to :func:`recv`.
+        """
+        if self.receiver.pollable is not self.socket:
+            # data does not arrive on the zmq socket (see 'multicast')
+            while not self.receiver.poll(timeout=0):
+                await self._wait_readable(self.receiver.pollable)
+            return self.recv(**kargs)
+        if self._asocket is None:
+            self._asocket = zmq.asyncio.Socket.from_socket(self.socket)
+        while not self.receiver.poll(timeout=0):
+            await self._asocket.poll(flags=zmq.POLLIN)
+        return self.recv(**kargs)
+    
+    async def _wait_readable(self, fileobj):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        loop.add_reader(fileobj, future.set_result, None)
+        try:
+            await future
+        finally:
+            loop.remove_reader(fileobj)
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        # iteration stops when the stream is closed
+        if not hasattr(self, 'socket'):
+            raise StopAsyncIteration
+        try:
+            return await self.arecv()
+        except zmq.ZMQError:
+            if not hasattr(self, 'socket'):
+                raise StopAsyncIteration
+            raise
+    
+    def recv_many(self, **kargs):
+        """
+        Receive all chunks of data that are already available.
+        
+        This blocks until at least one chunk is available (like :func:`recv`),
+        then returns every chunk that can be received without waiting.
+        
+        Returns
+        -------
+        chunks: list
+            List of (index, data) tuples as returned by :func:`recv`.
+        """
+        chunks = self.receiver.recv_many(**kargs)
+        self._check_gap()
+        for index, data in chunks:
+            self._count(index, data)
+        if self._own_buffer and self.buffer is not None:
+            for index, data in chunks:
+                if data is not None:
+                    self.buffer.new_chunk(data, index=index)
+                    self.receiver.nbytes_copied += data.nbytes
+        return chunks
+    
+    def _check_gap(self):
+        # Warn once when the receiver detects the first gap; the next ones
+        # are only counted (see drop_stats).
+        if not self._gap_logged and self.receiver.nb_gaps > 0:
+            self._gap_logged = True
+            logger.warning("InputStream %s: %d samples missing, further gaps are "
+                           "only counted (see drop_stats)", self.name, self.receiver.nb_dropped)
+    
+    def _count(self, index, data):
+        if data is not None:
+            nbytes = data.nbytes
+        elif self._last_index is not None:
+            # data left in shared memory
+            nbytes = (index - self._last_index) * self._frame_nbytes
+        else:
+            nbytes = 0
+        self._last_index = index
+        self.receiver.stats.add_chunk(nbytes, self.receiver.queue_depth())
+    
+    def stats(self, reset=False):
+        """Return statistics about the chunks received on this stream.
+        
+        This can be called by RPC to find which stream of a graph of nodes
+        adds latency (see also :func:`Manager.stream_stats`).
+        
+        Parameters
+        ----------
+        reset: bool
+            If True, all counters are reset after they are read.
+        
+        Returns
+        -------
+        stats: dict
+            Number of 'chunks' and 'bytes' received, 'chunks_per_s' and
+            'bytes_per_s' since the last reset, 'queue_depth' (chunks that
+            were already received and wait to be read, and 'max_queue_depth'),
+            'gaps' and 'dropped' samples (see :func:`drop_stats`), and
+            'latency': None, or if the stream was configured with
+            ``latency=True``, a dict with the 'mean', 'p50', 'p90', 'p99' and
+            'max' time in seconds between the sending of chunks and their
+            reception.
+        """
+        stats = self.receiver.stats.summary()
+        stats['gaps'] = self.receiver.nb_gaps
+        stats['dropped'] = self.receiver.nb_dropped
+        if reset:
+            self.receiver.stats.reset()
+        return stats
+    
+    def drop_stats(self):
+        """Return the number of gaps detected between received chunks and the
+        total number of missing samples.
+        
+        With zmq.PUB/SUB, messages are dropped when this InputStream does not
+        receive them fast enough (see *rcvhwm*, *sndhwm* and *lossless* in
+        :func:`OutputStream.configure`). Gaps are detected for all chunks,
+        also when they are received without their data.
+        
+        Returns
+        -------
+        stats: dict
+            {'gaps': int, 'samples': int}
+        """
+        return {'gaps': self.receiver.nb_gaps, 'samples': self.receiver.nb_dropped}
+    
+    def nbytes_copied(self):
+        """Return the number of bytes that were copied while receiving data
+        on this stream (decompression and writes into the attached RingBuffer).
+        
+        This can be used to monitor the receive-side memory bandwidth.
+        """
+        return self.receiver.nbytes_copied
 
     def close(self):
         """Close the stream.
@@ -316,8 +860,10 @@ class InputStream(object):
         This closes the socket. No data can be received after this point.
         """
         self.receiver.close()
+        self._asocket = None
         self.socket.close()
         del self.socket
+        self.connected = False
     
     def __getitem__(self, *args):
         """Return a data slice from the RingBuffer attached to this InputStream.
@@ -364,5 +910,9 @@ class InputStream(object):
         # attach a new buffer
         shape = (size,) + tuple(self.params['shape'][1:])
         dtype = make_dtype(self.params['dtype'])
+        if (self.params['transfermode'] == 'plaindata' and self.params['wire_dtype'] is not None
+                and not self.params['dequantize']):
+            # quantized values are kept as they were sent
+            dtype = np.dtype('int32') if self.params['wire_dtype'] == 'int24' else np.dtype(self.params['wire_dtype'])
         self.buffer = RingBuffer(shape=shape, dtype=dtype, double=double, axisorder=axisorder, shmem=shmem, fill=fill)
         self._own_buffer = True
@@ -2,11 +2,23 @@
 # Copyright (c) 2016, French National Center for Scientific Research (CNRS)
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
+import struct
+import math
+import time
+import zmq
+
 from .arraytools import make_dtype
+from .clock import StreamClock
+from .stats import StreamStats
 from pyacq.core.rpc.proxy import ObjectProxy
 
 all_transfermodes = {}
 
+# timestamp and send time appended to the header of each chunk (see
+# timestamps and latency in OutputStream.configure); chunks without a
+# timestamp are sent with NaN
+_timestamp_struct = struct.Struct('!d')
+
 def register_transfermode(modename, sender, receiver):
     global all_transfermodes
     all_transfermodes[modename] = (sender, receiver)
@@ -24,11 +36,55 @@ class DataSender:
             #~ self.params = self.params._get_value()
         #~ if 'dtype' in self.params:
             #~ self.params['dtype'] = make_dtype(self.params['dtype'])
+        # optional pre-processing functions applied to each chunk before
+        # sending: f(index, data) -> (index, data)
         self.funcs = []
+        # number of bytes before and after compression (see OutputStream.compression_ratio)
+        self.nbytes_raw = 0
+        self.nbytes_sent = 0
+        # number of sends that had to wait for a slow subscriber (lossless streams)
+        self.nb_blocked = 0
+        self._timestamps = self.params.get('timestamps', False)
+        self._latency = self.params.get('latency', False)
 
-    def send(self, index, data):
+    def send(self, index, data, timestamp=None, sent=None):
         raise NotImplementedError()
     
+    def _stamp(self, stat, timestamp, sent=None):
+        # append the timestamp and the send time to the header of a chunk;
+        # *sent* is the time OutputStream.send() was called (now by default)
+        if self._timestamps:
+            stat += _timestamp_struct.pack(float('nan') if timestamp is None else timestamp)
+        if self._latency:
+            stat += _timestamp_struct.pack(time.perf_counter() if sent is None else sent)
+        return stat
+    
+    def _send_multipart(self, frames, copy=False):
+        # Subclasses send their messages with this method. In lossless mode the
+        # socket blocks instead of dropping messages when a subscriber is full;
+        # count these events to detect slow consumers.
+        if self.params['lossless']:
+            try:
+                self.socket.send_multipart(frames, flags=zmq.NOBLOCK, copy=copy)
+                return
+            except zmq.Again:
+                self.nb_blocked += 1
+        self.socket.send_multipart(frames, copy=copy)
+    
+    def send_many(self, chunks, timestamps=None, sent=None):
+        """Send a list of (index, data) chunks.
+        
+        *timestamps* and *sent* (the times at which the chunks were given to
+        the OutputStream) are lists of the same length, or None.
+        Subclasses may reimplement this to send all chunks at once.
+        """
+        if timestamps is None:
+            timestamps = [None] * len(chunks)
+        if sent is None:
+            sent = [None] * len(chunks)
+        for (index, data), timestamp, sent_time in zip(chunks, timestamps, sent):
+            self.send(index, data, timestamp=timestamp, sent=sent_time)
+    
     def close(self):
         pass
 
@@ -46,10 +102,79 @@ class DataReceiver:
         #~ if 'dtype' in self.params:
             #~ self.params['dtype'] = make_dtype(self.params['dtype'])
         self.buffer = None
+        # object that pollers (zmq.Poller, asyncio) wait on for new data
+        self.pollable = socket
+        # optional post-processing functions applied after receiving each
+        # chunk: f(index, data) -> (index, data); see DataSender.funcs
+        self.funcs = []
+        # number of bytes copied on the receiving side (see InputStream.nbytes_copied)
+        self.nbytes_copied = 0
+        # index <-> time model updated with the timestamps of chunks
+        if self.params.get('timestamps', False):
+            self.clock = StreamClock(sample_rate=self.params.get('sample_rate'))
+        else:
+            self.clock = None
+        self._latency = self.params.get('latency', False)
+        self.stats = StreamStats()
+        # gap detection (see InputStream.drop_stats): index expected at the
+        # start of the next chunk, number of gaps and of missing samples
+        self._next_index = None
+        self.nb_gaps = 0
+        self.nb_dropped = 0
             
+    def poll(self, timeout=None):
+        return self.socket.poll(timeout=timeout)
+    
     def recv(self, return_data=False):
         raise NotImplementedError()
     
+    def _unstamp(self, stat):
+        # remove the timestamp and the send time from the header of a chunk;
+        # return the header, the timestamp and the send time (None when the
+        # stream does not have them)
+        timestamp = sent = None
+        n = len(stat)
+        if self._latency:
+            n -= _timestamp_struct.size
+            sent = _timestamp_struct.unpack_from(stat, n)[0]
+        if self.clock is not None:
+            n -= _timestamp_struct.size
+            timestamp = _timestamp_struct.unpack_from(stat, n)[0]
+            if math.isnan(timestamp):
+                timestamp = None
+        return stat[:n], timestamp, sent
+    
+    def _stamped(self, index, size, timestamp, sent):
+        # called for each received chunk of *size* samples, also when its
+        # data is not returned
+        start = index - size
+        if self._next_index is not None and start > self._next_index:
+            # the publisher dropped messages for this subscriber (or the
+            # sender skipped samples)
+            self.nb_gaps += 1
+            self.nb_dropped += start - self._next_index
+        self._next_index = index
+        if timestamp is not None:
+            self.clock.update(index, timestamp)
+        if sent is not None:
+            self.stats.add_latency(time.perf_counter() - sent)
+    
+    def queue_depth(self):
+        """Return the number of chunks that were received by the transport
+        and wait to be read (messages still queued by zmq are not counted).
+        """
+        return 0
+    
+    def recv_many(self, **kargs):
+        """Receive all chunks that are available, waiting for at least one.
+        
+        Return a list of (index, data) tuples.
+        """
+        chunks = [self.recv(**kargs)]
+        while self.socket.poll(timeout=0):
+            chunks.append(self.recv(**kargs))
+        return chunks
+    
     def close(self):
         pass
     
@@ -4,7 +4,7 @@
 
 import numpy as np
 import pytest
-from pyacq.core.stream import OutputStream, InputStream, RingBuffer
+from pyacq.core.stream import OutputStream, InputStream, RingBuffer, RecordRingBuffer
 
 
 def test_ringbuffer():
@@ -23,7 +23,7 @@ def test_ringbuffer():
     
     buf1 = RingBuffer(shape=(10, 5, 7), dtype=np.ubyte, double=False)
     buf2 = RingBuffer(shape=(10, 5, 7), dtype=np.ubyte, double=True)
-    buf3 = RingBuffer(shape=(10, 5, 7), dtype=np.float, double=False)
+    buf3 = RingBuffer(shape=(10, 5, 7), dtype=np.float64, double=False)
     buf4 = RingBuffer(shape=(10, 5, 7), dtype=np.ubyte, double=True, axisorder=(1, 2, 0))
     buf5 = RingBuffer(shape=(10, 5, 7), dtype='float32', double=False, axisorder=(1, 2, 0))
     
@@ -142,7 +142,80 @@ def test_ringbuffer_shm():
     assert np.all(buf1[:] == buf2[:])
 
 
+def test_ringbuffer_validate():
+    buf1 = RingBuffer(shape=(10, 5), dtype='float32', double=False, shmem=True)
+    buf2 = RingBuffer(shape=(10, 5), dtype='float32', double=False, shmem=buf1.shm_id)
+    buf1.new_chunk(np.ones((10, 5), dtype='float32'), index=100)
+    
+    data = buf2.get_data(90, 100, validate=True)
+    assert np.all(data == 1)
+    assert not np.may_share_memory(data, buf2.buffer)
+    a, b = buf2.get_data(93, 100, join=False, validate=True)
+    assert a.shape[0] + b.shape[0] == 7
+    
+    # simulate a writer that has started overwriting the oldest samples
+    buf1._set_write_index(103)
+    with pytest.raises(IndexError):
+        buf2.get_data(90, 100, validate=True)
+    assert buf2.get_data(93, 100, validate=True).shape == (7, 5)
+    
+    # segment is overwritten after it was checked but before the copy ended
+    buf2._check_overwritten(93, 100)
+    buf1._set_write_index(105)
+    with pytest.raises(IndexError):
+        buf2._check_overwritten(93, 100)
+
+
+
+def test_recordringbuffer():
+    dtype = [('pos', 'int64'), ('label', 'S5')]
+    events = np.zeros(30, dtype=dtype)
+    events['pos'] = np.arange(30) * 10
+    events['label'] = [b'e%d' % i for i in range(30)]
+    
+    buf = RecordRingBuffer(shape=(10,), dtype=dtype, shmem=True)
+    buf2 = RecordRingBuffer(shape=(10,), dtype=dtype, shmem=buf.shm_id)
+    buf.new_chunk(events[:4])
+    buf.new_chunk(events[4:7])
+    assert buf2.index() == 7
+    # adjacent records are read without copy
+    data = buf2.get_data(2, 6)
+    assert data.base is not None
+    assert np.all(data == events[2:6])
+    assert np.all(buf2[-1:] == events[6:7])
+    
+    # skipped records are empty; old records are not readable anymore
+    buf.new_chunk(events[9:13], index=13)
+    assert np.all(buf2[7:9]['pos'] == 0)
+    assert np.all(buf2[9:13] == events[9:13])
+    with pytest.raises(IndexError):
+        buf2.get_data(2, 5)
+    with pytest.raises(ValueError):
+        buf.new_chunk(events[10:12], index=12)
+    
+    # multi-dimensional records
+    buf = RecordRingBuffer(shape=(7, 2), dtype='float32', nbytes=100)
+    data = np.arange(60, dtype='float32').reshape(30, 2)
+    for i in range(10):
+        buf.new_chunk(data[i*3:(i+1)*3])
+    # only 6 records fit in 100 bytes
+    with pytest.raises(IndexError):
+        buf[23:30]
+    assert np.all(buf[24:30] == data[24:30])
+    assert np.all(buf.get_data(24, 30, validate=True) == data[24:30])
+    
+    # variable-size records
+    buf = RecordRingBuffer(shape=(10,), dtype='O', nbytes=64)
+    buf.new_chunk([b'a', b'bcdefghijklmnop', b''])
+    assert list(buf[0:3]) == [b'a', b'bcdefghijklmnop', b'']
+    buf.new_chunk([b'y' * 30])
+    with pytest.raises(IndexError):
+        buf[0:4]
+    assert list(buf[2:4]) == [b'', b'y' * 30]
+
 
 if __name__ =='__main__':
     test_ringbuffer()
-    test_ringbuffer_shm()
\ No newline at end of file
+    test_ringbuffer_shm()
+    test_ringbuffer_validate()
+    test_recordringbuffer()
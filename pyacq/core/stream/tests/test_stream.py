@@ -4,11 +4,17 @@
 
 import time
 import timeit
+import threading
+import asyncio
+import logging
 import pytest
 import sys
 import os
+import struct
 
-from pyacq.core.stream import OutputStream, InputStream, RingBuffer, compression_methods
+from pyacq.core.stream import OutputStream, InputStream, RingBuffer, compression_methods, shm_backends
+from pyacq.core.stream.localstream import LocalReceiver
+from pyacq.core.stream.compression import AutoCompressor, register_compression
 import numpy as np
 
 
@@ -32,6 +38,55 @@ def test_stream_sharedmem():
         check_stream(chunksize=chunksize, chan_shape=chan_shape, buffer_size=shm_size,
                      transfermode='sharedmem', protocol=protocol,
                      dtype=dtype)
+    for shm_backend in shm_backends:
+        check_stream(chunksize=chunksize, chan_shape=chan_shape, buffer_size=shm_size,
+                     transfermode='sharedmem', shm_backend=shm_backend,
+                     dtype=dtype)
+
+
+def test_stream_sharedmem_events():
+    dtype = [('index', 'int64'), ('label', 'S12')]
+    events = np.zeros(100, dtype=dtype)
+    events['index'] = np.arange(100) * 7
+    events['label'] = [b'ev%d' % i for i in range(100)]
+    
+    outstream = OutputStream()
+    outstream.configure(protocol='tcp', transfermode='sharedmem_events', streamtype='event',
+                        dtype=dtype, shape=(-1,), buffer_size=50)
+    instream = InputStream()
+    instream.connect(outstream)
+    instream.set_buffer(size=50, double=False)
+    time.sleep(.1)
+    
+    for i in range(10):
+        outstream.send(events[i*10:(i+1)*10])
+        index, chunk = instream.recv(return_data=True)
+        assert index == (i+1) * 10
+        assert np.all(chunk == events[i*10:(i+1)*10])
+    # random access to past events
+    assert np.all(instream[60:95] == events[60:95])
+    outstream.close()
+    instream.close()
+    
+    # variable-size records
+    outstream = OutputStream()
+    outstream.configure(protocol='tcp', transfermode='sharedmem_events', dtype='O',
+                        shape=(-1,), buffer_size=50, record_buffer_bytes=4096)
+    instream = InputStream()
+    instream.connect(outstream)
+    instream.set_buffer(size=50, double=False)
+    time.sleep(.1)
+    records = [b'x' * i for i in range(20)]
+    outstream.send(records[:5])
+    outstream.send(records[5:])
+    assert instream.recv() == (5, None)
+    index, chunk = instream.recv(return_data=True)
+    assert index == 20
+    assert list(chunk) == records[5:]
+    assert list(instream[0:20]) == records
+    outstream.close()
+    instream.close()
+
             
 def check_stream(chunksize=1024, chan_shape=(16,), **kwds):
     chunk_shape = (chunksize,) + chan_shape
@@ -74,7 +129,69 @@ def test_plaindata_ringbuffer():
 def test_sharedmem_ringbuffer():
     check_stream_ringbuffer(transfermode='sharedmem', buffer_size=4096)
     check_stream_ringbuffer(transfermode='sharedmem', buffer_size=4096, axisorder=(1, 0))
-    
+
+
+def test_sharedmem_recv_validate():
+    outstream = OutputStream()
+    outstream.configure(protocol='tcp', interface='127.0.0.1', transfermode='sharedmem',
+                        dtype='float32', shape=(-1, 4), buffer_size=1000, double=True)
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+
+    data = np.arange(400, dtype='float32').reshape(100, 4)
+    outstream.send(data)
+    index, data2 = instream.recv(return_data=True, validate=True)
+    assert index == 100
+    assert np.all(data2 == data)
+    # validated chunks are copied out of the shared buffer
+    assert not np.shares_memory(data2, instream.receiver.buffer.buffer)
+
+    # simulate the sender overwriting the chunk before it is read
+    outstream.send(data)
+    outstream.sender._buffer._set_write_index(1150)
+    with pytest.raises(IndexError):
+        instream.recv(return_data=True, validate=True)
+
+    # by default, chunks are views on the shared buffer
+    outstream.sender._buffer._set_write_index(200)
+    outstream.send(data)
+    index, data3 = instream.recv(return_data=True)
+    assert index == 300
+    assert np.all(data3 == data)
+    assert np.shares_memory(data3, instream.receiver.buffer.buffer)
+
+    instream.close()
+    outstream.close()
+
+
+def test_drop_stats_without_data(caplog):
+    outstream = OutputStream()
+    outstream.configure(protocol='tcp', interface='127.0.0.1', transfermode='sharedmem',
+                        dtype='float32', shape=(-1, 4), buffer_size=1000)
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+
+    data = np.zeros((100, 4), dtype='float32')
+    for i in range(5):
+        if i in (1, 3):
+            # simulate a dropped message: the chunk is written but the
+            # subscriber is not notified
+            outstream.sender._buffer.new_chunk(data, index=(i+1)*100)
+            continue
+        outstream.send(data, index=(i+1)*100)
+    with caplog.at_level(logging.WARNING, logger='pyacq.core.stream.stream'):
+        indexes = [instream.recv()[0] for i in range(3)]
+    assert indexes == [100, 300, 500]
+    assert instream.drop_stats() == {'gaps': 2, 'samples': 200}
+    # only the first gap is logged
+    assert len(caplog.records) == 1
+
+    instream.close()
+    outstream.close()
+
+
 def check_stream_ringbuffer(**kwds):
     chunk_shape = (-1, 16)
     stream_spec = dict(protocol='tcp', interface='127.0.0.1', port='*', 
@@ -106,16 +223,621 @@ def check_stream_ringbuffer(**kwds):
         instream.recv()
     data2 = instream[0:4096]
     assert np.all(data2 == data)
+    if stream_spec['transfermode'] == 'plaindata':
+        # received frames are written directly into the ring buffer
+        assert instream.nbytes_copied() == data.nbytes
     if outstream.params['axisorder'] is not None:
         assert np.all(np.argsort(data2.strides)[::-1] == outstream.params['axisorder'])
     
 
 
+def test_send_many():
+    for transfermode in ('plaindata', 'sharedmem'):
+        outstream = OutputStream()
+        outstream.configure(protocol='tcp', transfermode=transfermode, dtype='float32',
+                            shape=(-1, 4), buffer_size=1000)
+        instream = InputStream()
+        instream.connect(outstream)
+        time.sleep(.1)
+        
+        chunks = [np.random.rand(i+1, 4).astype('float32') for i in range(5)]
+        outstream.send_many([(None, chunk) for chunk in chunks])
+        # single chunks are still received one by one
+        outstream.send_many([(None, chunks[0])])
+        
+        instream.poll(timeout=1000)
+        time.sleep(.1)
+        received = instream.recv_many(return_data=True)
+        assert len(received) == 6
+        assert received[-1][0] == outstream.last_index == 16
+        for (index, data), chunk in zip(received, chunks + chunks[:1]):
+            assert np.all(data == chunk)
+        
+        outstream.close()
+        instream.close()
+
+
+def test_send_batched():
+    outstream = OutputStream()
+    outstream.configure(protocol='tcp', transfermode='plaindata', dtype='float32',
+                        shape=(-1, 4), batch_max_bytes=3*4*4*10)
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+    
+    data = np.random.rand(100, 4).astype('float32')
+    for i in range(10):
+        outstream.send(data[i*10:(i+1)*10])
+    # the last chunk is still pending
+    outstream.flush()
+    
+    # chunks can be received one by one
+    for i in range(10):
+        assert instream.poll(timeout=1000)
+        index, chunk = instream.recv()
+        assert index == (i+1) * 10
+        assert np.all(chunk == data[i*10:(i+1)*10])
+    assert not instream.poll(timeout=100)
+
+    # extra arguments are given to the sender: pending chunks are sent first
+    outstream.close()
+    instream.close()
+    outstream = OutputStream()
+    outstream.configure(protocol='tcp', transfermode='plaindata', dtype='float32',
+                        shape=(-1, 4), batch_max_bytes=3*4*4*10, inprocess=False)
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+    outstream.send(data[:10])
+    with pytest.raises(TypeError):
+        outstream.send(data[10:20], unknown_option=True)
+    assert instream.poll(timeout=1000)
+    index, chunk = instream.recv()
+    assert index == 10
+    outstream.close()
+    instream.close()
+
+    # chunks with timestamps are batched too
+    outstream = OutputStream()
+    outstream.configure(protocol='tcp', transfermode='plaindata', dtype='float32',
+                        shape=(-1, 4), batch_max_bytes=3*4*4*10, inprocess=False,
+                        timestamps=True, sample_rate=1000.)
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+    for i in range(2):
+        outstream.send(data[i*10:(i+1)*10], timestamp=1000. + i)
+    assert not instream.poll(timeout=100)
+    outstream.send(data[20:30], timestamp=1002.)
+    for i in range(3):
+        assert instream.poll(timeout=1000)
+        index, chunk = instream.recv()
+        assert index == (i+1) * 10
+    assert list(instream.clock.history) == [(10, 1000.), (20, 1001.), (30, 1002.)]
+
+    outstream.close()
+    instream.close()
+
+
+def test_compression_opts():
+    # int16 signal with correlated samples compresses well with delta-zlib
+    data = np.cumsum(np.random.randint(-3, 4, size=(10000, 8)), axis=0).astype('int16')
+    for compression, opts in [('delta-zlib', {'lag': 8, 'level': 3}),
+                              ('auto', {'candidates': ['zlib', 'delta-zlib'], 'interval': 2})]:
+        outstream = OutputStream()
+        outstream.configure(protocol='tcp', transfermode='plaindata', dtype='int16',
+                            shape=(-1, 8), compression=compression, compression_opts=opts)
+        instream = InputStream()
+        instream.connect(outstream)
+        time.sleep(.1)
+        
+        assert outstream.compression_ratio() == 1.
+        for i in range(5):
+            outstream.send(data[i*2000:(i+1)*2000])
+            index, chunk = instream.recv()
+            assert index == (i+1) * 2000
+            assert np.all(chunk == data[i*2000:(i+1)*2000])
+        assert outstream.compression_ratio() > 1.5
+        # decompressed chunks are counted in bytes
+        assert instream.nbytes_copied() == data.nbytes
+        
+        outstream.close()
+        instream.close()
+    
+    # chunks are not compressed when no candidate can be used
+    compressor = AutoCompressor(candidates=['delta-zlib'])
+    method, buf = compressor.compress(b'abcdef', 3)
+    assert method == '' and buf == b'abcdef'
+    
+    # but unexpected errors of a codec are not hidden
+    def broken_compress(data, itemsize):
+        raise RuntimeError("broken codec")
+    register_compression('broken', broken_compress, bytes)
+    try:
+        compressor = AutoCompressor(candidates=['delta-zlib', 'broken'])
+        with pytest.raises(RuntimeError):
+            compressor.compress(b'abcdef', 3)
+    finally:
+        compression_methods.remove('broken')
+
+
+def test_prediction_encoding():
+    data = np.cumsum(np.random.randint(-30, 30, size=(10000, 8)), axis=0).astype('int16')
+    for order in (1, 2):
+        outstream = OutputStream()
+        outstream.configure(protocol='tcp', transfermode='plaindata', dtype='int16',
+                            shape=(-1, 8), compression='zlib', prediction_order=order,
+                            keyframe_interval=3000)
+        instream = InputStream()
+        instream.connect(outstream)
+        time.sleep(.1)
+        
+        for i in range(10):
+            if i == 4:
+                # simulate a chunk lost on the way: encoded but never sent
+                outstream.sender._pack((i+1)*1000, data[i*1000:(i+1)*1000])
+                continue
+            outstream.send(data[i*1000:(i+1)*1000], index=(i+1)*1000)
+        
+        received = instream.recv_many()
+        while instream.poll(timeout=100):
+            received.extend(instream.recv_many())
+        # [5000:6000] cannot be decoded, the next keyframe is [6000:7000]
+        assert [index for index, chunk in received] == [1000, 2000, 3000, 4000, 7000, 8000, 9000, 10000]
+        assert instream.receiver.funcs[0].dropped == 1
+        for index, chunk in received:
+            assert np.all(chunk == data[index-1000:index])
+        
+        outstream.close()
+        instream.close()
+
+
+def test_prediction_index_gap():
+    data = np.cumsum(np.random.randint(-30, 30, size=(10000, 8)), axis=0).astype('int16')
+    outstream = OutputStream()
+    outstream.configure(protocol='tcp', transfermode='plaindata', dtype='int16',
+                        shape=(-1, 8), prediction_order=2)
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+    
+    # the sender skips indexes: this is not a loss, the next chunk is
+    # encoded without history and must be decoded
+    for i in (0, 1, 4, 5, 6, 9):
+        outstream.send(data[i*1000:(i+1)*1000], index=(i+1)*1000)
+    
+    received = instream.recv_many()
+    while instream.poll(timeout=100):
+        received.extend(instream.recv_many())
+    assert [index for index, chunk in received] == [1000, 2000, 5000, 6000, 7000, 10000]
+    assert instream.receiver.funcs[0].dropped == 0
+    for index, chunk in received:
+        assert np.all(chunk == data[index-1000:index])
+    
+    outstream.close()
+    instream.close()
+
+
+def test_lost_keyframe():
+    data = np.cumsum(np.random.randint(-30, 30, size=(4000, 8)), axis=0).astype('int16')
+    outstream = OutputStream()
+    outstream.configure(protocol='tcp', transfermode='plaindata', dtype='int16',
+                        shape=(-1, 8), prediction_order=1, keyframe_interval=3000)
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+    
+    # the first chunk, a keyframe, is lost: the next ones cannot be decoded
+    outstream.sender._pack(1000, data[:1000])
+    for i in (1, 2):
+        outstream.send(data[i*1000:(i+1)*1000], index=(i+1)*1000)
+    time.sleep(.1)
+    # poll() must not report chunks that are dropped, or recv() would block
+    assert not instream.poll(timeout=0)
+    assert not instream.poll(timeout=100)
+    assert instream.receiver.funcs[0].dropped == 2
+    
+    outstream.send(data[3000:4000], index=4000)
+    assert instream.poll(timeout=1000)
+    assert instream.recv(return_data=False) == (4000, None)
+    
+    outstream.close()
+    instream.close()
+
+
+def test_quantization():
+    data = (np.random.randn(5000, 4) * 100).astype('float32')
+    scale, offset = 0.01, [0., 1., 2., 3.]
+    for wire_dtype in ('int16', 'int24'):
+        outstream = OutputStream()
+        outstream.configure(protocol='tcp', transfermode='plaindata', dtype='float32',
+                            shape=(-1, 4), scale=scale, offset=offset, wire_dtype=wire_dtype)
+        instream = InputStream()
+        instream.connect(outstream)
+        rawstream = InputStream(spec={'dequantize': False})
+        rawstream.connect(outstream)
+        rawstream.set_buffer(size=10000)
+        time.sleep(.1)
+        
+        outstream.send(data)
+        index, chunk = instream.recv()
+        assert index == 5000
+        assert chunk.dtype == np.dtype('float32')
+        expected = np.clip(data, -32768 * scale + np.array(offset), 32767 * scale + np.array(offset)) \
+                        if wire_dtype == 'int16' else data
+        assert np.abs(chunk - expected).max() <= scale / 2 + 1e-4
+        
+        index, raw = rawstream.recv()
+        assert raw.dtype == np.dtype('int16' if wire_dtype == 'int16' else 'int32')
+        assert np.all(raw == np.round((expected - offset) / scale))
+        assert np.all(rawstream[0:5000] == raw)
+        
+        outstream.close()
+        instream.close()
+        rawstream.close()
+
+
+def test_stream_drops():
+    data = np.zeros((1000, 4), dtype='float32')
+    for lossless in (False, True):
+        outstream = OutputStream()
+        outstream.configure(protocol='tcp', transfermode='plaindata', dtype='float32',
+                            shape=(-1, 4), sndhwm=5, lossless=lossless)
+        instream = InputStream(spec={'rcvhwm': 5})
+        instream.connect(outstream)
+        time.sleep(.1)
+        
+        received = []
+        def read():
+            # slow consumer
+            time.sleep(.5)
+            while True:
+                index, chunk = instream.recv()
+                received.append(index)
+                if index == 500000:
+                    break
+        thread = threading.Thread(target=read)
+        thread.start()
+        for i in range(499):
+            outstream.send(data)
+        # the last chunk arrives after the consumer caught up
+        time.sleep(.6)
+        outstream.send(data)
+        thread.join()
+        
+        stats = instream.drop_stats()
+        if lossless:
+            assert received == list(range(1000, 501000, 1000))
+            assert stats == {'gaps': 0, 'samples': 0}
+            assert outstream.nb_blocked() > 0
+        else:
+            assert len(received) < 500
+            assert stats['gaps'] > 0
+            assert stats['samples'] == 1000 * (received[-1] // 1000 - len(received))
+        
+        outstream.close()
+        instream.close()
+
+
+def test_stream_asyncio():
+    n = 10
+    outstreams, instreams = [], []
+    for i in range(n):
+        outstream = OutputStream()
+        outstream.configure(protocol='tcp', transfermode='plaindata', dtype='float32',
+                            shape=(-1, 2), lossless=(i % 2 == 0))
+        instream = InputStream()
+        instream.connect(outstream)
+        outstreams.append(outstream)
+        instreams.append(instream)
+    time.sleep(.1)
+    
+    async def consume(instream):
+        indexes = []
+        async for index, data in instream:
+            assert data.shape == (10, 2)
+            indexes.append(index)
+            if index == 50:
+                break
+        return indexes
+    
+    async def produce(outstream):
+        for i in range(5):
+            await outstream.asend(np.zeros((10, 2), dtype='float32'))
+            await asyncio.sleep(.01)
+    
+    async def main():
+        consumers = [asyncio.ensure_future(consume(instream)) for instream in instreams]
+        await asyncio.gather(*[produce(outstream) for outstream in outstreams])
+        return await asyncio.gather(*consumers)
+    
+    results = asyncio.run(main())
+    assert results == [[10, 20, 30, 40, 50]] * n
+    
+    for outstream, instream in zip(outstreams, instreams):
+        outstream.close()
+        instream.close()
+
+
+def test_stream_inprocess():
+    data = np.random.rand(100, 4).astype('float32')
+    for inprocess in (True, 'copy', False, None):
+        outstream = OutputStream()
+        if inprocess is None:
+            # senders may reuse their buffers: chunks are copied by default
+            outstream.configure(protocol='tcp', transfermode='plaindata', dtype='float32',
+                                shape=(-1, 4))
+            inprocess = outstream.params['inprocess']
+            assert inprocess == 'copy'
+        else:
+            outstream.configure(protocol='tcp', transfermode='plaindata', dtype='float32',
+                                shape=(-1, 4), inprocess=inprocess)
+        instream = InputStream()
+        instream.connect(outstream)
+        time.sleep(.1)
+        
+        for i in range(10):
+            outstream.send(data)
+        for i in range(10):
+            assert instream.poll(timeout=1000)
+            index, chunk = instream.recv()
+            assert index == (i + 1) * 100
+            assert np.array_equal(chunk, data)
+            if inprocess:
+                assert not chunk.flags['WRITEABLE']
+            assert np.shares_memory(chunk, data) == (inprocess is True)
+        assert not instream.poll(timeout=0)
+        
+        if inprocess:
+            # nothing is serialized when no other process is connected
+            assert isinstance(instream.receiver, LocalReceiver)
+            assert outstream.sender.nbytes_raw == 0
+            
+            # streams connected with the parameters go through the socket
+            instream2 = InputStream()
+            instream2.connect(dict(outstream.params))
+            time.sleep(.2)
+            outstream.send(data)
+            for stream in (instream, instream2):
+                assert stream.poll(timeout=1000)
+                index, chunk = stream.recv()
+                assert index == 1100
+                assert np.array_equal(chunk, data)
+            assert outstream.sender.nbytes_raw == data.nbytes
+            instream2.close()
+        else:
+            assert not isinstance(instream.receiver, LocalReceiver)
+        
+        outstream.close()
+        instream.close()
+
+
+def test_stream_multicast():
+    outstream = OutputStream()
+    outstream.configure(protocol='tcp', transfermode='multicast', dtype='float32',
+                        shape=(-1, 16), multicast_interface='127.0.0.1', udp_packet_size=1000)
+    assert outstream.params['multicast_port'] > 0
+    # all receivers get the same datagrams
+    instreams = []
+    for i in range(3):
+        instream = InputStream()
+        instream.connect(outstream)
+        instreams.append(instream)
+    time.sleep(.1)
+    
+    # chunks of 1 to 20 datagrams
+    data = np.random.rand(1000, 16).astype('float32')
+    sizes = [10, 300, 1, 0, 200, 489]
+    pos = 0
+    for size in sizes:
+        outstream.send(data[pos:pos+size])
+        pos += size
+    
+    for instream in instreams:
+        pos = 0
+        for size in sizes:
+            assert instream.poll(timeout=1000)
+            index, chunk = instream.recv()
+            pos += size
+            assert index == pos
+            assert np.array_equal(chunk, data[pos-size:pos])
+        assert not instream.poll(timeout=50)
+    
+    # lost datagrams are reported as gaps
+    instream = instreams[0]
+    instream.receiver.udp_socket.setblocking(True)
+    outstream.send(data[:100])
+    instream.receiver.udp_socket.recv(65536)  # lose the first datagram
+    instream.receiver.udp_socket.setblocking(False)
+    outstream.send(data[100:200])
+    index, chunk = instream.recv()
+    assert index == 1200
+    assert instream.receiver.nb_lost_messages == 1
+    assert instream.drop_stats() == {'gaps': 1, 'samples': 100}
+    
+    # datagrams of another stream on the same port, and malformed datagrams,
+    # are ignored
+    other = OutputStream()
+    other.configure(protocol='tcp', transfermode='multicast', dtype='float32',
+                    shape=(-1, 16), multicast_interface='127.0.0.1',
+                    multicast_port=outstream.params['multicast_port'])
+    assert other.params['multicast_stream_id'] != outstream.params['multicast_stream_id']
+    other.send(data[:10])
+    bad = struct.pack('!IQHH', outstream.params['multicast_stream_id'], 10**6, 5, 2)
+    other.sender.udp_socket.sendto(bad, other.sender._addr)
+    other.sender.udp_socket.sendto(b'xx', other.sender._addr)
+    outstream.send(data[:10])
+    index, chunk = instream.recv()
+    assert index == outstream.last_index
+    assert np.array_equal(chunk, data[:10])
+    assert not instream.poll(timeout=50)
+    assert instream.receiver.nb_invalid_packets == 3
+    other.close()
+    
+    outstream.close()
+    for instream in instreams:
+        instream.close()
+
+
+def test_stream_timestamps():
+    sr = 1000.
+    data = np.random.rand(50, 4).astype('float32')
+    configs = [
+        dict(transfermode='plaindata', inprocess=False),
+        dict(transfermode='plaindata', inprocess=True),
+        dict(transfermode='plaindata', inprocess=False, compression='blosc-lz4'),
+        dict(transfermode='sharedmem', buffer_size=1000),
+    ]
+    for config in configs:
+        if config.get('compression') not in (None, *compression_methods):
+            continue
+        outstream = OutputStream()
+        outstream.configure(protocol='tcp', dtype='float32', shape=(-1, 4), sample_rate=sr,
+                            timestamps=True, **config)
+        instream = InputStream()
+        instream.connect(outstream)
+        time.sleep(.1)
+        assert instream.clock is not None and not instream.clock.ready
+        
+        # device clock runs 1% faster than the nominal rate, with jitter
+        t0 = 1000.
+        for i in range(40):
+            index = (i + 1) * 50
+            outstream.send(data, timestamp=t0 + index / (sr * 1.01) + np.random.rand() * 1e-4)
+        # batch of chunks with their timestamps
+        outstream.send_many([(None, data), (None, data)],
+                            timestamps=[t0 + 2050 / (sr * 1.01), t0 + 2100 / (sr * 1.01)])
+        for i in range(42):
+            assert instream.poll(timeout=1000)
+            index, chunk = instream.recv()
+            assert index == (i + 1) * 50
+        
+        clock = instream.clock
+        assert clock.ready
+        assert abs(clock.rate - sr * 1.01) < 1
+        assert clock.jitter < 1e-4
+        assert abs(clock.time(2100) - (t0 + 2100 / (sr * 1.01))) < 1e-4
+        assert abs(clock.index(clock.time(1234.5)) - 1234.5) < 1e-6
+        clock.offset = 10.
+        assert abs(clock.time(2100) - (t0 - 10 + 2100 / (sr * 1.01))) < 1e-4
+        
+        # default timestamps are taken when sending
+        before = time.perf_counter()
+        outstream.send(data)
+        assert instream.poll(timeout=1000)
+        instream.recv()
+        assert before <= clock.history[-1][1] <= time.perf_counter()
+        
+        # only the last chunk of send_many() gets the current time
+        nb_history = len(clock.history)
+        outstream.send_many([(None, data), (None, data), (None, data)])
+        for i in range(3):
+            assert instream.poll(timeout=1000)
+            index, chunk = instream.recv()
+        assert len(clock.history) == nb_history + 1
+        assert clock.history[-1][0] == index
+        
+        outstream.close()
+        instream.close()
+    
+    # streams without timestamps have no clock
+    outstream = OutputStream()
+    outstream.configure(protocol='tcp', transfermode='plaindata', dtype='float32', shape=(-1, 4))
+    instream = InputStream()
+    instream.connect(outstream)
+    assert instream.clock is None
+    outstream.close()
+    instream.close()
+
+
+def test_stream_stats():
+    data = np.random.rand(100, 4).astype('float32')
+    for config in [dict(transfermode='plaindata', inprocess=False),
+                   dict(transfermode='plaindata', inprocess=True),
+                   dict(transfermode='sharedmem', buffer_size=1000)]:
+        outstream = OutputStream()
+        outstream.configure(protocol='tcp', dtype='float32', shape=(-1, 4), latency=True, **config)
+        instream = InputStream()
+        instream.connect(outstream)
+        time.sleep(.1)
+        
+        stats = instream.stats()
+        assert stats['chunks'] == 0 and stats['latency'] is None
+        
+        for i in range(10):
+            outstream.send(data)
+        time.sleep(.05)
+        for i in range(10):
+            assert instream.poll(timeout=1000)
+            instream.recv(return_data=True)
+        stats = instream.stats(reset=True)
+        assert stats['chunks'] == 10
+        assert stats['bytes'] == 10 * data.nbytes
+        assert stats['bytes_per_s'] > 0
+        assert stats['gaps'] == 0 and stats['dropped'] == 0
+        latency = stats['latency']
+        # chunks waited in the queue for at least 50 ms
+        assert 0.05 <= latency['p50'] <= latency['p99'] <= latency['max'] < 1.
+        assert instream.stats()['chunks'] == 0
+        
+        assert outstream.stats()['index'] == 1000
+        
+        outstream.close()
+        instream.close()
+    
+    # batches of chunks are counted when they are received
+    outstream = OutputStream()
+    outstream.configure(protocol='tcp', transfermode='plaindata', dtype='float32', shape=(-1, 4),
+                        inprocess=False)
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+    outstream.send_many([(None, data)] * 5)
+    assert instream.poll(timeout=1000)
+    instream.recv()
+    stats = instream.stats()
+    assert stats['chunks'] == 1 and stats['queue_depth'] == 4
+    assert stats['latency'] is None
+    instream.recv_many()
+    assert instream.stats()['chunks'] == 5
+    outstream.close()
+    instream.close()
+    
+    # latency includes the time spent in a batch
+    for inprocess in (False, True):
+        outstream = OutputStream()
+        outstream.configure(protocol='tcp', transfermode='plaindata', dtype='float32', shape=(-1, 4),
+                            inprocess=inprocess, latency=True, batch_max_bytes=10**6)
+        instream = InputStream()
+        instream.connect(outstream)
+        time.sleep(.1)
+        outstream.send(data)
+        time.sleep(.1)
+        outstream.flush()
+        assert instream.poll(timeout=1000)
+        instream.recv()
+        assert instream.stats()['latency']['max'] >= 0.1
+        outstream.close()
+        instream.close()
+
 
 if __name__ == '__main__':
     test_stream_plaindata()
     test_stream_sharedmem()
+    test_stream_sharedmem_events()
     test_plaindata_ringbuffer()
     test_sharedmem_ringbuffer()
+    test_sharedmem_recv_validate()
+    test_send_many()
+    test_send_batched()
     
-
+    test_compression_opts()
+    test_prediction_encoding()
+    test_lost_keyframe()
+    test_quantization()
+    test_stream_drops()
+    test_stream_asyncio()
+    test_stream_inprocess()
+    test_stream_multicast()
+    test_stream_timestamps()
+    test_stream_stats()
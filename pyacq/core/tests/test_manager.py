@@ -91,6 +91,36 @@ def test_close_manager_explicit():
     man.close()
 
 
+def test_manager_stream_stats():
+    man = create_manager(auto_close_at_exit=False)
+    ng = man.create_nodegroup(name='stats_nodegroup')
+    ng.register_node_type_from_module('pyacq.core.tests.fakenodes', 'FakeSender')
+    ng.register_node_type_from_module('pyacq.core.tests.fakenodes', 'FakeReceiver')
+    sender = ng.create_node('FakeSender', name='sender')
+    sender.configure()
+    sender.outputs['signals'].configure(protocol='tcp', interface='127.0.0.1', transfermode='plaindata',
+                                        dtype='float32', shape=(-1, 16), latency=True)
+    sender.initialize()
+    receiver = ng.create_node('FakeReceiver', name='receiver')
+    receiver.configure()
+    receiver.input.connect(sender.output)
+    receiver.initialize()
+    
+    ng.start_all_nodes()
+    time.sleep(1.)
+    ng.stop_all_nodes()
+    
+    stats = man.stream_stats()['stats_nodegroup']
+    assert stats['sender']['inputs'] == {}
+    assert stats['sender']['outputs']['signals']['index'] > 0
+    input_stats = stats['receiver']['inputs']['signals']
+    assert input_stats['chunks'] > 0
+    assert input_stats['bytes'] == input_stats['chunks'] * 256 * 16 * 4
+    assert 0 <= input_stats['latency']['p50'] <= input_stats['latency']['max']
+    
+    man.close()
+
+
 #@pytest.mark.skipif(True, reason='atexit not work at travis')
 #def test_close_manager_implicit():
     #man = create_manager(auto_close_at_exit=True)
@@ -107,4 +137,5 @@ def test_close_manager_explicit():
 if __name__ == '__main__':
     test_manager()
     test_close_manager_explicit()
+    test_manager_stream_stats()
     #~ test_close_manager_implicit()
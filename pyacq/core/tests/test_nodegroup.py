@@ -47,7 +47,38 @@ def test_nodegroup0():
     proc.stop()
 
 
+def test_nodegroup_cache_attrs():
+    proc, host = Host.spawn('host1')
+    ng = host.create_nodegroup('nodegroup')
+    ng.register_node_type_from_module('pyacq.core.tests.fakenodes', 'FakeSender')
+    node = ng.create_node('FakeSender', name='sender')
+    cached = node._copy()
+    cached._set_proxy_options(cache_attrs=True)
+    
+    node.configure()
+    node.output.configure(protocol='tcp', transfermode='plaindata', dtype='float32', shape=(-1, 16))
+    assert cached.output.params._get_value()['dtype'] == 'float32'
+    assert cached.output.params._get_value()['dtype'] == 'float32'
+    
+    # changes made through proxies without cache are seen
+    node.output.configure(protocol='tcp', transfermode='plaindata', dtype='int16', shape=(-1, 16))
+    assert cached.output.params._get_value()['dtype'] == 'int16'
+    
+    # and so are changes made by the NodeGroup in its own process
+    node.initialize()
+    version = node._cache_version._get_value()
+    ng.start_all_nodes()
+    assert node._cache_version._get_value() > version
+    assert cached.output.params._get_value()['dtype'] == 'int16'
+    ng.stop_all_nodes()
+    
+    ng.remove_node(node)
+    ng.close()
+    proc.stop()
+
+
 if __name__ == '__main__':
     test_nodegroup0()
+    test_nodegroup_cache_attrs()
 
 
@@ -3,7 +3,7 @@
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
 from pyacq.core import OutputStream, InputStream
-from pyacq.core.tools import ThreadPollInput, StreamConverter, ChannelSplitter, ChunkResizer
+from pyacq.core.tools import ThreadPollInput, MultiPoller, StreamConverter, ChannelSplitter, ChunkResizer, ThreadChunkResizer
 from pyqtgraph.Qt import QtCore, QtGui
 import pyqtgraph as pg
 
@@ -34,7 +34,6 @@ class ThreadSender(QtCore.QThread):
             arr = np.random.rand(chunksize, nb_channel).astype(stream_spec['dtype'])
             self.output_stream().send(arr, index=index)
             time.sleep(chunksize/sr)
-        self.finished.emit()
 
 
 def test_ThreadPollInput():
@@ -72,6 +71,127 @@ def test_ThreadPollInput():
     app.exec_()
 
 
+def test_MultiPoller():
+    app = pg.mkQApp()
+    
+    n = 5
+    outstreams, instreams, senders = [], [], []
+    for i in range(n):
+        outstream = OutputStream()
+        outstream.configure(**stream_spec)
+        instream = InputStream(name='in{}'.format(i))
+        instream.connect(outstream)
+        outstreams.append(outstream)
+        instreams.append(instream)
+        senders.append(ThreadSender(output_stream=outstream))
+    
+    poller = MultiPoller()
+    # first stream uses a callback from the poller thread, others the signal
+    callback_pos = []
+    poller.add_input(instreams[0], callback=lambda pos, arr: callback_pos.append(pos), return_data=True)
+    for instream in instreams[1:]:
+        poller.add_input(instream, return_data=True)
+    
+    last_pos = {instream.name: 0 for instream in instreams[1:]}
+    def on_new_data(name, pos, arr):
+        assert arr.shape==(chunksize, nb_channel)
+        last_pos[name] += chunksize
+        assert last_pos[name]==pos
+    poller.new_data.connect(on_new_data)
+    
+    finished = []
+    def terminate():
+        finished.append(True)
+        if len(finished) != n:
+            return
+        for sender in senders:
+            sender.wait()
+        # let the poller receive the last chunks
+        time.sleep(.2)
+        poller.stop()
+        poller.wait()
+        app.processEvents()
+        app.quit()
+    
+    for sender in senders:
+        sender.finished.connect(terminate)
+    poller.start()
+    for sender in senders:
+        sender.start()
+    
+    app.exec_()
+    
+    assert callback_pos == list(range(chunksize, chunksize*501, chunksize))
+    assert all(pos == chunksize * 500 for pos in last_pos.values()), last_pos
+    assert poller.pos('in0') == chunksize * 500
+
+
+def test_MultiPoller_fairness():
+    # a stream with many pending chunks does not starve the others
+    fast_out, slow_out = OutputStream(), OutputStream()
+    fast_out.configure(**stream_spec)
+    slow_out.configure(**stream_spec)
+    fast_in, slow_in = InputStream(name='fast'), InputStream(name='slow')
+    fast_in.connect(fast_out)
+    slow_in.connect(slow_out)
+    time.sleep(.2)
+    
+    chunk = np.zeros((chunksize, nb_channel), dtype='float32')
+    # a single message that holds 200 chunks
+    fast_out.send_many([(None, chunk)] * 200)
+    slow_out.send(chunk)
+    time.sleep(.2)
+    
+    received = []
+    poller = MultiPoller(timeout=None, max_chunks=8)
+    poller.add_input(fast_in, callback=lambda pos, arr: received.append('fast'), return_data=True)
+    poller.add_input(slow_in, callback=lambda pos, arr: received.append('slow'), return_data=True)
+    poller.start()
+    time.sleep(.5)
+    poller.stop()
+    assert poller.wait(1000)
+    
+    assert len(received) == 201
+    assert received.index('slow') <= 8
+    
+    for s in (fast_out, slow_out, fast_in, slow_in):
+        s.close()
+
+
+def test_poller_stop_wakeup():
+    # stop() must not wait for the poll timeout, which can be infinite
+    app = pg.mkQApp()
+    
+    outstream = OutputStream()
+    outstream.configure(**stream_spec)
+    instream = InputStream()
+    instream.connect(outstream)
+    
+    for poller in [ThreadPollInput(input_stream=instream, timeout=None), MultiPoller(timeout=None)]:
+        if isinstance(poller, MultiPoller):
+            poller.add_input(instream)
+        poller.start()
+        time.sleep(.2)
+        assert poller.isRunning()
+        t0 = time.perf_counter()
+        poller.stop()
+        assert poller.wait(1000)
+        assert time.perf_counter() - t0 < .5
+    
+    # inputs added to a running MultiPoller are polled right away
+    received = []
+    poller = MultiPoller(timeout=None)
+    poller.start()
+    time.sleep(.2)
+    poller.add_input(instream, callback=lambda pos, arr: received.append(pos), return_data=True)
+    time.sleep(.2)
+    outstream.send(np.zeros((chunksize, nb_channel), dtype='float32'))
+    time.sleep(.2)
+    poller.stop()
+    poller.wait()
+    assert received == [chunksize]
+
+
 def test_streamconverter():
     app = pg.mkQApp()
     
@@ -128,6 +248,57 @@ def test_streamconverter():
     app.exec_()
 
 
+def test_streamconverter_plan():
+    # channel selection, scale, offset and cast in one pass
+    outstream = OutputStream()
+    outstream.configure(**dict(stream_spec, dtype='int16'))
+    
+    for channels in ([2, 3, 4, 5], [7, 1, 3]):
+        conv = StreamConverter()
+        conv.configure(channels=channels, scale=0.5, offset=np.arange(len(channels)))
+        conv.input.connect(outstream)
+        conv.output.configure(protocol='tcp', interface='127.0.0.1', port='*', dtype='float32',
+                              transfermode='sharedmem', streamtype='analogsignal', buffer_size=1000,
+                              axisorder=[1, 0], shape=(-1, len(channels)), double=True)
+        conv.initialize()
+        assert conv.plan['order'] == 'F'
+        
+        instream = InputStream()
+        instream.connect(conv.output)
+        instream.set_buffer(size=1000, double=True)
+        
+        sig = np.random.randint(-1000, 1000, size=(600, nb_channel)).astype('int16')
+        for i in range(6):
+            conv.thread.process_data((i+1)*100, sig[i*100:(i+1)*100])
+        expected = sig[:, channels] * 0.5 + np.arange(len(channels))
+        assert np.array_equal(instream.get_data(0, 600), expected.astype('float32'))
+        
+        instream.close()
+        conv.close()
+    outstream.close()
+
+
+def test_streamconverter_round():
+    # float to integer conversions round to the nearest value in range
+    outstream = OutputStream()
+    outstream.configure(**dict(stream_spec, dtype='float32'))
+    conv = StreamConverter()
+    conv.configure(scale=2.)
+    conv.input.connect(outstream)
+    conv.output.configure(protocol='tcp', interface='127.0.0.1', port='*', dtype='int16',
+                          transfermode='plaindata', shape=(-1, nb_channel))
+    conv.initialize()
+    
+    sig = np.zeros((3, nb_channel), dtype='float32')
+    sig[:, 0] = [0.8, -0.8, 20000.]
+    out = conv.thread._convert(sig)
+    assert out.dtype == np.dtype('int16')
+    assert list(out[:, 0]) == [2, -2, 32767]
+    
+    conv.close()
+    outstream.close()
+
+
 def test_stream_splitter():
     app = pg.mkQApp()
     
@@ -174,6 +345,62 @@ def test_stream_splitter():
     app.exec_()
 
 
+def test_stream_splitter_sharedmem():
+    # outputs are views on the shared buffer of the input
+    outstream = OutputStream()
+    spec = dict(stream_spec, transfermode='sharedmem', buffer_size=10000, double=True, axisorder=[1, 0])
+    outstream.configure(**spec)
+    
+    # outputs copy the data unless zero_copy is requested
+    splitter = ChannelSplitter()
+    splitter.configure(output_channels={'out0': [0, 1]})
+    splitter.input.connect(outstream)
+    splitter.outputs['out0'].configure(transfermode='sharedmem', buffer_size=1000)
+    assert splitter.outputs['out0'].params['transfermode'] == 'sharedmem'
+    splitter.close()
+    
+    splitter = ChannelSplitter()
+    splitter.configure(output_channels={'shank0': [0, 1, 2, 3], 'shank1': [4, 5, 6, 7], 'other': [1, 9, 12]},
+                       zero_copy=True)
+    splitter.input.connect(outstream)
+    instreams = {}
+    for name, output in splitter.outputs.items():
+        output.configure()
+        assert output.params['transfermode'] == 'sharedmem_view'
+        instreams[name] = InputStream()
+        instreams[name].connect(output)
+        instreams[name].set_buffer(size=10000, double=True)
+        assert not instreams[name]._own_buffer
+    splitter.initialize()
+    splitter.start()
+    time.sleep(.2)
+    
+    sig = np.random.rand(500, nb_channel).astype('float32')
+    for i in range(5):
+        outstream.send(sig[i*100:(i+1)*100])
+    
+    for name, chans in splitter.output_channels.items():
+        instream = instreams[name]
+        for i in range(5):
+            assert instream.poll(timeout=1000)
+            index, data = instream.recv(return_data=True)
+            assert index == (i+1) * 100
+            assert np.array_equal(data, sig[i*100:(i+1)*100, chans])
+        assert instream[400:500].shape == (100, len(chans))
+        assert np.array_equal(instream.get_data(0, 500, copy=True), sig[:, chans])
+    
+    # contiguous channel groups are read without copy
+    data = instreams['shank1'].get_data(0, 500)
+    assert not data.flags['OWNDATA']
+    assert data.base is not None
+    assert data.strides == (4, 10000 * 2 * 4)
+    
+    splitter.stop()
+    for instream in instreams.values():
+        instream.close()
+    outstream.close()
+
+
 def test_ChunkResizer():
     app = pg.mkQApp()
     
@@ -191,6 +418,7 @@ def test_ChunkResizer():
     def on_new_data(pos, arr):
         #~ print('recv', arr.shape, pos)
         assert arr.shape[0] == 33
+        assert pos % 33 == 0
     
     instream = InputStream()
     instream.connect(chunkresizer.output)
@@ -213,11 +441,99 @@ def test_ChunkResizer():
     
     
     app.exec_()
+
+
+def test_ChunkResizer_step():
+    # overlapping chunks with input chunks of various sizes
+    outstream = OutputStream()
+    outstream.configure(**stream_spec)
+    instream = InputStream()
+    instream.connect(outstream)
+    sig = np.random.rand(5000, nb_channel).astype('float32')
+    
+    for step in (16, 100):
+        resized = OutputStream()
+        resized.configure(**stream_spec)
+        check = InputStream()
+        check.connect(resized)
+        # output indexes must follow each other for buffered consumers
+        buffered = InputStream()
+        buffered.connect(resized)
+        buffered.set_buffer(size=1000)
+        time.sleep(.2)
+        
+        resizer = ThreadChunkResizer(instream, resized, chunksize=64, step=step)
+        pos = 0
+        for size in [7, 100, 64, 1, 300, 2000, 64, 64, 2400]:
+            resizer.process_data(pos + size, sig[pos:pos+size])
+            pos += size
+        assert pos == sig.shape[0]
+        
+        index = 64
+        while resizer.window_start(index) + 64 <= sig.shape[0]:
+            start = resizer.window_start(index)
+            assert start % step == 0
+            for s in (check, buffered):
+                assert s.poll(timeout=1000)
+                recv_index, data = s.recv(return_data=True)
+                assert recv_index == index
+                assert np.array_equal(data, sig[start:start+64])
+            index += 64
+        assert not check.poll(timeout=100)
+        assert buffered.drop_stats() == {'gaps': 0, 'samples': 0}
+        assert np.array_equal(buffered[index-128:index-64], sig[resizer.window_start(index-64):][:64])
+        
+        for s in (resized, check, buffered):
+            s.close()
     
+    for s in (outstream, instream):
+        s.close()
+
+
+def test_ChunkResizer_step_sharedmem():
+    # overlapping chunks are written to the buffer of a sharedmem output
+    outstream = OutputStream()
+    outstream.configure(**stream_spec)
     
+    chunkresizer = ChunkResizer()
+    chunkresizer.configure(chunksize=100, step=25)
+    chunkresizer.input.connect(outstream)
+    chunkresizer.output.configure(transfermode='sharedmem', buffer_size=1000, double=True)
+    chunkresizer.initialize()
+    check = InputStream()
+    check.connect(chunkresizer.output)
+    check.set_buffer(size=1000, double=True)
+    time.sleep(.2)
+    
+    sig = np.random.rand(1000, nb_channel).astype('float32')
+    for i in range(10):
+        chunkresizer.thread.process_data((i+1)*100, sig[i*100:(i+1)*100])
+    
+    for k in range(37):
+        assert check.poll(timeout=1000)
+        index, _ = check.recv()
+        assert index == (k+1) * 100
+        assert chunkresizer.window_start(index) == k * 25
+    assert not check.poll(timeout=100)
+    for k in range(27, 37):
+        start = chunkresizer.window_start((k+1) * 100)
+        assert np.array_equal(check[k*100:(k+1)*100], sig[start:start+100])
+    
+    check.close()
+    chunkresizer.close()
+    outstream.close()
+
 
 if __name__ == '__main__':
     test_ThreadPollInput()
+    test_MultiPoller()
+    test_MultiPoller_fairness()
+    test_poller_stop_wakeup()
     test_streamconverter()
+    test_streamconverter_plan()
+    test_streamconverter_round()
     test_stream_splitter()
+    test_stream_splitter_sharedmem()
     test_ChunkResizer()
+    test_ChunkResizer_step()
+    test_ChunkResizer_step_sharedmem()
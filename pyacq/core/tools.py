@@ -4,8 +4,11 @@
 
 import time
 import weakref
+import functools
 import logging
 import atexit
+import random
+import string
 import numpy as np
 import zmq
 from collections import OrderedDict
@@ -13,10 +16,60 @@ from pyqtgraph.Qt import QtCore, QtGui
 from pyqtgraph.util.mutex import Mutex
 
 from .node import Node, register_node_type
-from .stream import OutputStream, InputStream
+from .stream import OutputStream, InputStream, RingBuffer
 from .stream.arraytools import make_dtype
 
 
+class _Wakeup:
+    """inproc socket pair used to interrupt a zmq poll from another thread.
+    
+    The polling thread calls open() and polls the returned socket together
+    with its data sockets; any thread can then call wake().
+    """
+    def __init__(self):
+        self.address = 'inproc://pyacq_wakeup_' + ''.join(random.SystemRandom().choice(string.ascii_uppercase + string.digits) for _ in range(24))
+        self.socket = None
+    
+    def open(self):
+        self.socket = zmq.Context.instance().socket(zmq.PULL)
+        self.socket.bind(self.address)
+        return self.socket
+    
+    def close(self):
+        self.socket.close(linger=0)
+        self.socket = None
+    
+    def wake(self):
+        # zmq sockets are not thread safe: use a new one for each call
+        socket = zmq.Context.instance().socket(zmq.PUSH)
+        socket.linger = 0
+        socket.connect(self.address)
+        try:
+            socket.send(b'', zmq.NOBLOCK)
+        except zmq.Again:
+            # the polling thread is not running
+            pass
+        socket.close()
+    
+    def drain(self):
+        while self.socket.poll(timeout=0):
+            self.socket.recv()
+
+
+def _recv_chunks(input_stream, return_data, max_chunks, handler):
+    # Receive at most max_chunks chunks that are ready on input_stream and
+    # call handler(pos, data) for each; return True if chunks are left, so
+    # that a fast stream does not delay the other streams or stop().
+    # The receiver may hold chunks that were already read from the socket
+    # (a single message may hold several chunks, see send_many).
+    for i in range(max_chunks):
+        if not input_stream.poll(timeout=0):
+            return False
+        pos, data = input_stream.recv(return_data=return_data)
+        handler(pos, data)
+    return input_stream.poll(timeout=0)
+
+
 class ThreadPollInput(QtCore.QThread):
     """Thread that polls an InputStream in the background and emits a signal
     when data is received.
@@ -32,23 +85,27 @@ class ThreadPollInput(QtCore.QThread):
     ----------
     input_stream : InputStream
         The stream on which to receive data.
-    timeout : int
-        Poll timeout in ms. The thread will unblock at this interval to check
-        for calls to `stop()`.
+    timeout : int or None
+        Poll timeout in ms. `stop()` wakes up the thread immediately, so this
+        can be None (no timeout).
     return_data : bool
         If True, then the `new_data` signal will be emitted with the received
         data array. If False, then only the new stream pointer is emitted.
     parent : QObject or None
         QObject parent for the poller QThread.
+    max_chunks : int
+        Maximum number of chunks received between two checks of the stop
+        flag.
     
     The `process_data()` method may be reimplemented to define other behaviors.
     """
     new_data = QtCore.Signal(int, object)
     
-    def __init__(self, input_stream, timeout=200, return_data=None, parent=None):
+    def __init__(self, input_stream, timeout=200, return_data=None, parent=None, max_chunks=16):
         QtCore.QThread.__init__(self, parent)
         self.input_stream = weakref.ref(input_stream)
         self.timeout = timeout
+        self.max_chunks = max_chunks
         self.return_data = return_data
         if self.return_data is None:
             self.return_data = self.input_stream()._own_buffer
@@ -57,29 +114,40 @@ class ThreadPollInput(QtCore.QThread):
         self.running_lock = Mutex()
         self.lock = Mutex()
         self._pos = None
+        self._wakeup = _Wakeup()
         atexit.register(self.stop)
     
     def run(self):
         with self.running_lock:
             self.running = True
         
-        while True:
-            with self.running_lock:
-                if not self.running:
+        # wait on the data socket and on the wakeup socket used by stop()
+        poller = zmq.Poller()
+        poller.register(self.input_stream().receiver.pollable, zmq.POLLIN)
+        poller.register(self._wakeup.open(), zmq.POLLIN)
+        try:
+            while True:
+                with self.running_lock:
+                    if not self.running:
+                        break
+                if self.input_stream() is None:
+                    logging.info("ThreadPollInput has lost InputStream")
                     break
-            if self.input_stream() is None:
-                logging.info("ThreadPollInput has lost InputStream")
-                break
-            ev = self.input_stream().poll(timeout=self.timeout)
-            if ev>0:
-                try:
-                    pos, data = self.input_stream().recv(return_data=self.return_data)
-                except zmq.error.ContextTerminated:
-                    self.stop()
-                    return
-                with self.lock:
-                    self._pos = pos
-                self.process_data(self._pos, data)
+                # the receiver may hold chunks that were already read from the socket
+                if not self.input_stream().poll(timeout=0):
+                    poller.poll(timeout=self.timeout)
+                    self._wakeup.drain()
+                    continue
+                _recv_chunks(self.input_stream(), self.return_data, self.max_chunks, self._new_chunk)
+        except zmq.error.ContextTerminated:
+            self.stop()
+        finally:
+            self._wakeup.close()
+    
+    def _new_chunk(self, pos, data):
+        with self.lock:
+            self._pos = pos
+        self.process_data(pos, data)
     
     def process_data(self, pos, data):
         """This method is called from the polling thread when a new data chunk
@@ -92,9 +160,12 @@ class ThreadPollInput(QtCore.QThread):
     
     def stop(self):
         """Request the polling thread to stop.
+        
+        The thread is woken up immediately if it is waiting for data.
         """
         with self.running_lock:
             self.running = False
+        self._wakeup.wake()
     
     def pos(self):
         """Return the current stream position.
@@ -103,6 +174,164 @@ class ThreadPollInput(QtCore.QThread):
             return self._pos
 
 
+class MultiPoller(QtCore.QThread):
+    """Thread that polls many InputStreams with a single zmq.Poller.
+    
+    Each stream is registered with :func:`add_input` and an optional callback.
+    When a chunk is received, the callback is called from the polling thread
+    with the new position of the stream and the data as arguments; streams
+    without callback emit the ``new_data`` signal with the stream name, the
+    new position and the data instead.
+    
+    Compared with one :class:`ThreadPollInput` per stream, this saves one
+    thread per stream and all streams share the same stop flag.
+    
+    Parameters
+    ----------
+    timeout : int or None
+        Poll timeout in ms. `stop()` and changes of the polled streams wake up
+        the thread immediately, so this can be None (no timeout).
+    parent : QObject or None
+        QObject parent for the poller QThread.
+    max_chunks : int
+        Maximum number of chunks received from one stream before the other
+        streams are served. Chunks that are left are received in the next
+        round, so a fast stream cannot starve the others or delay `stop()`.
+    """
+    new_data = QtCore.Signal(str, int, object)
+    
+    def __init__(self, timeout=200, parent=None, max_chunks=16):
+        QtCore.QThread.__init__(self, parent)
+        self.timeout = timeout
+        self.max_chunks = max_chunks
+        
+        # name: (weakref to InputStream, callback, return_data)
+        self.inputs = OrderedDict()
+        self.inputs_lock = Mutex()
+        self._inputs_changed = True
+        
+        self.running = False
+        self.running_lock = Mutex()
+        self.lock = Mutex()
+        self._pos = {}
+        self._wakeup = _Wakeup()
+        atexit.register(self.stop)
+    
+    def add_input(self, input_stream, callback=None, return_data=None, name=None):
+        """Add an InputStream to poll.
+        
+        Parameters
+        ----------
+        input_stream : InputStream
+            The stream on which to receive data.
+        callback : callable or None
+            Function called as ``callback(pos, data)`` from the polling thread
+            for each chunk. If None, the ``new_data`` signal is emitted.
+        return_data : bool or None
+            If True, then data is received with the chunk. If False, then only
+            the new stream pointer is given. If None, data is returned when the
+            stream populates its own RingBuffer.
+        name : str or None
+            Name given to the ``new_data`` signal. The default is the name of
+            the stream.
+        """
+        if name is None:
+            name = input_stream.name
+        if return_data is None:
+            return_data = input_stream._own_buffer
+        with self.inputs_lock:
+            if name in self.inputs:
+                raise ValueError("An input named %r is already polled" % name)
+            self.inputs[name] = (weakref.ref(input_stream), callback, return_data)
+            self._inputs_changed = True
+        self._wakeup.wake()
+    
+    def remove_input(self, name):
+        """Stop polling the InputStream that was added with *name*.
+        """
+        with self.inputs_lock:
+            del self.inputs[name]
+            self._inputs_changed = True
+        self._wakeup.wake()
+    
+    def run(self):
+        with self.running_lock:
+            self.running = True
+        
+        wakeup_socket = self._wakeup.open()
+        try:
+            self._run(wakeup_socket)
+        except zmq.error.ContextTerminated:
+            self.stop()
+        finally:
+            self._wakeup.close()
+    
+    def _run(self, wakeup_socket):
+        poller = None
+        # sockets of the streams that still had chunks after the last round
+        pending = set()
+        while True:
+            with self.running_lock:
+                if not self.running:
+                    break
+            
+            with self.inputs_lock:
+                if self._inputs_changed:
+                    poller = zmq.Poller()
+                    poller.register(wakeup_socket, zmq.POLLIN)
+                    sockets = {}
+                    for name, (input_stream, callback, return_data) in self.inputs.items():
+                        if input_stream() is None:
+                            logging.info("MultiPoller has lost InputStream %s", name)
+                            continue
+                        pollable = input_stream().receiver.pollable
+                        poller.register(pollable, zmq.POLLIN)
+                        # zmq.Poller returns file descriptors for other objects
+                        if not isinstance(pollable, zmq.Socket):
+                            pollable = pollable.fileno()
+                        handler = functools.partial(self._new_chunk, name, callback)
+                        sockets[pollable] = (input_stream, handler, return_data)
+                    pending &= set(sockets)
+                    self._inputs_changed = False
+            
+            events = poller.poll(timeout=0 if len(pending) > 0 else self.timeout)
+            
+            for socket, ev in events:
+                if socket is wakeup_socket:
+                    self._wakeup.drain()
+                else:
+                    pending.add(socket)
+            
+            for socket in list(pending):
+                input_stream, handler, return_data = sockets[socket]
+                input_stream = input_stream()
+                if input_stream is None or not _recv_chunks(input_stream, return_data, self.max_chunks, handler):
+                    pending.discard(socket)
+    
+    def _new_chunk(self, name, callback, pos, data):
+        with self.lock:
+            self._pos[name] = pos
+        if callback is None:
+            self.new_data.emit(name, pos, data)
+        else:
+            callback(pos, data)
+    
+    def stop(self):
+        """Request the polling thread to stop.
+        
+        The thread is woken up immediately if it is waiting for data.
+        """
+        with self.running_lock:
+            self.running = False
+        self._wakeup.wake()
+    
+    def pos(self, name):
+        """Return the current position of the stream added with *name*.
+        """
+        with self.lock:
+            return self._pos.get(name)
+
+
 class ThreadPollOutput(ThreadPollInput):
     """    
     Thread that monitors an OutputStream in the background and emits a Qt signal
@@ -124,24 +353,67 @@ class ThreadPollOutput(ThreadPollInput):
 
 
 class ThreadStreamConverter(ThreadPollInput):
-    """Thread that polls for data on an input stream and converts the transfer
-    mode or time axis of the data before relaying it through its output.
+    """Thread that polls for data on an input stream, converts it with the
+    plan compiled by :class:`StreamConverter` and relays it through its output.
+    
+    The channel selection, scale, offset and dtype cast are done in a single
+    pass that writes into an output array laid out like the output buffer.
     """
-    def __init__(self, input_stream, output_stream, conversions,timeout=200, parent=None):
+    def __init__(self, input_stream, output_stream, plan, timeout=200, parent=None):
         ThreadPollInput.__init__(self, input_stream, timeout=timeout, return_data=True, parent=parent)
         self.output_stream = weakref.ref(output_stream)
-        self.conversions = conversions
+        self.plan = plan
         
-        self.output_dtype = make_dtype(self.output_stream().params['dtype'])
+        self.output_dtype = make_dtype(plan['dtype'])
+        input_dtype = make_dtype(input_stream.params['dtype'])
+        self.identity = (plan['channels'] is None and plan['scale'] is None and plan['offset'] is None
+                         and input_dtype == self.output_dtype)
+        # integer outputs are rounded and clipped, unless the values of the
+        # input can be copied as they are
+        self._round = (self.output_dtype.kind in 'iu' and not
+                       (plan['scale'] is None and plan['offset'] is None and
+                        np.can_cast(input_dtype, self.output_dtype, casting='safe')))
+        # 'F' order when the output buffer stores channels contiguously
+        self._order = plan['order']
+        # sharedmem outputs copy the data to their buffer before send() returns,
+        # so the same output array can be used for all chunks
+        self._reuse = output_stream.params['transfermode'] == 'sharedmem' and not output_stream._batching
+        self._out = None
         
     def process_data(self, pos, data):
-        #~ if 'transfermode' in self.conversions and self.conversions['transfermode'][0]=='sharedmem':
-            #~ data = self.input_stream().get_array_slice(self, pos, None)
-        #~ if 'timeaxis' in self.conversions:
-            #~ data = data.swapaxes(*self.conversions['timeaxis'])
-        if data.dtype!=self.output_dtype:
-            data = data.astype(self.output_dtype)
+        if not self.identity:
+            data = self._convert(data)
         self.output_stream().send(data, index=pos)
+    
+    def _convert(self, data):
+        channels, scale, offset = self.plan['channels'], self.plan['scale'], self.plan['offset']
+        src = data if channels is None else data[:, channels]
+        shape = src.shape
+        if self._reuse:
+            if self._out is None or self._out.shape[0] < shape[0]:
+                self._out = np.empty((max(shape[0], 1024),) + shape[1:], dtype=self.output_dtype, order=self._order)
+            out = self._out[:shape[0]]
+        else:
+            out = np.empty(shape, dtype=self.output_dtype, order=self._order)
+        
+        if self._round:
+            # compute in float, then round to the nearest integer in range
+            tmp = np.multiply(src, scale, dtype='float64') if scale is not None else src.astype('float64')
+            if offset is not None:
+                np.add(tmp, offset, out=tmp)
+            np.rint(tmp, out=tmp)
+            info = np.iinfo(self.output_dtype)
+            np.clip(tmp, info.min, info.max, out=tmp)
+            np.copyto(out, tmp, casting='unsafe')
+            return out
+        
+        if scale is not None:
+            np.multiply(src, scale, out=out, casting='unsafe')
+        else:
+            np.copyto(out, src, casting='unsafe')
+        if offset is not None:
+            np.add(out, offset, out=out, casting='unsafe')
+        return out
 
 
 class StreamConverter(Node):
@@ -153,12 +425,20 @@ class StreamConverter(Node):
     * convert transfer mode 'plaindata' to 'sharedarray'. (to get a local long buffer)
     * convert dtype 'int32' to 'float64'
     * change timeaxis 0 to 1 (in fact a transpose)
+    * select a subset of channels and apply a scale and offset
     * ...
     
+    The dtype, transfermode and axisorder conversions are given by the
+    parameters of the output stream; channel selection, scale and offset are
+    given to :func:`configure`. All conversions are compiled in
+    :func:`initialize` into a single plan (see ``StreamConverter.plan``) that
+    is applied to each chunk in one pass, so a single converter should be
+    used instead of a chain of converters.
+    
     Usage::
     
         conv = StreamConverter()
-        conv.configure()
+        conv.configure(channels=[0, 1, 2, 3], scale=0.195)
         conv.input.connect(someinput)
         conv.output.configure(someotherspec)
         conv.initialize()
@@ -172,24 +452,40 @@ class StreamConverter(Node):
     def __init__(self, **kargs):
         Node.__init__(self, **kargs)
     
-    def _configure(self, **kargs):
-        pass
+    def _configure(self, channels=None, scale=None, offset=None):
+        """
+        Params
+        -----------
+        channels: list or None
+            The input channels sent to the output (default is all channels).
+        scale: float or array or None
+            Data is multiplied by *scale* (may be given per output channel).
+        offset: float or array or None
+            *offset* is added to the data after scaling.
+        """
+        self.channels = channels
+        self.scale = scale
+        self.offset = offset
     
     def _initialize(self):
-        self.conversions = {}
-        # check convertion
-        for k in self.input.params:
-            if k in ('port', 'protocol', 'interface', 'dtype'):
-                continue  # the OutputStream/InputStream already do it
-            
-            old, new = self.input.params.get(k, None), self.output.params.get(k, None)
-            if old != new and old is not None:
-                self.conversions[k] = (old, new)
-                
-        # DO some check ???
-        # if 'shape' in self.conversions:
-        #    assert 'timeaxis' in self.conversions        
-        self.thread = ThreadStreamConverter(self.input, self.output, self.conversions)
+        channels = self.channels
+        if channels is not None:
+            assert self.output.params['shape'][1] == len(channels), \
+                'output shape {} does not match the {} selected channels'.format(self.output.params['shape'], len(channels))
+            channels = np.asarray(channels, dtype='int64')
+            if len(channels) > 0 and np.all(np.diff(channels) == 1):
+                # contiguous channels are selected without copy
+                channels = slice(int(channels[0]), int(channels[-1]) + 1)
+        
+        axisorder = self.output.params['axisorder']
+        self.plan = dict(
+            dtype=make_dtype(self.output.params['dtype']),
+            channels=channels,
+            scale=None if self.scale is None else np.asarray(self.scale),
+            offset=None if self.offset is None else np.asarray(self.offset),
+            order='F' if axisorder is not None and tuple(axisorder) == (1, 0) else 'C',
+        )
+        self.thread = ThreadStreamConverter(self.input, self.output, self.plan)
     
     def _start(self):
         self.thread.start()
@@ -204,23 +500,20 @@ class StreamConverter(Node):
 register_node_type(StreamConverter)
 
 
-class ThreadSplitter(ThreadPollInput):
-    def __init__(self, input_stream, outputs_stream, output_channels, timeout=200, parent=None):
-        ThreadPollInput.__init__(self, input_stream, timeout=timeout, return_data=True, parent=parent)
-        self.outputs_stream = weakref.WeakValueDictionary()
-        self.outputs_stream.update(outputs_stream)
-        self.output_channels = output_channels
-    
-    def process_data(self, pos, data):
-        for k , chans in self.output_channels.items():
-            self.outputs_stream[k].send(data[:, chans], index=pos)
-
-
 class ChannelSplitter(Node):
     """
     ChannelSplitter take a multi-channel input signal stream and splits it
     into several sub streams.
     
+    With ``configure(zero_copy=True)`` and an input that uses
+    ``transfermode='sharedmem'``, outputs are 'sharedmem_view' streams: they
+    only publish the index of new chunks and their InputStreams read the
+    selected channels directly from the shared buffer of the input, so no
+    data is copied. Contiguous channel groups (for example the shanks of a
+    probe) are then read as views; use ``axisorder=[1, 0]`` on the input
+    stream to keep each channel contiguous in memory. These outputs can only
+    be read on the host of the input.
+    
     Usage::
     
         splitter = StreamSplitter()
@@ -238,7 +531,7 @@ class ChannelSplitter(Node):
     def __init__(self, **kargs):
         Node.__init__(self, **kargs)
     
-    def _configure(self, output_channels = {}):
+    def _configure(self, output_channels = {}, zero_copy=False):
         """
         Params
         -----------
@@ -247,12 +540,19 @@ class ChannelSplitter(Node):
             Each key will be the name of each output.
         output_timeaxis: int or 'same'
             The output timeaxis is set here.
+        zero_copy: bool
+            If True, outputs are 'sharedmem_view' streams on the buffer of
+            the input, which must be a 'sharedmem' stream (default False).
         """
         self.output_channels = output_channels
+        self.zero_copy = zero_copy
     
     def after_input_connect(self, inputname):
         
         nb_channel =  self.input.params['shape'][1]
+        if self.zero_copy:
+            assert self.input.params['transfermode'] == 'sharedmem', \
+                'zero_copy requires a sharedmem input, not {}'.format(self.input.params['transfermode'])
         self.outputs = OrderedDict()
         for k, chans in self.output_channels.items():
             assert min(chans)>=0 and max(chans)<nb_channel, 'output_channels do not match channel count {}'.format(nb_channel)
@@ -262,11 +562,31 @@ class ChannelSplitter(Node):
             stream_spec['port'] = '*'
             stream_spec['nb_channel'] = len(chans)
             stream_spec['shape'] = (-1, len(chans))
+            if self.zero_copy:
+                stream_spec['transfermode'] = 'sharedmem_view'
+                for p in ('shm_id', 'buffer_size', 'double', 'axisorder'):
+                    stream_spec[p] = self.input.params[p]
+                stream_spec['source_shape'] = tuple(self.input.params['shape'])
+                stream_spec['channels'] = [int(c) for c in chans]
             output = OutputStream(spec=stream_spec)
             self.outputs[k] = output
     
     def _initialize(self):
-        self.thread = ThreadSplitter(self.input, self.outputs, self.output_channels)
+        self.thread = MultiPoller()
+        # with zero_copy, data is not read from the shared buffer
+        self.thread.add_input(self.input, callback=self._split, return_data=not self.zero_copy)
+    
+    def _split(self, pos, data):
+        if self.zero_copy:
+            # only the index and length are sent; receivers read the shared
+            # buffer (the chunk given to send() is an empty placeholder)
+            size = self.input.receiver.chunk_size
+            for k , chans in self.output_channels.items():
+                placeholder = np.broadcast_to(np.zeros((), dtype=self.input.params['dtype']), (size, len(chans)))
+                self.outputs[k].send(placeholder, index=pos)
+            return
+        for k , chans in self.output_channels.items():
+            self.outputs[k].send(data[:, chans], index=pos)
     
     def _start(self):
         self.thread.start()
@@ -283,30 +603,85 @@ register_node_type(ChannelSplitter)
 
 
 class ThreadChunkResizer(ThreadPollInput):
-    def __init__(self, input_stream, output_stream, chunksize, timeout=200, parent=None):
+    """Thread that cuts the chunks of an input stream into chunks of
+    *chunksize* samples starting every *step* samples.
+    
+    Incoming samples are written to a double RingBuffer so that each output
+    chunk is a contiguous view on the buffer (no concatenation).
+    
+    Without *step*, output chunks are sent with the index of their last
+    sample + 1 in the input stream. With a *step*, output chunks overlap (or
+    skip samples), so their indexes cannot be those of the input stream:
+    output indexes then advance by *chunksize* for each chunk, and the chunk
+    sent with *index* starts at input sample ``(index // chunksize - 1) * step``
+    (see :func:`window_start`).
+    """
+    def __init__(self, input_stream, output_stream, chunksize, step=None, timeout=200, parent=None):
         ThreadPollInput.__init__(self, input_stream, timeout=timeout, return_data=True, parent=parent)
         self.output_stream = weakref.ref(output_stream)
         self.chunksize = chunksize
-        self.stack = []
+        self.step = chunksize if step is None else step
+        
+        # Input chunks are written in pieces of at most piece_size samples and
+        # output chunks are sent after each piece, so the buffer only has to
+        # hold the pending samples (less than chunksize) plus one piece.
+        self.piece_size = 4 * max(self.chunksize, self.step)
+        params = input_stream.params
+        self.buffer = RingBuffer(shape=(self.chunksize + self.piece_size,) + tuple(params['shape'][1:]),
+                                 dtype=params['dtype'], double=True)
+        # start of the next output chunk and end of the last input chunk
+        self.next_start = None
+        self.last_pos = None
+    
+    def window_start(self, index):
+        """Return the index in the input stream of the first sample of the
+        output chunk sent with *index*.
+        """
+        if self.step == self.chunksize:
+            return index - self.chunksize
+        return (index // self.chunksize - 1) * self.step
+    
+    def _align(self, start):
+        # with a step, windows start on multiples of step so that their
+        # position in the input stream follows from their output index
+        if self.step == self.chunksize:
+            return start
+        return -(-start // self.step) * self.step
     
     def process_data(self, pos, data):
-        if (data.shape[0] == self.chunksize) and (len(self.stack)==0):
-            self.output_stream().send(data)
-            return
+        start = pos - data.shape[0]
+        if self.next_start is None:
+            self.next_start = self._align(start)
+        elif start > self.last_pos and self.next_start < start:
+            # samples were lost: drop the pending samples
+            self.next_start = self._align(start)
+        self.last_pos = pos
         
-        self.stack.append(data)
+        if self.step == self.chunksize and data.shape[0] == self.chunksize and start == self.next_start:
+            # nothing pending: send the chunk as is
+            self.output_stream().send(data, index=pos)
+            self.next_start = pos
+            return
         
-        cumsizes = np.cumsum([d.shape[0] for d in self.stack])
-        while (len(cumsizes)>0) and (cumsizes[-1]>=self.chunksize):
-            until = np.searchsorted(cumsizes, self.chunksize) + 1
-            data_conc = np.concatenate(self.stack[:until])
-            self.output_stream().send(data_conc[:self.chunksize])
-            _stack = []
-            if data_conc.shape[0]>self.chunksize:
-                self.stack = [data_conc[self.chunksize:]] + self.stack[until:]
+        for i in range(0, data.shape[0], self.piece_size):
+            piece = data[i:i + self.piece_size]
+            self.buffer.new_chunk(piece, index=start + i + piece.shape[0])
+            self._send_chunks()
+    
+    def _send_chunks(self):
+        index = self.buffer.index()
+        # views are overwritten by next pieces: only sharedmem outputs copy
+        # them before send() returns
+        output = self.output_stream()
+        copy = output.params['transfermode'] != 'sharedmem' or output._batching
+        while self.next_start + self.chunksize <= index:
+            stop = self.next_start + self.chunksize
+            if self.step == self.chunksize:
+                out_index = stop
             else:
-                self.stack = self.stack[until:]
-            cumsizes = np.cumsum([d.shape[0] for d in self.stack])
+                out_index = (self.next_start // self.step + 1) * self.chunksize
+            output.send(self.buffer.get_data(self.next_start, stop, copy=copy), index=out_index)
+            self.next_start += self.step
 
 
 class ChunkResizer(Node):
@@ -315,10 +690,18 @@ class ChunkResizer(Node):
     that ouput is the same constant chunksize packet.
     So it split too long buffer and wait for next buffer when it is too small.
     
+    With *step* smaller than *chunksize*, consecutive output chunks overlap
+    (for instance to feed FFT-based nodes with sliding windows); with *step*
+    larger than *chunksize*, samples are skipped between chunks. Indexes of
+    a stream must advance by the size of each chunk, so output indexes then
+    advance by *chunksize* and do not match the input stream: use
+    :func:`window_start` to find where each output chunk starts in the
+    input stream. Without *step*, output indexes are those of the input.
+    
     Usage::
     
         chunkresizer = ChunkResizer()
-        chunkresizer.configure(chunksize)
+        chunkresizer.configure(chunksize=1024, step=256)
         chunkresizer.input.connect(someinput)
         chunkresizer.output.configure(...)
         chunkresizer.initialize()
@@ -331,14 +714,18 @@ class ChunkResizer(Node):
     def __init__(self, **kargs):
         Node.__init__(self, **kargs)
     
-    def _configure(self, chunksize=100):
+    def _configure(self, chunksize=100, step=None):
         """
         Params
         -----------
         chunksize: int
             output desired chunksize
+        step: int or None
+            number of samples between the starts of two output chunks
+            (default is chunksize: no overlap)
         """
         self.chunksize = chunksize
+        self.step = step
 
     def after_input_connect(self, inputname):
         
@@ -349,7 +736,15 @@ class ChunkResizer(Node):
         #~ 'shape',
     
     def _initialize(self):
-        self.thread = ThreadChunkResizer(self.input, self.output, self.chunksize)
+        self.thread = ThreadChunkResizer(self.input, self.output, self.chunksize, step=self.step)
+    
+    def window_start(self, index):
+        """Return the index in the input stream of the first sample of the
+        output chunk sent with *index*.
+        
+        Windows start on multiples of *step* in the input stream.
+        """
+        return self.thread.window_start(index)
     
     def _start(self):
         self.thread.start()
@@ -87,7 +87,7 @@ class BrainAmpThread(QtCore.QThread):
                     markers['type'][m], markers['description'][m] = rawdata[index+16:index+markersize].tostring().split('\x00')[:2]
                     index = index + markersize
                 head_marker += nb_marker
-                self.outputs['triggers'].send(markers, index=nb_marker)
+                self.outputs['triggers'].send(markers, index=head_marker)
 
         brainamp_socket.close()
 
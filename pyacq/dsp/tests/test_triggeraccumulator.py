@@ -34,6 +34,11 @@ buffer = buffer.astype('float32')
 
 
 def test_TriggerAccumulator():
+    for events_transfermode in ('plaindata', 'sharedmem_events'):
+        check_TriggerAccumulator(events_transfermode)
+
+
+def check_TriggerAccumulator(events_transfermode):
     app = pg.mkQApp()
     
     dev = NumpyDeviceBuffer()
@@ -44,7 +49,7 @@ def test_TriggerAccumulator():
     trigger = AnalogTrigger()
     trigger.configure()
     trigger.input.connect(dev.output)
-    trigger.output.configure(protocol='tcp', interface='127.0.0.1', transfermode='plaindata')
+    trigger.output.configure(protocol='tcp', interface='127.0.0.1', transfermode=events_transfermode, buffer_size=100)
     trigger.initialize()
     trigger.params['threshold'] = 1.
     trigger.params['debounce_mode'] = 'no-debounce'
@@ -86,6 +91,12 @@ def test_TriggerAccumulator():
     
     app.exec_()
     assert triggeraccumulator.total_trig==6
+    
+    # past events can be queried
+    events = triggeraccumulator.get_events(0, 4)
+    assert np.all(events == [1001, 2001, 3001, 3015])
+    
+    trigger.close()
 
 
 if __name__ == '__main__':
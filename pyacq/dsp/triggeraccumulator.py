@@ -7,17 +7,21 @@ import pyqtgraph as pg
 import numpy as np
 from pyqtgraph.util.mutex import Mutex
 
-from ..core import (Node, register_node_type, ThreadPollInput)
+from ..core import (Node, register_node_type, MultiPoller)
+from ..core.stream.recordbuffer import RecordRingBuffer
 
 
 
-class ThreadPollInputUntilPosLimit(ThreadPollInput):
+class PosLimitChecker(QtCore.QObject):
     """
-    Thread waiting a futur pos in a stream.
+    Wait for futur positions in a stream.
+    
+    process_data() is used as a MultiPoller callback and limit_reached is emitted
+    when the stream position passes each limit.
     """
     limit_reached = QtCore.pyqtSignal(int)
-    def __init__(self,input_stream,  **kargs):
-        ThreadPollInput.__init__(self, input_stream, **kargs)
+    def __init__(self, parent=None):
+        QtCore.QObject.__init__(self, parent)
         
         self.limit_lock = Mutex()
         self.limit_indexes = []
@@ -64,6 +68,9 @@ class TriggerAccumulator(Node,  QtCore.QObject):
     On each new chunk this new_chunk is emmited.
     Note that this do not occurs on new trigger but a bit after when the right_sweep is reached on signals stream.
     
+    Past events can be queried with get_events(). When the 'events' input uses
+    transfermode='sharedmem_events', they are read directly from the shared
+    buffer of the sender; otherwise the last events are kept in a local buffer.
     
     """
     _input_specs = {'signals' : dict(streamtype = 'signals'), 
@@ -85,7 +92,7 @@ class TriggerAccumulator(Node,  QtCore.QObject):
         self.params = pg.parametertree.Parameter.create( name='Accumulator options',
                                                     type='group', children =self._default_params)
     
-    def _configure(self, max_stack_size = 10, max_xsize=2., events_dtype_field = None):
+    def _configure(self, max_stack_size = 10, max_xsize=2., events_dtype_field = None, events_history=1000):
         """
         Arguments
         ---------------
@@ -97,6 +104,9 @@ class TriggerAccumulator(Node,  QtCore.QObject):
             Standart dtype for 'events' input is 'int64',
             In case of complex dtype (ex : dtype = [('index', 'int64'), ('label', 'S12), ) ] you can precise which
             filed is the index.
+        events_history: int
+            number of past events kept for get_events() when the 'events' input does not use
+            transfermode='sharedmem_events'.
             
         
         """
@@ -105,6 +115,7 @@ class TriggerAccumulator(Node,  QtCore.QObject):
         self.events_dtype_field = events_dtype_field
         self.params.param('stack_size').setLimits([1, self.max_stack_size])
         self.max_xsize = max_xsize
+        self.events_history = events_history
     
     def after_input_connect(self, inputname):
         if inputname == 'signals':
@@ -121,24 +132,34 @@ class TriggerAccumulator(Node,  QtCore.QObject):
         buf_size = int(self.inputs['signals'].params['sample_rate'] * self.max_xsize)
         self.inputs['signals'].set_buffer(size=buf_size, axisorder=[1,0], double=True)
         
-        self.trig_poller  = ThreadPollInput(self.inputs['events'], return_data=True)
-        self.trig_poller.new_data.connect(self.on_new_trig)
+        events = self.inputs['events']
+        if isinstance(events.receiver.buffer, RecordRingBuffer):
+            self.events_buffer = events.receiver.buffer
+            self._own_events_buffer = False
+        else:
+            self.events_buffer = RecordRingBuffer(shape=(self.events_history, ) + tuple(events.params['shape'][1:]),
+                                                dtype=events.params['dtype'])
+            self._own_events_buffer = True
         
-        self.limit_poller = ThreadPollInputUntilPosLimit(self.inputs['signals'])
+        # one thread polls both inputs: events are handled in the main thread
+        # (new_data signal) and signal positions are checked in the thread
+        self.poller = MultiPoller()
+        self.poller.add_input(self.inputs['events'], return_data=True, name='events')
+        self.poller.new_data.connect(self.on_new_data)
+        
+        self.limit_poller = PosLimitChecker()
         self.limit_poller.limit_reached.connect(self.on_limit_reached)
+        self.poller.add_input(self.inputs['signals'], callback=self.limit_poller.process_data, name='signals')
         
         self.wait_thread_list = []
         self.recreate_stack()
         
     def _start(self):
-        self.trig_poller.start()
-        self.limit_poller.start()
+        self.poller.start()
 
     def _stop(self):
-        self.trig_poller.stop()
-        self.trig_poller.wait()
-        self.limit_poller.stop()
-        self.limit_poller.wait()
+        self.poller.stop()
+        self.poller.wait()
         
         for thread in self.wait_thread_list:
             thread.stop()
@@ -153,7 +174,13 @@ class TriggerAccumulator(Node,  QtCore.QObject):
         self.params.param('left_sweep').setLimits([-np.inf, self.params['right_sweep']])
         
 
+    def on_new_data(self, name, pos, data):
+        if name == 'events':
+            self.on_new_trig(pos, data)
+    
     def on_new_trig(self, trig_num, trig_indexes):
+        if self._own_events_buffer:
+            self.events_buffer.new_chunk(trig_indexes, index=trig_num)
         for trig_index in trig_indexes:
             if self.events_dtype_field is None:
                 self.limit_poller.append_limit(trig_index+self.limit2)
@@ -171,6 +198,16 @@ class TriggerAccumulator(Node,  QtCore.QObject):
             
             self.new_chunk.emit(self.total_trig)
 
+    def get_events(self, start, stop):
+        """
+        Return the events with index between start and stop (the index of an event
+        is its position in the 'events' stream since the beginning).
+        
+        Only the last events are available (see events_history), an IndexError is
+        raised for older events.
+        """
+        return self.events_buffer.get_data(start, stop, copy=True)
+    
     def recreate_stack(self):
         self.limit1 = l1 = int(self.params['left_sweep']*self.sample_rate)
         self.limit2 = l2 = int(self.params['right_sweep']*self.sample_rate)
@@ -7,8 +7,9 @@ import collections
 import logging
 import os
 import json
+import functools
 
-from ..core import Node, register_node_type, ThreadPollInput, InputStream
+from ..core import Node, register_node_type, MultiPoller, InputStream
 from pyqtgraph.Qt import QtCore, QtGui
 from pyqtgraph.util.mutex import Mutex
 
@@ -19,8 +20,8 @@ class RawRecorder(Node):
     """
     Simple recorder Node of multiple streams in raw data format.
     
-    Implementation is simple, this launch one thread by stream.
-    Each one pull data and write it directly into a file in binary format.
+    Implementation is simple: a single thread polls all streams and
+    writes data directly into one file per stream in binary format.
     
     Usage:
     list_of_stream_to_record = [...]
@@ -53,7 +54,8 @@ class RawRecorder(Node):
     def _initialize(self):
         os.mkdir(self.dirname)
         self.files = []
-        self.threads = []
+        self.thread = MultiPoller()
+        self._start_indexes = {}
         
         self.mutex = Mutex()
         
@@ -64,9 +66,8 @@ class RawRecorder(Node):
             fid = open(filename, mode='wb')
             self.files.append(fid)
             
-            thread = ThreadRec(name, input, fid)
-            self.threads.append(thread)
-            thread.recv_start_index.connect(self.on_start_index)
+            self.thread.add_input(input, callback=functools.partial(self._write_data, name, fid),
+                                  return_data=True, name=name)
             
             prop = {}
             for k in ('streamtype', 'dtype', 'shape', 'sample_rate', 'channel_info'):
@@ -76,18 +77,17 @@ class RawRecorder(Node):
         
         self._stream_properties['pyacq_version'] = pyacq_version
         
-        self._flush_stream_properties()
+        with self.mutex:
+            self._flush_stream_properties()
         
         self._annotations = {}
     
     def _start(self):
-        for thread in self.threads:
-            thread.start()
+        self.thread.start()
 
     def _stop(self):
-        for thread in self.threads:
-            thread.stop()
-            thread.wait()
+        self.thread.stop()
+        self.thread.wait()
         
         #test in any pending data in streams
         for i, (name, input) in enumerate(self.inputs.items()):
@@ -102,19 +102,29 @@ class RawRecorder(Node):
     def _close(self):
         pass
     
+    def _write_data(self, name, fid, pos, data):
+        # called from the polling thread; the stream properties and
+        # annotations are shared with the methods called by RPC and
+        # protected by self.mutex
+        if name not in self._start_indexes:
+            self._start_indexes[name] = int(pos - data.shape[0])
+            self.on_start_index(name, self._start_indexes[name])
+        fid.write(data.tobytes())
+    
     def on_start_index(self, name, start_index):
-        self._stream_properties[name]['start_index'] = start_index
-        self._flush_stream_properties()
+        with self.mutex:
+            self._stream_properties[name]['start_index'] = start_index
+            self._flush_stream_properties()
     
     def _flush_stream_properties(self):
+        # must be called with self.mutex locked
         filename = os.path.join(self.dirname, 'stream_properties.json')
-        with self.mutex:
-            _flush_dict(filename, self._stream_properties)
+        _flush_dict(filename, self._stream_properties)
     
     def add_annotations(self, **kargs):
-        self._annotations.update(kargs)
         filename = os.path.join(self.dirname, 'annotations.json')
         with self.mutex:
+            self._annotations.update(kargs)
             _flush_dict(filename, self._annotations)
     
 
@@ -124,22 +134,4 @@ def _flush_dict(filename, d):
                             indent=4, separators=(',', ': '), ensure_ascii=False))
 
 
-
-class ThreadRec(ThreadPollInput):
-    recv_start_index = QtCore.Signal(str, int)
-    def __init__(self, name, input_stream,fid, timeout = 200, parent = None):
-        ThreadPollInput.__init__(self, input_stream, timeout=timeout, return_data=True, parent=parent)
-        self.name = name
-        self.fid = fid
-        self._start_index = None
-        
-    def process_data(self, pos, data):
-        if self._start_index is None:
-            self._start_index = int(pos - data.shape[0])
-            self.recv_start_index.emit(self.name, self._start_index)
-        
-        #~ print(self.input_stream().name, 'pos', pos, 'data.shape', data.shape)
-        self.fid.write(data.tobytes())
-    
-        
 register_node_type(RawRecorder)
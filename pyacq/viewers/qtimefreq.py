@@ -183,6 +183,9 @@ class QTimeFreq(WidgetNode):
             else:
                 ng = self.nodegroup_friends[i%max(len(self.nodegroup_friends)-1, 1)]
                 worker = ng.create_node('TimeFreqWorker')
+                # output params are read twice once the worker is initialized;
+                # the node invalidates them when its output is reconfigured
+                worker._set_proxy_options(cache_attrs=True)
                 worker.ng_proxy = ng
             worker.configure(channel=i, local=self.local_workers)
             worker.input.connect(self.conv.output)